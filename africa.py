@@ -22,6 +22,8 @@ import serial.tools.list_ports
 import cv2
 import requests
 
+from console_monitor import RuleEngine, RuleError
+
 #######################################################
 #User Setting
 #######################################################
@@ -69,6 +71,10 @@ ADB_SS_ENABLE = 0
 # "動作なし= 0" or "#SAILの特定ログが検出されない状態で、'PMT:ASEE T.O'を検知した場合はテストを停止"=1
 ASEE_TO_TESTSTOP = 0
 
+# 監視ルールファイル(コンソール/検知ログ/条件/処理)
+# ファイルが無い場合は既定のルールで生成する。試験中に編集した内容は数秒以内に反映される
+MONITOR_RULES_FILE = 'monitor_rules.json'
+
 # "動作なし= 0" or "Androidコンソール上のlogcat有効 = 1"
 ANDROID_LOGCAT_ENABLE = 0
 
@@ -208,6 +214,67 @@ ucom_failsafe_list = [
     ]
     
     
+#監視対象のコンソール
+MONITOR_CONSOLES = ['ucom', 'qnx', 'android', 'sail']
+
+#既定の監視ルール(MONITOR_RULES_FILEが無い場合にこの内容で生成する)
+#  console:コンソール, pattern:検知ログ, require/exclude:同じ行に含まれる(含まれない)ログ, when:条件,
+#  group:同じgroupのルールは先に一致した1つだけ実行(if/elif),
+#  stop:検知ログが一致した時点でgroupの判定を終える(require/whenを満たさない場合も後のルールは判定しない), actions:処理
+#  処理 log:テストログへ出力(引数は見出し), set:変数設定, print:コンソール表示, record:何もしない(miffy.pyのサイクルの記録用),
+#       asee_teststop/dump_end/ramdump:試験状態の変更
+DEFAULT_MONITOR_RULES = [
+        {'name': 'meter_fin_end',  'console': 'ucom', 'pattern': 'PMT:Meter Fin End', 'group': 'ucom_sleep',
+         'actions': [['set', 'sleep_chk_flg', 1]]},
+        {'name': 'asee_timeout',   'console': 'ucom', 'pattern': 'PMT:ASEE T.O.',     'group': 'ucom_sleep',
+         'actions': [['set', 'sleep_chk_flg', 10]]},
+        {'name': 'asee_high',      'console': 'ucom', 'pattern': 'PMT:ASEE High',     'group': 'ucom_sleep',
+         'actions': [['set', 'sleep_chk_flg', 0]]},
+    ] + [
+        {'name': f'failsafe_{i}', 'console': 'ucom', 'pattern': failsafe[1], 'group': 'failsafe',
+         'actions': [['log', failsafe[0]]]}
+        for i, failsafe in enumerate(ucom_failsafe_list)
+    ] + [
+        {'name': 'str_result_11',  'console': 'qnx', 'pattern': 'devctl(STR) result: 11',  'group': 'qnx_error', 'actions': [['log']]},
+        {'name': 'str_result_16',  'console': 'qnx', 'pattern': 'devctl(STR) result: 16',  'group': 'qnx_error', 'actions': [['log']]},
+        {'name': 'str_result_120', 'console': 'qnx', 'pattern': 'devctl(STR) result: 120', 'group': 'qnx_error', 'actions': [['log']]},
+        {'name': 'str_result_neg', 'console': 'qnx', 'pattern': 'devctl(STR) result: -',   'group': 'qnx_error', 'actions': [['log']]},
+        {'name': 'str_retry_cnt',  'console': 'qnx', 'pattern': 'devctl(STR): retry_cnt:', 'group': 'qnx_error', 'actions': [['log']]},
+        {'name': 'str_ctrl_retry', 'console': 'qnx', 'pattern': 'str_ctrl_retry',          'group': 'qnx_error', 'actions': [['log']]},
+        {'name': 'core_dump',      'console': 'qnx', 'pattern': 'dumping to /var/log/', 'require': ['.core'],
+         'group': 'qnx_error', 'stop': True, 'actions': [['log']]},
+        {'name': 'dump_format',    'console': 'qnx', 'pattern': 'Format: Log Type - Time(microsec)', 'when': ['not_init'],
+         'group': 'qnx_error', 'stop': True, 'actions': [['log'], ['dump_end']]},
+        {'name': 'ramdump_loaded', 'console': 'qnx', 'pattern': 'RamDump -  Image Loaded, Delta', 'when': ['not_init'],
+         'group': 'qnx_error', 'stop': True, 'actions': [['ramdump']]},
+        {'name': 'abnormal_reset', 'console': 'android', 'pattern': 'abnormal_reset',     'group': 'android_error', 'actions': [['log']]},
+        {'name': 'power_down',     'console': 'android', 'pattern': 'reboot: Power down', 'group': 'android_error', 'actions': [['log']]},
+        {'name': 'sail_interrupt1', 'console': 'android', 'pattern': 'Interrupt disabled successfully',
+         'require': ['prvXBLDeInit_Sleep xSleepDriverAck Success'], 'group': 'android_error',
+         'actions': [['print']]},
+        {'name': 'sail_interrupt2', 'console': 'android', 'pattern': 'Interrupt disabled successfully',
+         'require': ['Ack to MD : 0xAA030000'], 'group': 'android_error',
+         'actions': [['print']]},
+    ]
+
+#既定の相関ルール(複数コンソールのログの前後関係/時間窓による判定。MONITOR_RULES_FILEのcorrelationsに書く)
+#  kind sequence:stepsが順に出力され最後がwithin秒以内 / absence:steps[0]の後within秒以内にsteps[1]が出ない
+#       missing:steps[-1]の出力時にそれ以前のstepsが出ていない(withinを省略した場合はreset_onの時点から)
+#  reset_on:状態をクリアするタイミング(acc_off:ACC OFF時)
+DEFAULT_MONITOR_CORRELATIONS = [
+        #SAILの特定ログが検出されない状態で、'PMT:ASEE T.O'を検知した場合はテストを停止(ASEE_TO_TESTSTOP=1の場合)
+        {'name': 'asee_without_sail_interrupt', 'kind': 'missing', 'reset_on': ['acc_off'],
+         'steps': [{'console': 'android', 'pattern': 'Interrupt disabled successfully',
+                    'require': ['prvXBLDeInit_Sleep xSleepDriverAck Success']},
+                   {'console': 'android', 'pattern': 'Interrupt disabled successfully',
+                    'require': ['Ack to MD : 0xAA030000']},
+                   {'console': 'ucom', 'pattern': 'PMT:ASEE T.O.'}],
+         'actions': [['asee_teststop']]},
+    ]
+
+#監視ルールのset処理で変更できる変数
+RULE_VARIABLES = ['sleep_chk_flg']
+
 suspend_select_trigger = 9
 suspend_trigger_list = [
     
@@ -251,8 +318,7 @@ suspend_time = ACC_OFFON_TIME
 resume_time = ACC_OFFON_TIME
 sleep_chk_flg = 0
 
-sail_Interrupt_check1 = 0
-sail_Interrupt_check2 = 0
+rule_engine = None
 
 log_max_count = TESTLOG_MAX_COUNT
 test_stop_flag = False
@@ -532,6 +598,8 @@ def main():
     masterwin.after(800, sail_cyclechcek)
     masterwin.after(900, android_cyclechcek)
     
+    rule_engine_start()
+
     # スレッドの作成
     thread_ucom = threading.Thread(target=ucom_serial_communication, daemon=True)
     thread_qnx = threading.Thread(target=qnx_serial_communication, daemon=True)
@@ -1288,7 +1356,7 @@ def ucom_serial_communication():
                         ucom_console_list.pop(0)
                     lock1.release()
                     timestamp = timestamp_get()
-                    ucom_error_monitor(ucom_readdata,timestamp)
+                    console_error_monitor('ucom', ucom_readdata, timestamp)
                     with open(logfpath + '/ucom_' + str(log_index) + '.log', 'a',encoding="utf-8") as ucom_f:
                         ucom_f.write(timestamp + ucom_readdata + "\n")
                     if suspend_trigger_list[suspend_select_trigger][0] == 'ucom':
@@ -1352,7 +1420,7 @@ def qnx_serial_communication():
                         qnx_console_list.pop(0)
                     lock2.release()
                     timestamp = timestamp_get()
-                    qnx_error_monitor(qnx_readdata,timestamp)
+                    console_error_monitor('qnx', qnx_readdata, timestamp)
                     with open(logfpath + '/qnx_' + str(log_index) + '.log', 'a',encoding="utf-8") as qnx_f:
                         qnx_f.write(timestamp + qnx_readdata + "\n")
                     if suspend_trigger_list[suspend_select_trigger][0] == 'qnx':
@@ -1414,7 +1482,7 @@ def android_serial_communication():
                         android_console_list.pop(0)
                     lock3.release()
                     timestamp = timestamp_get()
-                    android_error_monitor(android_readdata,timestamp)
+                    console_error_monitor('android', android_readdata, timestamp)
                     with open(logfpath + '/android_' + str(log_index) + '.log', 'a',encoding="utf-8") as android_f:
                         android_f.write(timestamp + android_readdata + "\n")
             else:
@@ -1469,7 +1537,7 @@ def sail_serial_communication():
                         sail_console_list.pop(0)
                     lock4.release()
                     timestamp = timestamp_get()
-                    sail_error_monitor(sail_readdata,timestamp)
+                    console_error_monitor('sail', sail_readdata, timestamp)
                     with open(logfpath + '/sail_' + str(log_index) + '.log', 'a',encoding="utf-8") as sail_f:
                         sail_f.write(timestamp + sail_readdata + "\n")
             else:
@@ -1506,116 +1574,108 @@ def sail_serial_communication():
         ser_sail.close()
 
 
-def ucom_error_monitor(readdata, time):
-    global sleep_chk_flg
+#監視ルールの読み込み
+def rule_engine_start():
+    global rule_engine
+
+    rule_engine = RuleEngine(MONITOR_RULES_FILE,
+                             actions={'log': rule_log, 'set': rule_set, 'print': rule_print, 'record': rule_record,
+                                      'asee_teststop': rule_asee_teststop, 'dump_end': rule_dump_end, 'ramdump': rule_ramdump},
+                             conditions={'not_init': lambda: test_task != TASK_INIT},
+                             consoles=MONITOR_CONSOLES, on_error=rule_engine_error)
+    if not os.path.exists(MONITOR_RULES_FILE):
+        with open(MONITOR_RULES_FILE, 'w', encoding='utf-8') as rules_f:
+            json.dump({'rules': DEFAULT_MONITOR_RULES, 'correlations': DEFAULT_MONITOR_CORRELATIONS},
+                      rules_f, ensure_ascii=False, indent=1)
+    try:
+        rule_engine.load()
+    except (OSError, RuleError) as e:
+        #読み込めない場合は既定のルールで試験を行う
+        rule_engine_error(f'{e} (既定のルールで監視します)')
+        rule_engine.apply(DEFAULT_MONITOR_RULES, DEFAULT_MONITOR_CORRELATIONS)
+
+def rule_engine_error(message):
+    testlog_write(TESTLOG_WRITE, f'[tool]    :{timestamp_get()} 監視ルールエラー {message}')
+
+#受信ログの監視(監視ルールファイルの内容で判定する)
+def console_error_monitor(name, readdata, time):
+    if rule_engine.reload_if_changed():
+        testlog_write(TESTLOG_WRITE, f'[tool]    :{timestamp_get()} 監視ルールを再読み込みしました({MONITOR_RULES_FILE})')
+    rule_engine.expire()
+    hits = rule_engine.match(name, readdata)
+    if hits:
+        rule_engine.evaluate(name, readdata, hits, time)
+
+#検知ログのテストログ見出し(集計スクリプトが参照するため従来の書式のまま。見出し付き(フェールセーフ)は'[ucom]    :')
+RULE_LOG_PREFIX = {
+    'ucom'    : '[ucom]     :',
+    'qnx'     : '[qnx]     :',
+    'android' : '[android] :',
+    'sail'    : '[sail]    :',
+}
+RULE_LOG_LABEL_PREFIX = {
+    'ucom'    : '[ucom]    :',
+}
+
+#監視ルールの処理
+def rule_log(hit, label=None):
+    if label is None:
+        error_data = RULE_LOG_PREFIX[hit.console] + hit.timestamp + ' ' + hit.line
+    else:
+        prefix = RULE_LOG_LABEL_PREFIX.get(hit.console, RULE_LOG_PREFIX[hit.console])
+        error_data = f'{prefix}{hit.timestamp} {label} : {hit.line}'
+    testlog_write(TESTLOG_WRITE, error_data)
+
+def rule_set(hit, name, value):
+    if name not in RULE_VARIABLES:
+        raise ValueError(f'{name} は変更できません')
+    globals()[name] = value
+
+def rule_print(hit):
+    print(f'"{hit.line}"を検知')
+
+def rule_record(hit, key):
+    #サイクルの記録はmiffy.pyのみ(同じルールファイルを読み込めるように処理名だけ受け付ける)
+    pass
+
+#SAILの特定ログが検出されない状態で、'PMT:ASEE T.O'を検知した場合は停止(相関ルールから呼ばれる)
+def rule_asee_teststop(hit):
     global test_task
-    
-    ucom_error_flg = 0
-#    system_ucom_extract(readdata)
-#    fcp_extract(readdata)
-#    hwvari_extract(readdata)
-    
-    if 'PMT:Meter Fin End' in readdata:
-        sleep_chk_flg = 1
-    elif 'PMT:ASEE T.O.' in readdata:
-        sleep_chk_flg = 10
-        #SAILの特定ログが検出されない状態で、'PMT:ASEE T.O'を検知した場合は停止
-        if ASEE_TO_TESTSTOP == 1 and test_task == TASK_SUPEND_WAIT:
-            if sail_Interrupt_check1 == 0 or sail_Interrupt_check2 == 0:
-                print('"PMT:ASEE T.O"を検知')
-                test_task = TASK_STOP
-    elif 'PMT:ASEE High' in readdata:
-        sleep_chk_flg = 0
-
-    if ucom_error_flg == 1:
-        error_data = '[ucom]     :' + time + ' ' + readdata
-        testlog_write(TESTLOG_WRITE, error_data)
-
-    for i in range(len(ucom_failsafe_list)):
-        if ucom_failsafe_list[i][1] in readdata:
-            error_data =f'[ucom]    :{time} {ucom_failsafe_list[i][0]} : {readdata}'
-            testlog_write(TESTLOG_WRITE, error_data)
-            break
 
+    if ASEE_TO_TESTSTOP == 1 and test_task == TASK_SUPEND_WAIT:
+        print('"PMT:ASEE T.O"を検知')
+        test_task = TASK_STOP
+
+def rule_dump_end(hit):
+    global test_task
+    global test_task_copy
+
+    if DUMP_MODE == 2:
+        if test_task == TASK_RUMDUMP_WAIT:
+            #RAMdumpの終了判定(RAMDump終了後のリセットタイミング)
+            test_task = TASK_ERROR
+    else:
+        if test_task != TASK_ERROR:
+            test_task_copy = test_task
+            test_task = TASK_ERROR
 
-def qnx_error_monitor(readdata, time):
+def rule_ramdump(hit):
     global test_task
     global test_task_copy
     global ramdump_timeoutcnt
 
-    qnx_error_flg = 0
-    if 'devctl(STR) result: 11' in readdata:
-        qnx_error_flg = 1
-    elif 'devctl(STR) result: 16' in readdata:
-        qnx_error_flg = 1
-    elif 'devctl(STR) result: 120' in readdata:
-        qnx_error_flg = 1
-    elif 'devctl(STR) result: -' in readdata:
-        qnx_error_flg = 1
-    elif 'devctl(STR): retry_cnt:' in readdata:
-        qnx_error_flg = 1
-    elif 'str_ctrl_retry' in readdata:
-        qnx_error_flg = 1
-    elif 'dumping to /var/log/' in readdata:
-        if '.core' in readdata:
-            qnx_error_flg = 1
-    elif 'Format: Log Type - Time(microsec)' in readdata:
-        if test_task != TASK_INIT:
-            qnx_error_flg = 1
-            if DUMP_MODE == 2:
-                if test_task == TASK_RUMDUMP_WAIT:
-                    #RAMdumpの終了判定(RAMDump終了後のリセットタイミング)
-                    test_task = TASK_ERROR
+    if DUMP_MODE == 2:
+        if test_task != TASK_RUMDUMP_WAIT and test_task != TASK_ERROR:
+            if '(0 Bytes)' in hit.line:
+                #RamDumpデータなし
+                test_task_copy = test_task
+                test_task = TASK_ERROR
             else:
-                if test_task != TASK_ERROR:
-                    test_task_copy = test_task
-                    test_task = TASK_ERROR
-    elif 'RamDump -  Image Loaded, Delta' in readdata:
-        if test_task != TASK_INIT:
-            if DUMP_MODE == 2:
-                if test_task != TASK_RUMDUMP_WAIT and test_task != TASK_ERROR:
-                    if '(0 Bytes)' in readdata:
-                        #RamDumpデータなし
-                        test_task_copy = test_task
-                        test_task = TASK_ERROR
-                    else:
-                        #RAMdumpの開始判定
-                        qnx_error_flg = 1
-                        test_task_copy = test_task
-                        ramdump_timeoutcnt = 0
-                        test_task = TASK_RUMDUMP_WAIT
-    else:
-        qnx_error_flg = 0
-    if qnx_error_flg == 1:
-        error_data = '[qnx]     :' + time + ' ' + readdata
-        testlog_write(TESTLOG_WRITE, error_data)
-
-def android_error_monitor(readdata, time):
-    global sail_Interrupt_check1
-    global sail_Interrupt_check2
-    
-    android_error_flg = 0
-    if 'abnormal_reset' in readdata:
-        android_error_flg = 1
-    elif 'reboot: Power down' in readdata:
-        android_error_flg = 1
-    elif 'Interrupt disabled successfully' in readdata:
-        if 'prvXBLDeInit_Sleep xSleepDriverAck Success' in readdata:
-            sail_Interrupt_check1 = 1
-            print(f'"{readdata}"を検知')
-        elif 'Ack to MD : 0xAA030000' in readdata:
-            sail_Interrupt_check2 = 1
-            print(f'"{readdata}"を検知')
-    if android_error_flg == 1:
-        error_data = '[android] :' + time + ' ' + readdata
-        testlog_write(TESTLOG_WRITE, error_data)
-
-def sail_error_monitor(readdata, time):
-    sail_error_flg = 0
-#    sail_img_id_extract(readdata)
-    if sail_error_flg == 1:
-        error_data = '[sail]    :' + time + ' ' + readdata
-        testlog_write(TESTLOG_WRITE, error_data)
+                #RAMdumpの開始判定
+                rule_log(hit)
+                test_task_copy = test_task
+                ramdump_timeoutcnt = 0
+                test_task = TASK_RUMDUMP_WAIT
 
 def testlog_write(req, writedata):
     lock5.acquire()
@@ -1868,8 +1928,6 @@ def func_susres_test():
     global resume_select_trigger
     global resume_time
     global sleep_chk_flg
-    global sail_Interrupt_check1
-    global sail_Interrupt_check2
     global resume_after_trigger
     global tool_state
     global log_max_count
@@ -2015,8 +2073,7 @@ def func_susres_test():
         elif test_task == TASK_SUPEND:
             pika_stop(accoff_reason)
             suspend_wait_flag = 1
-            sail_Interrupt_check1 = 0
-            sail_Interrupt_check2 = 0
+            rule_engine.reset('acc_off')
             accoff_start_time = int(time.time())
             if TOOL_MODE == 0:
                 senddata = '/vendor/bin/candy-test-ivehicle set 557924608 0 int32Values 1 0 0 0'
@@ -16,6 +16,9 @@ from typing import Optional, Pattern, Dict, List
 import serial
 from serial import SerialException
 
+from console_io import Backoff, CaptureClock, LineSplitter, PortHealth
+from console_reactor import PortSupervisor
+
 # =============================================================================
 # Configuration (flexible defaults; override via TEST_CONFIG JSON at runtime)
 # =============================================================================
@@ -191,6 +194,9 @@ def BT_ONOFF(adb_path: str = "adb"):
 # =============================================================================
 # Serial Worker (reliable reader/writer with in-memory buffer)
 # =============================================================================
+# Log stamps are taken once per received chunk and formatted with a cached per-second prefix
+_capture_clock = CaptureClock("%m-%d %H:%M:%S", digits=0)
+
 class SerialWorker:
     """
     Threaded serial reader with logging + simple pattern wait support.
@@ -212,6 +218,14 @@ class SerialWorker:
 
         self._buffer = deque(maxlen=200000)
         self._buffer_lock = threading.Lock()
+        # CaptureClock.now() (perf_counter) of the last received chunk (for latency math)
+        self.last_rx: Optional[float] = None
+        # reopen schedule + uptime / lost-log windows of this port
+        self.backoff = Backoff(first=0.05, maximum=5.0)
+        self.health = PortHealth()
+        # adapter arrived (True) / removed (False), posted by the PortSupervisor and applied by the reader thread
+        self._port_events = deque()
+        self._wake = threading.Event()
 
     def _resolve_port_path(self, port_name: str) -> str:
         """Windows: COMx ; POSIX: /dev/<name> (if not already absolute)."""
@@ -222,22 +236,61 @@ class SerialWorker:
         return f"/dev/{port_name}"
 
     def start(self):
-        """Start the reader thread and open serial port."""
+        """Open the serial port and start the reader thread (which keeps retrying a missing port)."""
         print(f"[{self.name}] Opening serial: {self.port_path} @ {self.baudrate}")
-        try:
-            self.ser = serial.Serial(self.port_path, self.baudrate, timeout=READ_TIMEOUT_SEC)
-            print(f"[{self.name}] Serial opened: {self.port_path}")
-        except SerialException as e:
-            print(f"[{self.name}] ERROR opening {self.port_path}: {e}")
-            return
+        self._open()
 
         self._thread = threading.Thread(target=self._reader_loop, daemon=True)
         self._thread.start()
         print(f"[{self.name}] Reader thread started; logging to {self.log_filename}")
+
+    def _open(self) -> bool:
+        """One open attempt; on failure the next one is due after the backoff delay."""
+        try:
+            self.ser = serial.Serial(self.port_path, self.baudrate, timeout=READ_TIMEOUT_SEC)
+        except (SerialException, OSError) as e:
+            self.ser = None
+            if self.backoff.failures == 0:
+                print(f"[{self.name}] ERROR opening {self.port_path}: {e} (retrying)")
+            # cut short when the adapter shows up again
+            self._wake.wait(self.backoff.next())
+            self._wake.clear()
+            return False
+        self.backoff.reset()
+        lost = self.health.up(time.monotonic())
+        if lost is None:
+            print(f"[{self.name}] Serial opened: {self.port_path}")
+        else:
+            print(f"[{self.name}] Serial reopened: {self.port_path} (lost {lost:.2f}s of log)")
+        return True
+
+    def _drop_port(self):
+        """Close a port that stopped working; the reader loop reopens it."""
+        self.health.down(time.monotonic())
+        ser, self.ser = self.ser, None
+        try:
+            ser.close()
+        except Exception:
+            pass
     
+    def port_event(self, present: bool):
+        """PortSupervisor side: the adapter appeared in / vanished from the system."""
+        self._port_events.append(present)
+        self._wake.set()
+
+    def _apply_port_events(self):
+        while self._port_events:
+            if self._port_events.popleft():
+                # skip the pending backoff, the adapter is back
+                self.backoff.reset()
+            elif self.ser is not None:
+                print(f"[{self.name}] {self.port_path} removed; reopening")
+                self._drop_port()
+
     def stop(self):
         """Signal stop and close resources."""
         self._stop_event.set()
+        self._wake.set()
         if self._thread:
             self._thread.join(timeout=2.0)
         if self.ser and self.ser.is_open:
@@ -251,27 +304,43 @@ class SerialWorker:
         return self.ser
     
     def _reader_loop(self):
-        """Read lines from serial and append to log + buffer."""
+        """Read everything waiting on the port, split into lines, append to log + buffer."""
+        splitter = LineSplitter()
         try:
             with open(self.log_filename, "a", encoding="utf-8") as f:
                 while not self._stop_event.is_set():
+                    self._apply_port_events()
+                    if self.ser is None:
+                        if not self._open():
+                            continue
+                        splitter.flush()
                     try:
-                        line = self.ser.readline()
-                        if not line:
+                        # block (up to READ_TIMEOUT_SEC) for the first byte, then take the whole burst
+                        data = self.ser.read(max(1, self.ser.in_waiting))
+                        if not data:
                             continue
-                        decoded_line = (
-                            line.decode("utf-8", errors="replace")
-                            .replace("\r\n", "\n")
-                            .replace("\r", "\n")
-                            .rstrip("\n")
-                        )
-                        if decoded_line:
-                            ts = datetime.now().strftime("%m-%d %H:%M:%S")
-                            entry = f"[{ts}] {decoded_line}"
-                            f.write(entry + "\n")
+                        self.last_rx = _capture_clock.now()
+                        ts = _capture_clock.format(self.last_rx)
+                        entries = []
+                        decoded_lines = []
+                        for line in splitter.feed(data):
+                            decoded_line = (
+                                line.replace("\r\n", "\n")
+                                .replace("\r", "\n")
+                                .rstrip("\n")
+                            )
+                            if decoded_line:
+                                entries.append(f"[{ts}] {decoded_line}\n")
+                                decoded_lines.append(decoded_line)
+                        if entries:
+                            f.write("".join(entries))
                             f.flush()
                             with self._buffer_lock:
-                                self._buffer.append(decoded_line)
+                                self._buffer.extend(decoded_lines)
+                    except (SerialException, OSError) as e:
+                        # adapter dropped (USB hub power cycle): reopen with backoff
+                        print(f"[{self.name}] Read error: {e}; reopening")
+                        self._drop_port()
                     except Exception as e:
                         print(f"[{self.name}] Read error: {e}")
                         time.sleep(0.2)
@@ -605,6 +674,8 @@ class TestController:
         }
         self.workers: Dict[str, SerialWorker] = {}
         self.adb_path = adb_path
+        # reconnects an unplugged/replugged USB-serial adapter as soon as it is listed again
+        self.supervisor = PortSupervisor(self, port_of=lambda worker: worker.port_path)
 
         self.start_time: Optional[float] = None
         self.end_time: Optional[float] = None
@@ -620,11 +691,19 @@ class TestController:
             worker = SerialWorker(name=name, port_name=port, baudrate=DEFAULT_BAUD)
             worker.start()
             self.workers[name] = worker
+        self.supervisor.start()
 
     def stop_workers(self):
+        self.supervisor.stop()
         for w in self.workers.values():
             w.stop()
 
+    def consoles(self) -> List[SerialWorker]:
+        return list(self.workers.values())
+
+    def port_event(self, worker: SerialWorker, present: bool):
+        worker.port_event(present)
+
     def init_phase(self):
         qnx = self.workers.get("QNX")
         if qnx:
@@ -717,6 +796,11 @@ class TestController:
         summary_text += f"Cycles done: {self.cycles_completed}\n"
         summary_text += f"Faults     : {self.faults_detected}\n"
         summary_text += f"Stop reason: {self.stop_reason}\n"
+        now = time.monotonic()
+        for name, worker in self.workers.items():
+            h = worker.health.snapshot(now)
+            summary_text += (f"Port {name:<7}: up {h['up_seconds']:.0f}s, "
+                             f"lost {h['lost_windows']} window(s) / {h['lost_seconds']:.1f}s\n")
         summary_text += "========================\n"
 
         print(summary_text)
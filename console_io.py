@@ -0,0 +1,939 @@
+# -*- coding: utf-8 -*-
+"""
+Console log ingest helpers shared by the serial tools (no pyserial needed here).
+"""
+from __future__ import annotations
+
+import os
+import re
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# =============================================================================
+# Line splitting
+# =============================================================================
+class LineSplitter:
+    """
+    Incremental line splitter over one reusable bytearray.
+
+    feed() takes whatever bytes the port had waiting, returns every complete
+    line (without the trailing '\\n') and keeps the unfinished tail for the
+    next call. Each burst of complete lines is decoded in a single call with
+    `errors` (default 'replace'), so a bad byte no longer costs the line.
+    """
+
+    def __init__(self, encoding: str = "utf-8", errors: str = "replace", max_line: int = 64 * 1024):
+        self.encoding = encoding
+        self.errors = errors
+        self.max_line = max_line
+        self._buf = bytearray()
+
+    def feed(self, data: bytes) -> List[str]:
+        buf = self._buf
+        buf += data
+        end = buf.rfind(b"\n")
+        if end < 0:
+            # newline-free binary dumps must not grow the buffer forever
+            if len(buf) >= self.max_line:
+                return [self.flush()]
+            return []
+        text = buf[:end].decode(self.encoding, self.errors)
+        del buf[:end + 1]
+        return text.split("\n")
+
+    def flush(self) -> str:
+        """Return (and forget) the unfinished tail, e.g. when the port closes."""
+        text = self._buf.decode(self.encoding, self.errors)
+        self._buf.clear()
+        return text
+
+    def pending(self) -> int:
+        """Number of bytes waiting for their newline."""
+        return len(self._buf)
+
+
+# =============================================================================
+# Port health
+# =============================================================================
+class Backoff:
+    """
+    Reopen delays for a lost port: `first`, then doubling up to `maximum`.
+    reset() after a successful open; `failures` counts attempts since then.
+    """
+
+    def __init__(self, first: float = 0.05, maximum: float = 5.0, factor: float = 2.0):
+        self.first = first
+        self.maximum = maximum
+        self.factor = factor
+        self.failures = 0
+
+    def next(self) -> float:
+        delay = min(self.first * self.factor ** self.failures, self.maximum)
+        self.failures += 1
+        return delay
+
+    def reset(self):
+        self.failures = 0
+
+
+class PortHealth:
+    """
+    Uptime and lost-log bookkeeping for one port (CaptureClock.now() seconds).
+
+    A lost window starts when an open port goes away and ends when it is
+    opened again; the time before the first successful open is not counted.
+    """
+
+    def __init__(self):
+        self.up_since: Optional[float] = None
+        self.down_since: Optional[float] = None
+        self.up_seconds = 0.0
+        self.lost_windows = 0
+        self.lost_seconds = 0.0
+
+    def up(self, now: float) -> Optional[float]:
+        """Port opened; returns the length of the lost window it closes, if any."""
+        if self.up_since is not None:
+            return None
+        self.up_since = now
+        if self.down_since is None:
+            return None
+        lost = now - self.down_since
+        self.lost_seconds += lost
+        self.down_since = None
+        return lost
+
+    def down(self, now: float):
+        """Port lost."""
+        if self.up_since is None:
+            return
+        self.up_seconds += now - self.up_since
+        self.up_since = None
+        self.down_since = now
+        self.lost_windows += 1
+
+    def snapshot(self, now: float) -> Dict[str, float]:
+        up = self.up_seconds
+        lost = self.lost_seconds
+        if self.up_since is not None:
+            up += now - self.up_since
+        if self.down_since is not None:
+            lost += now - self.down_since
+        return {
+            "open": self.up_since is not None,
+            "uptime": now - self.up_since if self.up_since is not None else 0.0,
+            "up_seconds": up,
+            "lost_windows": self.lost_windows,
+            "lost_seconds": lost,
+        }
+
+
+# =============================================================================
+# Capture timestamps
+# =============================================================================
+class CaptureClock:
+    """
+    Wall-clock stamps derived from time.perf_counter().
+
+    Readers take `now()` when a chunk arrives and keep that raw value for
+    latency math (perf_counter, not monotonic: on Windows before Python 3.13
+    monotonic() only ticks every ~15.6 ms); format() turns it into wall time
+    from one time.time() anchor taken at start-up, so stamps from different consoles stay ordered even if the PC
+    clock is adjusted mid-run. The strftime() part is cached per second, so
+    formatting a line costs an integer compare plus the fractional part.
+    """
+
+    def __init__(self, fmt: str = "%Y-%m-%d %H:%M:%S", digits: int = 3):
+        self.fmt = fmt
+        self.digits = digits
+        self._wall0 = time.time()
+        self._mono0 = time.perf_counter()
+        self._cache: Tuple[int, str] = (-1, "")
+
+    @staticmethod
+    def now() -> float:
+        return time.perf_counter()
+
+    def wall(self, mono: float) -> float:
+        return self._wall0 + (mono - self._mono0)
+
+    def format(self, mono: float) -> str:
+        wall = self.wall(mono)
+        sec = int(wall)
+        cached_sec, prefix = self._cache
+        if sec != cached_sec:
+            prefix = datetime.fromtimestamp(sec).strftime(self.fmt)
+            self._cache = (sec, prefix)
+        if not self.digits:
+            return prefix
+        frac = int((wall - sec) * 10 ** self.digits)
+        return f"{prefix}.{frac:0{self.digits}d}"
+
+
+# =============================================================================
+# Console log writers
+# =============================================================================
+FSYNC_NONE = 0    # leave write-back to the OS
+FSYNC_FLUSH = 1   # fsync after every flush
+FSYNC_CLOSE = 2   # fsync once when a file is closed (log_index switch / end of test)
+
+# offset index record (<segment>.oidx): kind, code, key, text offset of the line it points at
+OFFSET_INDEX = struct.Struct("<BBxxIQ")
+OFFSET_SUFFIX = ".oidx"
+OFFSET_SECOND = 1   # key: wall-clock second; first line stamped in that second
+OFFSET_CYCLE = 2    # key: cycle number; start of the cycle
+OFFSET_MARKER = 3   # code: marker type (ACC OFF/ON... defined by the tool), key: cycle number
+OFFSET_FAILURE = 4  # code: failure type (defined by the tool), key: cycle number
+
+
+def segment_path(directory: str, name: str, index: int, part: int = 0, ext: str = ".log") -> str:
+    """`<name>_<index>.log` for the first part of a log index, `<name>_<index>.<part>.log` after rotation."""
+    if part:
+        return os.path.join(directory, f"{name}_{index}.{part}{ext}")
+    return os.path.join(directory, f"{name}_{index}{ext}")
+
+
+# <name>_<index>[.<part>]<ext>, ext being one or more suffixes (.log, .bin, .log.gz, .log.gz.fidx...)
+SEGMENT_NAME = re.compile(r"(?P<name>\w+?)_(?P<index>\d+)(?:\.(?P<part>\d+))?(?P<ext>(?:\.[A-Za-z]\w*)+)")
+
+
+def segment_key(filename: str) -> Optional[Tuple[str, int, int]]:
+    """(name, index, part) of a segment file name, None for other files."""
+    m = SEGMENT_NAME.fullmatch(filename)
+    if not m:
+        return None
+    return m.group("name"), int(m.group("index")), int(m.group("part") or 0)
+
+
+def segment_paths(directory: str, name: str, index: int, ext: str = ".log") -> List[str]:
+    """Existing parts of one log index, in write order (pruned parts are skipped)."""
+    parts = []
+    for entry in os.listdir(directory):
+        m = SEGMENT_NAME.fullmatch(entry)
+        if m and m.group("name") == name and int(m.group("index")) == index and m.group("ext") == ext:
+            parts.append((int(m.group("part") or 0), os.path.join(directory, entry)))
+    return [path for _, path in sorted(parts)]
+
+
+class ConsoleLogWriter:
+    """
+    Long-lived buffered writer for one console log, `<directory>/<name>_<index>.log`.
+
+    Text is collected in memory and written when `flush_bytes` are pending or
+    when the oldest pending text is `flush_interval` seconds old. Passing a new
+    log index to write() flushes and closes the current file and opens the next.
+
+    Within one log index the file is rotated on write() once it holds
+    `rotate_bytes` (pending text included) or has been open `rotate_seconds`
+    (0 = never): the next parts are `<name>_<index>.1.log`, `.2.log`...
+    write() takes whole lines, so a part always ends on a line boundary.
+
+    With `offset_index` each segment gets a `<segment>.oidx` sidecar of
+    OFFSET_INDEX records: the first line of every wall-clock second passed
+    to write(), and whatever mark() is given (cycle starts, markers,
+    failures), each with the byte offset of the next line written (the
+    text offset for compressed logs). Offsets are worked out at flush time,
+    so marking costs nothing per line. A mark waits for its line across
+    flushes and rotations; one still waiting when the log index is closed
+    points at the end of its last part.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        flush_bytes: int = 64 * 1024,
+        flush_interval: float = 1.0,
+        fsync_mode: int = FSYNC_NONE,
+        encoding: str = "utf-8",
+        rotate_bytes: int = 0,
+        rotate_seconds: float = 0,
+        offset_index: bool = False,
+    ):
+        self.directory = directory
+        self.name = name
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.fsync_mode = fsync_mode
+        self.encoding = encoding
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.offset_index = offset_index
+
+        self.index: Optional[int] = None
+        self.part = 0
+        self._f = None
+        self._oidx = None
+        self._marks: List[Tuple[int, int, int, int]] = []
+        self._last_second: Optional[int] = None
+        self._part_size = 0
+        self._part_since = 0.0
+        self._pending: List[str] = []
+        self._pending_size = 0
+        self._pending_since = 0.0
+        self._lock = threading.Lock()
+
+    def path(self, index: int, part: int = 0) -> str:
+        return segment_path(self.directory, self.name, index, part)
+
+    @property
+    def current_path(self) -> Optional[str]:
+        """File being written (None while closed)."""
+        return None if self._f is None else self.path(self.index, self.part)
+
+    def write(self, index: int, text: str, second: Optional[int] = None):
+        with self._lock:
+            if index != self.index:
+                self._switch(index)
+            elif self._rotation_due():
+                self._rotate()
+            if not self._pending:
+                self._pending_since = time.perf_counter()
+            if second is not None and second != self._last_second and self.offset_index:
+                self._last_second = second
+                self._marks.append((len(self._pending), OFFSET_SECOND, 0, second))
+            self._pending.append(text)
+            self._pending_size += len(text)
+            if self._pending_size >= self.flush_bytes:
+                self._flush()
+
+    def mark(self, index: int, kind: int, code: int, key: int):
+        """Index the next line written to log `index` under (kind, code, key)."""
+        with self._lock:
+            if not self.offset_index:
+                return
+            if index != self.index:
+                self._switch(index)
+            self._marks.append((len(self._pending), kind, code, key))
+
+    def flush_if_due(self, now: Optional[float] = None):
+        with self._lock:
+            if self._pending and (now or time.perf_counter()) - self._pending_since >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._close()
+            self.index = None
+
+    def _switch(self, index: int):
+        self._close()
+        self.index = index
+        self.part = 0
+        self._open()
+
+    def _open(self):
+        self._f = open(self.path(self.index, self.part), "ab")
+        self._part_size = self._f.tell()
+        self._part_since = time.perf_counter()
+        if self.offset_index:
+            self._oidx = open(self.path(self.index, self.part) + OFFSET_SUFFIX, "ab")
+            self._last_second = None
+
+    def _text_position(self) -> int:
+        """Offset the next flushed text starts at."""
+        return self._part_size
+
+    def _encode_pending(self) -> bytes:
+        """
+        Pending text as bytes. Marks whose line is pending go to the sidecar
+        with their offsets; marks still waiting for their line are kept.
+        """
+        if not self._marks:
+            return "".join(self._pending).encode(self.encoding, "replace")
+        base = self._text_position()
+        chunks: List[bytes] = []
+        size = start = 0
+        records = bytearray()
+        waiting = []
+        for pos, kind, code, key in self._marks:
+            if pos >= len(self._pending):
+                waiting.append((0, kind, code, key))
+                continue
+            if pos > start:
+                chunk = "".join(self._pending[start:pos]).encode(self.encoding, "replace")
+                chunks.append(chunk)
+                size += len(chunk)
+                start = pos
+            records += OFFSET_INDEX.pack(kind, code, key, base + size)
+        chunks.append("".join(self._pending[start:]).encode(self.encoding, "replace"))
+        self._marks = waiting
+        self._oidx.write(records)
+        self._oidx.flush()
+        return b"".join(chunks)
+
+    def _rotation_size(self) -> int:
+        """Size `rotate_bytes` is compared with: the part on disk plus the pending text."""
+        return self._part_size + self._pending_size
+
+    def _rotation_due(self) -> bool:
+        return bool((self.rotate_bytes and self._rotation_size() >= self.rotate_bytes) or
+                    (self.rotate_seconds and time.perf_counter() - self._part_since >= self.rotate_seconds))
+
+    def _rotate(self):
+        self._flush()
+        # marks still waiting for their line point into the new part
+        waiting, self._marks = self._marks, []
+        self._close()
+        self.part += 1
+        self._open()
+        self._marks = waiting
+
+    def _flush(self):
+        if not self._pending or self._f is None:
+            return
+        data = self._encode_pending()
+        self._f.write(data)
+        self._f.flush()
+        if self.fsync_mode == FSYNC_FLUSH:
+            os.fsync(self._f.fileno())
+        self._pending = []
+        self._pending_size = 0
+        self._part_size += len(data)
+
+    def _close(self):
+        if self._f is None:
+            return
+        self._flush()
+        if self.fsync_mode == FSYNC_CLOSE:
+            os.fsync(self._f.fileno())
+        if self._oidx is not None:
+            # no line followed these marks: they point at the end of the log
+            end = self._text_position()
+            self._oidx.write(b"".join(OFFSET_INDEX.pack(kind, code, key, end) for _, kind, code, key in self._marks))
+            self._marks = []
+            self._oidx.close()
+            self._oidx = None
+        self._f.close()
+        self._f = None
+
+
+# capture index record: wall-clock arrival time of a chunk, byte offset of the chunk in the .bin file
+CAPTURE_INDEX = struct.Struct("<dQ")
+
+
+class RawCaptureWriter(ConsoleLogWriter):
+    """
+    Exact received bytes of one console, `<name>_<index>.bin`, with a sidecar
+    `<name>_<index>.idx` holding one CAPTURE_INDEX record per received chunk.
+    Nothing is decoded here; buffering and flush bounds are ConsoleLogWriter's.
+    """
+
+    def __init__(self, directory: str, name: str, **writer_kwargs):
+        super().__init__(directory, name, **writer_kwargs)
+        self._idx = None
+        self._offset = 0
+        self._index_buf = bytearray()
+
+    def path(self, index: int, part: int = 0) -> str:
+        return segment_path(self.directory, self.name, index, part, ".bin")
+
+    def write(self, index: int, data: bytes, wall: float):
+        with self._lock:
+            if index != self.index:
+                self._switch(index)
+            elif self._rotation_due():
+                self._rotate()
+            if not self._pending:
+                self._pending_since = time.perf_counter()
+            self._index_buf += CAPTURE_INDEX.pack(wall, self._offset)
+            self._offset += len(data)
+            self._pending.append(data)
+            self._pending_size += len(data)
+            if self._pending_size >= self.flush_bytes:
+                self._flush()
+
+    def _open(self):
+        super()._open()
+        self._offset = self._f.tell()
+        self._idx = open(os.path.splitext(self.path(self.index, self.part))[0] + ".idx", "ab")
+
+    def _flush(self):
+        if not self._pending or self._f is None:
+            return
+        self._f.write(b"".join(self._pending))
+        self._f.flush()
+        self._idx.write(self._index_buf)
+        self._idx.flush()
+        if self.fsync_mode == FSYNC_FLUSH:
+            os.fsync(self._f.fileno())
+            os.fsync(self._idx.fileno())
+        self._pending = []
+        self._pending_size = 0
+        self._index_buf.clear()
+        self._part_size = self._offset
+
+    def _close(self):
+        if self._f is None:
+            return
+        self._flush()
+        if self.fsync_mode == FSYNC_CLOSE:
+            os.fsync(self._idx.fileno())
+        self._idx.close()
+        self._idx = None
+        super()._close()
+
+
+class RawCapture:
+    """
+    Read side of a raw capture: chunks are located through the index and
+    read (and decoded) only when asked for. A torn last index record from an
+    interrupted run is ignored.
+    """
+
+    def __init__(self, path: str, encoding: str = "utf-8", errors: str = "replace"):
+        self.path = path
+        self.encoding = encoding
+        self.errors = errors
+        with open(os.path.splitext(path)[0] + ".idx", "rb") as f:
+            index = f.read()
+        self._index = index[:len(index) - len(index) % CAPTURE_INDEX.size]
+        self._f = open(path, "rb")
+        self._size = os.fstat(self._f.fileno()).st_size
+
+    def __len__(self) -> int:
+        return len(self._index) // CAPTURE_INDEX.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._f.close()
+
+    def entry(self, i: int) -> Tuple[float, int]:
+        """(wall-clock time, byte offset) of chunk i."""
+        return CAPTURE_INDEX.unpack_from(self._index, i * CAPTURE_INDEX.size)
+
+    def chunk(self, i: int) -> bytes:
+        start = self.entry(i)[1]
+        end = self.entry(i + 1)[1] if i + 1 < len(self) else self._size
+        self._f.seek(start)
+        return self._f.read(end - start)
+
+    def find(self, wall: float) -> int:
+        """Index of the first chunk received at or after `wall`."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.entry(mid)[0] < wall:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def chunks(self, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Tuple[float, bytes]]:
+        for i in range(self.find(since) if since is not None else 0, len(self)):
+            wall = self.entry(i)[0]
+            if until is not None and wall > until:
+                return
+            yield wall, self.chunk(i)
+
+    def lines(self, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Tuple[float, str]]:
+        """Decoded lines stamped like the live reader does: with the chunk that completed them."""
+        splitter = LineSplitter(self.encoding, self.errors)
+        for wall, data in self.chunks(since, until):
+            for line in splitter.feed(data):
+                yield wall, line
+        if splitter.pending():
+            yield wall, splitter.flush()
+
+
+class OffsetIndex:
+    """
+    Read side of a `<segment>.oidx` sidecar: where in the segment a second,
+    a cycle, a marker or a failure starts, without scanning the log. A torn
+    last record from an interrupted run is ignored. Offsets are text offsets
+    (seek() for a .log, CompressedLog.read() for a compressed one).
+
+        index = OffsetIndex('log/20240102/qnx_3.log')
+        f.seek(index.cycle(8731))
+    """
+
+    def __init__(self, log_path: str):
+        self.path = log_path + OFFSET_SUFFIX
+        with open(self.path, "rb") as f:
+            data = f.read()
+        data = data[:len(data) - len(data) % OFFSET_INDEX.size]
+        self.records: List[Tuple[int, int, int, int]] = list(OFFSET_INDEX.iter_unpack(data))
+        self._seconds = [(key, offset) for kind, _, key, offset in self.records if kind == OFFSET_SECOND]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def second(self, wall: float) -> Optional[int]:
+        """Offset of the first line stamped in the second of `wall` or later (None: nothing that late)."""
+        lo, hi = 0, len(self._seconds)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._seconds[mid][0] < int(wall):
+                lo = mid + 1
+            else:
+                hi = mid
+        return self._seconds[lo][1] if lo < len(self._seconds) else None
+
+    def cycles(self) -> Dict[int, int]:
+        """Cycle number -> offset of its start."""
+        return {key: offset for kind, _, key, offset in self.records if kind == OFFSET_CYCLE}
+
+    def cycle(self, number: int) -> Optional[int]:
+        return self.cycles().get(number)
+
+    def markers(self, code: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        """(marker type, cycle, offset) of every marker, or of type `code` only."""
+        return [(c, key, offset) for kind, c, key, offset in self.records
+                if kind == OFFSET_MARKER and (code is None or c == code)]
+
+    def failures(self) -> List[Tuple[int, int, int]]:
+        """(failure type, cycle, offset) of every failure."""
+        return [(c, key, offset) for kind, c, key, offset in self.records if kind == OFFSET_FAILURE]
+
+
+# =============================================================================
+# Disk budget
+# =============================================================================
+class LogRetention:
+    """
+    Keeps a run directory under `budget` bytes by deleting console log
+    segments (`<name>_<index>[.<part>].log/.bin/.idx/.oidx` of `names`), oldest
+    log index / part first.
+
+    Never deleted: segments of a log index passed to mark_failure(), files
+    still open (`keep` given to enforce()) and segments modified within the
+    last `keep_seconds`, so the lead-up to a failure that is detected later
+    (suspend/resume timeouts) is still there when it is marked. Everything
+    else in the directory (testlog, screenshots...) counts towards the
+    budget but is left alone.
+    """
+
+    def __init__(self, directory: str, budget: int, names: List[str], keep_seconds: float = 900.0):
+        self.directory = directory
+        self.budget = budget
+        self.names = set(names)
+        self.keep_seconds = keep_seconds
+        self.failures: set = set()
+        self.pruned_files = 0
+        self.pruned_bytes = 0
+        self._lock = threading.Lock()
+
+    def mark_failure(self, index: int):
+        with self._lock:
+            self.failures.add(index)
+
+    def usage(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, file))
+                except OSError:
+                    pass
+        return total
+
+    def enforce(self, keep: Iterable[str] = (), now: Optional[float] = None) -> List[str]:
+        """Delete segments until the directory fits the budget; returns the deleted paths."""
+        total = self.usage()
+        if total <= self.budget:
+            return []
+        now = time.time() if now is None else now
+        # sidecar files (.idx...) of an open segment are open too
+        keep = {segment_key(os.path.basename(path)) for path in keep}
+        with self._lock:
+            failures = set(self.failures)
+        candidates = []
+        for entry in os.scandir(self.directory):
+            key = segment_key(entry.name)
+            if key is None or key[0] not in self.names or not entry.is_file():
+                continue
+            _, index, part = key
+            if index in failures or key in keep:
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime < self.keep_seconds:
+                continue
+            candidates.append((index, part, entry.path, stat.st_size))
+        deleted = []
+        for index, part, path, size in sorted(candidates):
+            if total <= self.budget:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.pruned_files += 1
+            self.pruned_bytes += size
+            deleted.append(path)
+        return deleted
+
+
+class ConsoleLogs:
+    """
+    One ConsoleLogWriter per console plus a background thread that applies
+    the time bound while a console is quiet. With `raw` every console also
+    gets a RawCaptureWriter. With `retention` the same thread keeps the run
+    directory within its disk budget every `retention_interval` seconds.
+    `log_writer` builds the console log writers (a compressing writer...).
+    `offset_index` gives every console log an offset index (not the raw
+    captures, which have their own).
+    """
+
+    def __init__(self, directory: str, names: List[str], raw: bool = False,
+                 retention: Optional[LogRetention] = None, retention_interval: float = 30.0,
+                 log_writer: Callable[..., ConsoleLogWriter] = ConsoleLogWriter,
+                 offset_index: bool = False, **writer_kwargs):
+        self.writers: Dict[str, ConsoleLogWriter] = {
+            name: log_writer(directory, name, offset_index=offset_index, **writer_kwargs) for name in names
+        }
+        self.captures: Dict[str, RawCaptureWriter] = {}
+        if raw:
+            self.captures = {name: RawCaptureWriter(directory, name, **writer_kwargs) for name in names}
+        self.extra: List[ConsoleLogWriter] = []
+        self.retention = retention
+        self.retention_interval = retention_interval
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def write(self, name: str, index: int, text: str, second: Optional[int] = None):
+        self.writers[name].write(index, text, second)
+
+    def mark(self, index: int, kind: int, code: int, key: int):
+        """Offset-index the next line of every console log (a cycle start, marker, failure)."""
+        for writer in self.writers.values():
+            writer.mark(index, kind, code, key)
+
+    def capture(self, name: str, index: int, data: bytes, wall: float):
+        self.captures[name].write(index, data, wall)
+
+    def label(self, index: int, text: str):
+        """Write the same banner line into every console log."""
+        for writer in self.writers.values():
+            writer.write(index, text)
+
+    def attach(self, writer: ConsoleLogWriter):
+        """Have the flush thread and close() look after another writer (the timeline...)."""
+        self.extra.append(writer)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+        for writer in self._all_writers():
+            writer.close()
+
+    def _all_writers(self) -> List[ConsoleLogWriter]:
+        return list(self.writers.values()) + list(self.captures.values()) + self.extra
+
+    def _flush_loop(self):
+        interval = min(w.flush_interval for w in self.writers.values()) / 2
+        next_retention = time.perf_counter()
+        while not self._stop_event.wait(interval):
+            now = time.perf_counter()
+            for writer in self._all_writers():
+                try:
+                    writer.flush_if_due(now)
+                except OSError as e:
+                    print(f"[{writer.name}] log flush error: {e}")
+            if self.retention is not None and now >= next_retention:
+                next_retention = now + self.retention_interval
+                try:
+                    self.retention.enforce(w.current_path for w in self._all_writers() if w.current_path)
+                except OSError as e:
+                    print(f"log retention error: {e}")
+
+
+# =============================================================================
+# Counter header
+# =============================================================================
+class CounterHeader:
+    """
+    Counters in a fixed-width header at the top of a text log (testlog.txt):
+
+        COUNTLOG:-----
+        suspend_count:12<padding>
+        ...
+        TESTLOG:------
+
+    create() starts the file with the header; update() overwrites only the
+    header bytes in place, so a count update costs the same however much text
+    has been appended after it. Each value is padded to `width` characters.
+    """
+
+    def __init__(self, path: str, names: List[str], head: str, tail: str, width: int = 12):
+        self.path = path
+        self.names = list(names)
+        self.head = head
+        self.tail = tail
+        self.width = width
+
+    def render(self, values: Dict[str, object]) -> bytes:
+        lines = [self.head]
+        for name in self.names:
+            value = str(values[name])
+            if len(value) > self.width:
+                raise ValueError(f"{name}={value} does not fit in {self.width} characters")
+            lines.append(f"{name}:{value.ljust(self.width)}\n")
+        lines.append(self.tail)
+        return "".join(lines).encode("utf-8")
+
+    def create(self, values: Dict[str, object]):
+        with open(self.path, "wb") as f:
+            f.write(self.render(values))
+
+    def update(self, values: Dict[str, object]):
+        data = self.render(values)
+        with open(self.path, "r+b") as f:
+            f.write(data)
+
+
+# =============================================================================
+# Reader -> consumer hand-off
+# =============================================================================
+class _Stage:
+    """One consumer thread with its own bounded ring."""
+
+    def __init__(self, name: str, handler: Callable, capacity: int):
+        self.name = name
+        self.handler = handler
+        self.capacity = capacity
+        self.normal: Deque[Tuple[int, object]] = deque()
+        self.priority: Deque[Tuple[int, object]] = deque()
+        self.cond = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.processed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.reported_drops = 0
+
+    def depth(self) -> int:
+        return len(self.normal) + len(self.priority)
+
+
+class LogPipeline:
+    """
+    Bounded hand-off between the serial reader and slow consumers.
+
+    put() never blocks the reader: every stage (persistence, monitoring, ...)
+    gets its own ring and thread, so a disk stall cannot delay monitoring and
+    neither can overrun the UART. When a ring is full its oldest item is
+    dropped and counted, unless `is_priority(item)` is true: then it moves to
+    a side ring that is never trimmed, so a failure line survives any backlog.
+    is_priority() is only asked about items that are about to be dropped, so
+    the reader does no classification while the consumers keep up. Both
+    rings are consumed in arrival order.
+    """
+
+    def __init__(
+        self,
+        is_priority: Optional[Callable[[object], bool]] = None,
+        on_drop: Optional[Callable[[str, int], None]] = None,
+    ):
+        self.is_priority = is_priority
+        self.on_drop = on_drop
+        self._stages: List[_Stage] = []
+        self._seq = 0
+        self._seq_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def add_stage(self, name: str, handler: Callable[[object], None], capacity: int = 200000):
+        """Register a consumer. Must be called before start()."""
+        self._stages.append(_Stage(name, handler, capacity))
+
+    def start(self):
+        for stage in self._stages:
+            stage.thread = threading.Thread(target=self._consume, args=(stage,), daemon=True)
+            stage.thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop after the rings have been drained (bounded by `timeout`)."""
+        self._stop_event.set()
+        for stage in self._stages:
+            with stage.cond:
+                stage.cond.notify()
+        for stage in self._stages:
+            if stage.thread:
+                stage.thread.join(timeout=timeout)
+
+    def put(self, item):
+        with self._seq_lock:
+            self._seq += 1
+            seq = self._seq
+        verdicts: Dict[int, bool] = {}
+        for stage in self._stages:
+            with stage.cond:
+                if len(stage.normal) >= stage.capacity:
+                    oldest = stage.normal.popleft()
+                    # stages usually trim the same item: classify it once
+                    if oldest[0] not in verdicts:
+                        verdicts[oldest[0]] = self.is_priority is not None and self.is_priority(oldest[1])
+                    if verdicts[oldest[0]]:
+                        # moved from the front of the ring, so the side ring stays in arrival order
+                        stage.priority.append(oldest)
+                    else:
+                        stage.dropped += 1
+                stage.normal.append((seq, item))
+                depth = stage.depth()
+                if depth > stage.max_depth:
+                    stage.max_depth = depth
+                stage.cond.notify()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Per stage: current depth, high-water mark, items processed and dropped."""
+        result = {}
+        for stage in self._stages:
+            with stage.cond:
+                result[stage.name] = {
+                    "depth": stage.depth(),
+                    "max_depth": stage.max_depth,
+                    "processed": stage.processed,
+                    "dropped": stage.dropped,
+                }
+        return result
+
+    def _take(self, stage: _Stage) -> List[object]:
+        """Pop everything queued, merging both rings back into arrival order."""
+        batch = []
+        normal, priority = stage.normal, stage.priority
+        while normal or priority:
+            if priority and (not normal or priority[0][0] < normal[0][0]):
+                batch.append(priority.popleft()[1])
+            else:
+                batch.append(normal.popleft()[1])
+        return batch
+
+    def _consume(self, stage: _Stage):
+        while True:
+            with stage.cond:
+                while not stage.depth() and not self._stop_event.is_set():
+                    stage.cond.wait()
+                batch = self._take(stage)
+                new_drops = stage.dropped - stage.reported_drops
+                stage.reported_drops = stage.dropped
+            if new_drops and self.on_drop is not None:
+                try:
+                    self.on_drop(stage.name, new_drops)
+                except Exception as e:
+                    print(f"[{stage.name}] drop handler error: {e}")
+            for item in batch:
+                try:
+                    stage.handler(item)
+                except Exception as e:
+                    print(f"[{stage.name}] handler error: {e}")
+            with stage.cond:
+                stage.processed += len(batch)
+            if not batch and self._stop_event.is_set():
+                return
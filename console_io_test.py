@@ -0,0 +1,319 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import console_io as mod
+
+
+class TestLineSplitter(unittest.TestCase):
+
+    def test_partial_line_carried_over(self):
+        sp = mod.LineSplitter()
+        self.assertEqual(sp.feed(b"slog2info\nPMT:ASEE"), ["slog2info"])
+        self.assertEqual(sp.pending(), len(b"PMT:ASEE"))
+        self.assertEqual(sp.feed(b" High\r\n"), ["PMT:ASEE High\r"])
+        self.assertEqual(sp.pending(), 0)
+
+    def test_bad_bytes_are_replaced_not_dropped(self):
+        sp = mod.LineSplitter()
+        lines = sp.feed(b"ok\n\xff\xfedump\nnext\n")
+        self.assertEqual(lines, ["ok", "��dump", "next"])
+
+    def test_multibyte_split_across_reads(self):
+        sp = mod.LineSplitter()
+        data = "テスト\n".encode("utf-8")
+        self.assertEqual(sp.feed(data[:4]), [])
+        self.assertEqual(sp.feed(data[4:]), ["テスト"])
+
+    def test_newline_free_dump_is_bounded(self):
+        sp = mod.LineSplitter(max_line=16)
+        self.assertEqual(sp.feed(b"x" * 8), [])
+        self.assertEqual(sp.feed(b"x" * 8), ["x" * 16])
+        self.assertEqual(sp.pending(), 0)
+
+
+class TestPortHealth(unittest.TestCase):
+
+    def test_backoff_doubles_up_to_maximum(self):
+        b = mod.Backoff(first=0.05, maximum=0.3)
+        self.assertEqual([b.next() for _ in range(5)], [0.05, 0.1, 0.2, 0.3, 0.3])
+        b.reset()
+        self.assertEqual(b.next(), 0.05)
+
+    def test_lost_windows(self):
+        h = mod.PortHealth()
+        self.assertIsNone(h.up(10.0))  # first open is not a recovery
+        h.down(20.0)
+        self.assertEqual(h.snapshot(21.0)["lost_seconds"], 1.0)
+        self.assertEqual(h.up(22.5), 2.5)
+        snap = h.snapshot(30.0)
+        self.assertEqual(snap["lost_windows"], 1)
+        self.assertEqual(snap["up_seconds"], 17.5)
+        self.assertEqual(snap["uptime"], 7.5)
+        self.assertTrue(snap["open"])
+
+
+class TestCaptureClock(unittest.TestCase):
+
+    def test_format_follows_monotonic_offsets(self):
+        clock = mod.CaptureClock()
+        t0 = clock._mono0 + (1.0 - clock._wall0 % 1.0) + 0.0005  # just after the next wall second
+        self.assertTrue(clock.format(t0).endswith(".000"))
+        self.assertTrue(clock.format(t0 + 0.25).endswith(".250"))
+        self.assertEqual(clock.format(t0 + 0.25)[:19], clock.format(t0)[:19])
+        self.assertLess(clock.format(t0 + 0.998), clock.format(t0 + 1.0))
+
+    def test_seconds_only(self):
+        clock = mod.CaptureClock("%m-%d %H:%M:%S", digits=0)
+        self.assertEqual(len(clock.format(clock.now())), len("01-02 03:04:05"))
+
+
+class TestConsoleLogWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def read(self, name):
+        with open(os.path.join(self.tmp.name, name), encoding="utf-8") as f:
+            return f.read()
+
+    def test_buffered_until_size_bound(self):
+        w = mod.ConsoleLogWriter(self.tmp.name, "qnx", flush_bytes=10, flush_interval=60)
+        w.write(0, "abc\n")
+        self.assertEqual(self.read("qnx_0.log"), "")
+        w.write(0, "defghij\n")
+        self.assertEqual(self.read("qnx_0.log"), "abc\ndefghij\n")
+        w.close()
+
+    def test_time_bound(self):
+        w = mod.ConsoleLogWriter(self.tmp.name, "ucom", flush_interval=1.0)
+        w.write(0, "line\n")
+        w.flush_if_due(w._pending_since + 0.5)
+        self.assertEqual(self.read("ucom_0.log"), "")
+        w.flush_if_due(w._pending_since + 1.0)
+        self.assertEqual(self.read("ucom_0.log"), "line\n")
+        w.close()
+
+    def test_switches_file_on_new_index(self):
+        logs = mod.ConsoleLogs(self.tmp.name, ["ucom", "sail"])
+        logs.write("ucom", 0, "a\n")
+        logs.label(0, "#### ACC OFF ####\n")
+        logs.write("ucom", 1, "b\n")
+        self.assertEqual(self.read("ucom_0.log"), "a\n#### ACC OFF ####\n")
+        logs.close()
+        self.assertEqual(self.read("ucom_1.log"), "b\n")
+        self.assertEqual(self.read("sail_0.log"), "#### ACC OFF ####\n")
+
+    def test_raw_capture_round_trip(self):
+        logs = mod.ConsoleLogs(self.tmp.name, ["qnx"], raw=True)
+        logs.capture("qnx", 0, b"\x1b[31mPMT:AS", 100.0)
+        logs.capture("qnx", 0, b"EE\x1b[0m\r\n\xff\xfe", 100.5)
+        logs.capture("qnx", 0, b"dump\nnext\n", 101.0)
+        logs.close()
+        with mod.RawCapture(os.path.join(self.tmp.name, "qnx_0.bin")) as cap:
+            self.assertEqual(len(cap), 3)
+            self.assertEqual(cap.chunk(1), b"EE\x1b[0m\r\n\xff\xfe")
+            self.assertEqual(cap.find(100.2), 1)
+            self.assertEqual(list(cap.lines()), [
+                (100.5, "\x1b[31mPMT:ASEE\x1b[0m\r"),
+                (101.0, "��dump"),
+                (101.0, "next"),
+            ])
+            self.assertEqual([w for w, _ in cap.chunks(since=100.5)], [100.5, 101.0])
+
+    def test_raw_capture_appends_and_skips_torn_index(self):
+        for wall in (1.0, 2.0):
+            w = mod.RawCaptureWriter(self.tmp.name, "sail")
+            w.write(0, b"abc", wall)
+            w.close()
+        with open(os.path.join(self.tmp.name, "sail_0.idx"), "ab") as f:
+            f.write(b"\0" * 5)
+        with mod.RawCapture(os.path.join(self.tmp.name, "sail_0.bin")) as cap:
+            self.assertEqual([cap.entry(i) for i in range(len(cap))], [(1.0, 0), (2.0, 3)])
+
+
+class TestLogRotation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def touch(self, name, size, age):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def test_rotates_by_size_on_line_boundaries(self):
+        w = mod.ConsoleLogWriter(self.tmp.name, "qnx", flush_bytes=1, rotate_bytes=10)
+        for line in ("12345\n", "67890\n", "abc\n", "def\n", "ghijklmnop\n"):
+            w.write(0, line)
+        w.write(1, "next\n")
+        w.close()
+        paths = mod.segment_paths(self.tmp.name, "qnx", 0)
+        self.assertEqual([os.path.basename(p) for p in paths], ["qnx_0.log", "qnx_0.1.log"])
+        self.assertEqual([open(p).read() for p in paths], ["12345\n67890\n", "abc\ndef\nghijklmnop\n"])
+        self.assertEqual(mod.segment_paths(self.tmp.name, "qnx", 1), [os.path.join(self.tmp.name, "qnx_1.log")])
+
+    def test_rotates_by_time(self):
+        w = mod.ConsoleLogWriter(self.tmp.name, "ucom", flush_bytes=1, rotate_seconds=60)
+        w.write(0, "a\n")
+        w._part_since -= 61
+        w.write(0, "b\n")
+        self.assertEqual(os.path.basename(w.current_path), "ucom_0.1.log")
+        w.close()
+        self.assertEqual(open(os.path.join(self.tmp.name, "ucom_0.log")).read(), "a\n")
+        self.assertEqual(open(os.path.join(self.tmp.name, "ucom_0.1.log")).read(), "b\n")
+
+    def test_retention_prunes_oldest_non_failure_segments(self):
+        self.touch("testlog.txt", 100, 3600)
+        self.touch("qnx_0.log", 100, 3600)
+        self.touch("qnx_1.log", 100, 3600)
+        self.touch("qnx_1.1.log", 100, 3600)
+        self.touch("qnx_2.log", 100, 3600)
+        self.touch("qnx_2.1.log", 100, 3600)
+        self.touch("qnx_2.2.log", 100, 10)
+        self.touch("ucom_2.3.bin", 100, 3600)
+        self.touch("ucom_2.3.idx", 10, 3600)
+        r = mod.LogRetention(self.tmp.name, budget=500, names=["qnx", "ucom"], keep_seconds=60)
+        r.mark_failure(1)
+        deleted = r.enforce(keep=[os.path.join(self.tmp.name, "ucom_2.3.bin")])
+        self.assertEqual([os.path.basename(p) for p in deleted], ["qnx_0.log", "qnx_2.log", "qnx_2.1.log"])
+        self.assertEqual(r.usage(), 810 - 300)
+        self.assertEqual(r.pruned_bytes, 300)
+        # over budget with nothing left that may go
+        self.assertEqual(r.enforce(keep=[os.path.join(self.tmp.name, "ucom_2.3.bin")]), [])
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["qnx_1.1.log", "qnx_1.log", "qnx_2.2.log",
+                                                             "testlog.txt", "ucom_2.3.bin", "ucom_2.3.idx"])
+
+
+class TestOffsetIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_seconds_cycles_and_failures_point_at_their_lines(self):
+        logs = mod.ConsoleLogs(self.tmp.name, ["qnx", "ucom"], offset_index=True, flush_bytes=64)
+        logs.write("qnx", 0, "boot\n", 100)
+        logs.mark(0, mod.OFFSET_CYCLE, 0, 1)
+        logs.mark(0, mod.OFFSET_MARKER, 1, 1)
+        logs.write("qnx", 0, "#### ACC OFF\n", 100)
+        logs.write("qnx", 0, "suspend\n", 101)
+        logs.mark(0, mod.OFFSET_FAILURE, 4, 1)
+        logs.write("qnx", 0, "reset\n", 103)
+        logs.write("ucom", 0, "ucom line\n", 100)
+        logs.close()
+        path = os.path.join(self.tmp.name, "qnx_0.log")
+        text = open(path, "rb").read()
+        index = mod.OffsetIndex(path)
+        self.assertEqual(text[index.cycle(1):].split(b"\n")[0], b"#### ACC OFF")
+        self.assertEqual(index.markers(1), [(1, 1, index.cycle(1))])
+        (code, cycle, offset), = index.failures()
+        self.assertEqual((code, cycle, text[offset:]), (4, 1, b"reset\n"))
+        self.assertEqual(text[index.second(101.5):], b"suspend\nreset\n")
+        self.assertEqual(text[index.second(102):], b"reset\n")
+        self.assertIsNone(index.second(104))
+        self.assertEqual(mod.OffsetIndex(os.path.join(self.tmp.name, "ucom_0.log")).cycle(1), 0)
+
+    def test_mark_waiting_at_rotation_goes_to_the_new_part(self):
+        w = mod.ConsoleLogWriter(self.tmp.name, "qnx", flush_bytes=1, rotate_bytes=10, offset_index=True)
+        w.write(0, "0123456789\n", 5)
+        w.mark(0, mod.OFFSET_CYCLE, 0, 2)
+        w.write(0, "cycle 2\n", 5)
+        w.close()
+        first = mod.OffsetIndex(os.path.join(self.tmp.name, "qnx_0.log"))
+        second = mod.OffsetIndex(os.path.join(self.tmp.name, "qnx_0.1.log"))
+        self.assertEqual((first.cycles(), first.second(5)), ({}, 0))
+        self.assertEqual((second.cycles(), second.second(5)), ({2: 0}, 0))
+
+    def test_mark_flushed_before_its_line_waits_for_it(self):
+        w = mod.ConsoleLogWriter(self.tmp.name, "qnx", flush_bytes=1, rotate_bytes=10, offset_index=True)
+        w.write(0, "0123456789\n", 5)
+        w.mark(0, mod.OFFSET_CYCLE, 0, 2)
+        w.flush()
+        w.write(0, "cycle 2\n", 6)
+        w.mark(0, mod.OFFSET_FAILURE, 1, 2)
+        w.close()
+        first = mod.OffsetIndex(os.path.join(self.tmp.name, "qnx_0.log"))
+        second = mod.OffsetIndex(os.path.join(self.tmp.name, "qnx_0.1.log"))
+        self.assertEqual(first.cycles(), {})
+        self.assertEqual(second.cycles(), {2: 0})
+        # nothing was written after the failure: it points at the end of the log
+        self.assertEqual(second.failures(), [(1, 2, len("cycle 2\n"))])
+
+
+class TestCounterHeader(unittest.TestCase):
+
+    def test_update_rewrites_header_only(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "testlog.txt")
+            header = mod.CounterHeader(path, ["suspend_count", "resume_count"], "COUNTLOG:---\n", "TESTLOG:---\n", width=6)
+            header.create({"suspend_count": 0, "resume_count": 0})
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("[tool] error\n")
+            header.update({"suspend_count": 123, "resume_count": 45})
+            with open(path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines, ["COUNTLOG:---", "suspend_count:123   ", "resume_count:45    ",
+                                     "TESTLOG:---", "[tool] error"])
+            self.assertEqual(int(lines[1].split(":")[1]), 123)
+            with self.assertRaises(ValueError):
+                header.update({"suspend_count": 1234567, "resume_count": 0})
+
+
+class TestLogPipeline(unittest.TestCase):
+
+    def test_full_ring_drops_oldest_but_keeps_priority(self):
+        gate = threading.Event()
+        seen = []
+
+        def slow(item):
+            gate.wait()
+            seen.append(item)
+
+        drops = []
+        pipe = mod.LogPipeline(is_priority=lambda item: "ASEE" in item, on_drop=lambda s, n: drops.append((s, n)))
+        pipe.add_stage("persist", slow, capacity=3)
+        pipe.start()
+        pipe.put("first")
+        while pipe.stats()["persist"]["depth"]:
+            time.sleep(0.001)  # wait until the consumer is blocked inside slow("first")
+        for item in ["a", "PMT:ASEE T.O.", "b", "c", "d", "e"]:
+            pipe.put(item)
+        self.assertEqual(pipe.stats()["persist"]["dropped"], 2)
+        gate.set()
+        pipe.stop()
+        self.assertEqual(seen, ["first", "PMT:ASEE T.O.", "c", "d", "e"])
+        self.assertEqual(drops, [("persist", 2)])
+        self.assertEqual(pipe.stats()["persist"]["processed"], 5)
+
+    def test_items_are_classified_only_when_dropped(self):
+        asked = []
+        pipe = mod.LogPipeline(is_priority=lambda item: asked.append(item) or False)
+        pipe.add_stage("persist", lambda item: None)
+        pipe.start()
+        for i in range(100):
+            pipe.put(i)
+        pipe.stop()
+        self.assertEqual(asked, [])
+
+    def test_every_stage_sees_every_item(self):
+        a, b = [], []
+        pipe = mod.LogPipeline()
+        pipe.add_stage("persist", a.append)
+        pipe.add_stage("monitor", b.append)
+        pipe.start()
+        for i in range(100):
+            pipe.put(i)
+        pipe.stop()
+        self.assertEqual(a, list(range(100)))
+        self.assertEqual(b, list(range(100)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,721 @@
+# -*- coding: utf-8 -*-
+"""
+Console log monitoring helpers shared by the serial tools (no pyserial needed here).
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, List, Optional, Pattern, Tuple
+
+NO_HITS: FrozenSet[str] = frozenset()
+
+
+# =============================================================================
+# Multi-pattern matching
+# =============================================================================
+def trie_pattern(literals) -> str:
+    """
+    One regex for a set of literals with shared prefixes factored out
+    ("PMT:ASEE T.O." / "PMT:ASEE High" -> "PMT:ASEE (?:High|T\\.O\\.)").
+    Branches of a node start with different characters and a literal that is
+    a prefix of another becomes an optional tail, so at any position the
+    regex matches the longest literal that starts there.
+    """
+    trie: Dict[str, dict] = {}
+    for literal in literals:
+        node = trie
+        for ch in literal:
+            node = node.setdefault(ch, {})
+        node[""] = {}  # end of a literal
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            return f"(?:{body})?"
+        return body
+
+    return build(trie) if trie else ""
+
+
+class PatternMatcher:
+    """
+    All literal patterns of one console (failsafe, trigger, error, metadata...)
+    matched in a single pass per line.
+
+    add() registers a literal under a tag; match() returns the set of
+    registered literals that occur in the line, so callers test `lit in hits`
+    instead of running one `in` per pattern. Internally the literals are
+    compiled into one prefix-factored regex (trie_pattern()), so the common
+    no-hit line is rejected by a single C-level search that looks at each
+    character about once, however many literals there are. On a hit, the
+    same regex inside a lookahead finds the longest literal at every
+    position and the prefix closure adds the shorter literals that start
+    there too, so the result is exactly what separate `in` tests give.
+
+    `lines` and `passed` count the lines seen and the lines that got past
+    the pre-filter; stats() gives the pass ratio for tuning the patterns.
+    """
+
+    def __init__(self):
+        self._tags: Dict[str, List[object]] = {}
+        self._any: Optional[Pattern[str]] = None
+        self._all: Optional[Pattern[str]] = None
+        self._closure: Dict[str, FrozenSet[str]] = {}
+        self._dirty = False
+        self.lines = 0
+        self.passed = 0
+
+    def add(self, literal: str, tag: object = None):
+        if not literal:
+            return
+        tags = self._tags.setdefault(literal, [])
+        if tag not in tags:
+            tags.append(tag)
+        self._dirty = True
+
+    def extend(self, literals, tag: object = None):
+        for literal in literals:
+            self.add(literal, tag)
+
+    def __len__(self) -> int:
+        return len(self._tags)
+
+    def compile(self):
+        literals = list(self._tags)
+        if literals:
+            pattern = trie_pattern(literals)
+            self._any = re.compile(pattern)
+            self._all = re.compile(f"(?=({pattern}))")
+        else:
+            self._any = self._all = None
+        self._closure = {
+            literal: frozenset(other for other in literals if literal.startswith(other))
+            for literal in literals
+        }
+        self._dirty = False
+
+    def match(self, line: str, count: bool = True) -> FrozenSet[str]:
+        """Literals found in `line`; `count=False` leaves lines/passed alone (a second look at a line)."""
+        if self._dirty:
+            self.compile()
+        if count:
+            self.lines += 1
+        if self._any is None:
+            return NO_HITS
+        first = self._any.search(line)
+        if first is None:
+            return NO_HITS
+        if count:
+            self.passed += 1
+        closure = self._closure
+        hits = set()
+        for literal in self._all.findall(line, first.start()):
+            hits |= closure[literal]
+        return frozenset(hits)
+
+    def stats(self) -> Dict[str, float]:
+        return {"lines": self.lines, "passed": self.passed,
+                "ratio": self.passed / self.lines if self.lines else 0.0}
+
+    def tagged(self, hits: FrozenSet[str]) -> List[Tuple[object, str]]:
+        """(tag, literal) for every hit, in registration order."""
+        return [(tag, literal) for literal, tags in self._tags.items() if literal in hits for tag in tags]
+
+
+# =============================================================================
+# Monitoring rules
+# =============================================================================
+class RuleError(ValueError):
+    """A rules file that cannot be used (the previous rules stay active)."""
+
+
+class Rule:
+    """
+    One monitoring rule:
+        console  : console name the rule watches
+        pattern  : literal that triggers the rule
+        require  : literals that must also be in the line
+        exclude  : literals that must not be in the line
+        when     : names of host conditions that must all be true
+        group    : rules sharing a group behave like an if/elif chain - only
+                   the first matching rule of the group (file order) fires
+        stop     : in a group, a line with this rule's pattern ends the chain
+                   even when require/exclude/when fail (an elif branch whose
+                   inner if is false); otherwise later rules get the line
+        actions  : [[action name, args...], ...] run in order
+    """
+
+    __slots__ = ("name", "console", "pattern", "require", "exclude", "when", "group", "stop", "actions", "hits")
+
+    def __init__(self, spec: Dict, index: int):
+        try:
+            self.name = spec.get("name") or f"rule{index}"
+            self.console = spec["console"]
+            self.pattern = spec["pattern"]
+            self.require = list(spec.get("require", []))
+            self.exclude = list(spec.get("exclude", []))
+            self.when = list(spec.get("when", []))
+            self.group = spec.get("group")
+            self.stop = bool(spec.get("stop", False))
+            self.actions = [list(action) for action in spec.get("actions", [])]
+        except (KeyError, TypeError, AttributeError) as e:
+            raise RuleError(f"rule #{index}: {e!r}") from None
+        if not isinstance(self.pattern, str) or not self.pattern:
+            raise RuleError(f"rule {self.name}: empty pattern")
+        self.hits = 0
+
+    def applies(self, line: str, conditions: Dict[str, Callable[[], bool]]) -> bool:
+        return (all(lit in line for lit in self.require)
+                and not any(lit in line for lit in self.exclude)
+                and all(conditions[cond]() for cond in self.when))
+
+
+class RuleHit:
+    """What an action gets: the rule (or correlation) that fired and the line that fired it."""
+
+    __slots__ = ("rule", "console", "line", "timestamp")
+
+    def __init__(self, rule, console: str, line: str, timestamp: str):
+        self.rule = rule
+        self.console = console
+        self.line = line
+        self.timestamp = timestamp
+
+
+# =============================================================================
+# Correlations
+# =============================================================================
+class Step:
+    """One line of a correlation: `pattern` (and all of `require`) on `console`."""
+
+    __slots__ = ("console", "pattern", "require")
+
+    def __init__(self, spec: Dict, where: str):
+        try:
+            self.console = spec["console"]
+            self.pattern = spec["pattern"]
+            self.require = list(spec.get("require", []))
+        except (KeyError, TypeError, AttributeError) as e:
+            raise RuleError(f"{where}: {e!r}") from None
+        if not isinstance(self.pattern, str) or not self.pattern:
+            raise RuleError(f"{where}: empty pattern")
+
+    def matches(self, console: str, line: str, hits: FrozenSet[str]) -> bool:
+        return console == self.console and self.pattern in hits and all(lit in line for lit in self.require)
+
+
+class Correlation:
+    """
+    A condition over lines of several consoles, evaluated line by line:
+        sequence : steps[0], steps[1], ... in this order, the last one at most
+                   `within` s after steps[0]
+        absence  : steps[0] and then no steps[1] for `within` s (fires when
+                   the window runs out, see RuleEngine.expire())
+        missing  : steps[-1] while one of steps[:-1] has not been seen in the
+                   `within` s before it (since the last reset if no window)
+    The state is one time per step, so a line costs O(steps) and history is
+    never rescanned. `reset_on` names host signals (RuleEngine.reset()) that
+    clear the state, e.g. the start of a new ACC cycle.
+    """
+
+    KINDS = ("sequence", "absence", "missing")
+
+    __slots__ = ("name", "kind", "steps", "within", "when", "actions", "reset_on", "hits",
+                 "_times", "_deadline", "_anchor")
+
+    def __init__(self, spec: Dict, index: int):
+        try:
+            self.name = spec.get("name") or f"correlation{index}"
+            self.kind = spec["kind"]
+            steps = list(spec["steps"])
+            within = spec.get("within")
+            self.within = None if within is None else float(within)
+            self.when = list(spec.get("when", []))
+            self.actions = [list(action) for action in spec.get("actions", [])]
+            self.reset_on = list(spec.get("reset_on", []))
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            raise RuleError(f"correlation #{index}: {e!r}") from None
+        self.steps = [Step(step, f"correlation {self.name} step #{i}") for i, step in enumerate(steps)]
+        if self.kind not in self.KINDS:
+            raise RuleError(f"correlation {self.name}: unknown kind {self.kind!r}")
+        if len(self.steps) < 2 or (self.kind == "absence" and len(self.steps) != 2):
+            raise RuleError(f"correlation {self.name}: wrong number of steps for {self.kind}")
+        if self.kind == "absence" and self.within is None:
+            raise RuleError(f"correlation {self.name}: absence needs a window")
+        self.hits = 0
+        self.reset()
+
+    def reset(self):
+        self._times: List[Optional[float]] = [None] * len(self.steps)
+        self._deadline: Optional[float] = None
+        self._anchor: Optional[Tuple[str, str, str]] = None
+
+    def feed(self, console: str, line: str, hits: FrozenSet[str], now: float) -> bool:
+        """Advance the state with one line; True when the line completes the condition."""
+        steps, times, within = self.steps, self._times, self.within
+        if self.kind == "sequence":
+            last = len(steps) - 1
+            # backwards, so one line cannot pass several steps at once
+            for i in range(last, -1, -1):
+                if not steps[i].matches(console, line, hits):
+                    continue
+                if i == 0:
+                    times[0] = now
+                elif times[i - 1] is not None and (within is None or now - times[i - 1] <= within):
+                    if i == last:
+                        self.reset()
+                        return True
+                    times[i] = times[i - 1]
+            return False
+        if self.kind == "absence":
+            if self._deadline is not None and steps[1].matches(console, line, hits):
+                self._deadline = self._anchor = None
+            return False
+        for i in range(len(steps) - 1):
+            if steps[i].matches(console, line, hits):
+                times[i] = now
+        if not steps[-1].matches(console, line, hits):
+            return False
+        return any(t is None or (within is not None and now - t > within) for t in times[:-1])
+
+    def open_window(self, console: str, line: str, hits: FrozenSet[str], now: float, timestamp: str):
+        """absence: start the window on steps[0] (a running window is not extended)."""
+        if self._deadline is None and self.steps[0].matches(console, line, hits):
+            self._deadline = now + self.within
+            self._anchor = (console, line, timestamp)
+
+    def expired(self, now: float) -> Optional[Tuple[str, str, str]]:
+        """absence: (console, line, timestamp) of steps[0] once its window ran out."""
+        if self._deadline is None or now <= self._deadline:
+            return None
+        anchor = self._anchor
+        self._deadline = self._anchor = None
+        return anchor
+
+
+# =============================================================================
+# Rule engine
+# =============================================================================
+class RuleEngine:
+    """
+    Monitoring rules loaded from a JSON file ({"rules": [...],
+    "correlations": [...]}) and compiled into one PatternMatcher per console.
+
+    Actions and conditions are named callables supplied by the host
+    (`actions[name](hit, *args)`, `conditions[name]()`), so a rules file can
+    only combine behaviour the tool already implements. Literals the host
+    needs besides the rules (GUI-selected triggers...) are registered with
+    add_static() and survive reloads. reload_if_changed() picks up edits to
+    the file while a run is going; a broken file is reported through
+    `on_error` and the previous rules stay active. Hit counts are kept per
+    rule name across reloads, correlation state starts over.
+
+    evaluate() may run on the monitor thread while the host calls expire()
+    and reset() from others; actions always run outside the lock. match()
+    and the matcher swaps of apply() / remove_static() share the lock, so
+    the per-console line counters carried over to a rebuilt matcher lose
+    no count. match(count=False) takes no lock: it reads the current
+    `matchers` dict, which is only ever replaced whole with compiled
+    matchers, so a reader thread never waits behind a reload.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        actions: Dict[str, Callable[..., None]],
+        conditions: Optional[Dict[str, Callable[[], bool]]] = None,
+        consoles: Optional[List[str]] = None,
+        check_interval: float = 2.0,
+        on_error: Optional[Callable[[str], None]] = None,
+    ):
+        self.path = path
+        self.actions = actions
+        self.conditions = conditions or {}
+        self.consoles = list(consoles or [])
+        self.check_interval = check_interval
+        self.on_error = on_error
+        self.rules: Dict[str, List[Rule]] = {}
+        self.correlations: List[Correlation] = []
+        self.matchers: Dict[str, PatternMatcher] = {}
+        self.counts: Dict[str, int] = {}
+        self.loaded_mtime: Optional[float] = None
+        self._static: Dict[str, List[Tuple[str, object]]] = {}
+        self._by_console: Dict[str, List[Correlation]] = {}
+        self._windows: List[Correlation] = []
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def add_static(self, console: str, literal: str, tag: object = None):
+        with self._lock:
+            self._static.setdefault(console, []).append((literal, tag))
+            if console not in self.consoles:
+                self.consoles.append(console)
+
+    def load(self):
+        """(Re)load the rules file; raises RuleError/OSError and keeps the old rules on failure."""
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+                specs = data["rules"]
+                correlations = data.get("correlations", [])
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                raise RuleError(f"{self.path}: {e}") from None
+        self.apply(specs, correlations)
+        self.loaded_mtime = mtime
+
+    def _check_refs(self, what: str, actions: List[List], when: List[str]):
+        for action in actions:
+            if not action or action[0] not in self.actions:
+                raise RuleError(f"{what}: unknown action {action!r}")
+        for cond in when:
+            if cond not in self.conditions:
+                raise RuleError(f"{what}: unknown condition {cond!r}")
+
+    def apply(self, specs: List[Dict], correlation_specs: Optional[List[Dict]] = None):
+        """Compile and activate rule and correlation specs (raises RuleError, old rules stay active)."""
+        rules: Dict[str, List[Rule]] = {}
+        correlations: List[Correlation] = []
+        if not isinstance(specs, list) or not isinstance(correlation_specs or [], list):
+            raise RuleError("rules and correlations must be lists")
+        names = set()
+        for index, spec in enumerate(specs):
+            rule = Rule(spec, index)
+            if rule.name in names:
+                raise RuleError(f"rule {rule.name}: duplicate name")
+            names.add(rule.name)
+            self._check_refs(f"rule {rule.name}", rule.actions, rule.when)
+            rules.setdefault(rule.console, []).append(rule)
+        for index, spec in enumerate(correlation_specs or []):
+            correlation = Correlation(spec, index)
+            if correlation.name in names:
+                raise RuleError(f"correlation {correlation.name}: duplicate name")
+            names.add(correlation.name)
+            self._check_refs(f"correlation {correlation.name}", correlation.actions, correlation.when)
+            correlations.append(correlation)
+
+        by_console: Dict[str, List[Correlation]] = {}
+        for correlation in correlations:
+            for console in dict.fromkeys(step.console for step in correlation.steps):
+                by_console.setdefault(console, []).append(correlation)
+        with self._lock:
+            matchers = {console: self._build_matcher(console, rules, by_console)
+                        for console in set(self.consoles) | set(rules) | set(by_console)}
+            for item in [rule for console_rules in rules.values() for rule in console_rules] + correlations:
+                item.hits = self.counts.get(item.name, 0)
+            # readers pick up the new dicts on their next line
+            self.rules = rules
+            self.correlations = correlations
+            self._by_console = by_console
+            self._windows = [c for c in correlations if c.kind == "absence"]
+            self._swap_matchers(matchers)
+
+    def _build_matcher(self, console: str, rules: Dict[str, List[Rule]],
+                       by_console: Dict[str, List[Correlation]]) -> PatternMatcher:
+        matcher = PatternMatcher()
+        for rule in rules.get(console, []):
+            matcher.add(rule.pattern, rule.name)
+        for correlation in by_console.get(console, []):
+            for step in correlation.steps:
+                if step.console == console:
+                    matcher.add(step.pattern, correlation.name)
+        for literal, tag in self._static.get(console, []):
+            matcher.add(literal, tag)
+        matcher.compile()
+        return matcher
+
+    def _swap_matchers(self, matchers: Dict[str, PatternMatcher]):
+        """Activate `matchers`, keeping the line counters of the ones they replace (lock held)."""
+        for console, matcher in matchers.items():
+            old = self.matchers.get(console)
+            if old is not None and old is not matcher:
+                matcher.lines, matcher.passed = old.lines, old.passed
+        self.matchers = matchers
+
+    def remove_static(self, console: str, literal: str, tag: object = None):
+        """Drop a literal registered with add_static() and recompile that console's matcher."""
+        with self._lock:
+            static = self._static.get(console, [])
+            if (literal, tag) not in static:
+                return
+            static.remove((literal, tag))
+            matchers = dict(self.matchers)
+            matchers[console] = self._build_matcher(console, self.rules, self._by_console)
+            self._swap_matchers(matchers)
+
+    def reload_if_changed(self, now: Optional[float] = None) -> bool:
+        now = time.perf_counter() if now is None else now
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+        try:
+            if os.stat(self.path).st_mtime == self.loaded_mtime:
+                return False
+            self.load()
+        except (OSError, RuleError) as e:
+            if self.on_error is not None:
+                self.on_error(str(e))
+            # do not retry the same broken file every interval
+            try:
+                self.loaded_mtime = os.stat(self.path).st_mtime
+            except OSError:
+                pass
+            return False
+        return True
+
+    def match(self, console: str, line: str, count: bool = True) -> FrozenSet[str]:
+        if not count:
+            matcher = self.matchers.get(console)
+            return matcher.match(line, count=False) if matcher is not None else NO_HITS
+        with self._lock:
+            matcher = self.matchers.get(console)
+            return matcher.match(line) if matcher is not None else NO_HITS
+
+    def _fire(self, item, console: str, line: str, timestamp: str):
+        with self._lock:
+            item.hits += 1
+            self.counts[item.name] = item.hits
+        hit = RuleHit(item, console, line, timestamp)
+        for action in item.actions:
+            try:
+                self.actions[action[0]](hit, *action[1:])
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(f"{item.name}: action {action[0]} failed: {e}")
+
+    def _when(self, correlation: Correlation) -> bool:
+        return all(self.conditions[cond]() for cond in correlation.when)
+
+    def evaluate(self, console: str, line: str, hits: FrozenSet[str], timestamp: str = "",
+                 now: Optional[float] = None) -> List[object]:
+        """
+        Run the actions of every rule and correlation that fires for this
+        line (`now` is the line's capture time); returns those that fired.
+        """
+        if not hits:
+            return []
+        fired = []
+        done_groups = set()
+        for rule in self.rules.get(console, ()):
+            if rule.pattern not in hits or (rule.group is not None and rule.group in done_groups):
+                continue
+            if not rule.applies(line, self.conditions):
+                if rule.stop and rule.group is not None:
+                    done_groups.add(rule.group)
+                continue
+            if rule.group is not None:
+                done_groups.add(rule.group)
+            self._fire(rule, console, line, timestamp)
+            fired.append(rule)
+
+        correlations = self._by_console.get(console)
+        if correlations:
+            now = time.perf_counter() if now is None else now
+            completed = []
+            with self._lock:
+                for correlation in correlations:
+                    if correlation.feed(console, line, hits, now):
+                        completed.append(correlation)
+                    elif correlation.kind == "absence":
+                        correlation.open_window(console, line, hits, now, timestamp)
+            for correlation in completed:
+                if self._when(correlation):
+                    self._fire(correlation, console, line, timestamp)
+                    fired.append(correlation)
+        return fired
+
+    def expire(self, now: Optional[float] = None) -> List[Correlation]:
+        """Fire the absence correlations whose window has run out; call it periodically."""
+        if not self._windows:
+            return []
+        now = time.perf_counter() if now is None else now
+        expired = []
+        with self._lock:
+            for correlation in self._windows:
+                anchor = correlation.expired(now)
+                if anchor is not None:
+                    expired.append((correlation, anchor))
+        fired = []
+        for correlation, (console, line, timestamp) in expired:
+            if self._when(correlation):
+                self._fire(correlation, console, line, timestamp)
+                fired.append(correlation)
+        return fired
+
+    def reset(self, signal: str):
+        """Clear the state of the correlations that list `signal` in reset_on."""
+        with self._lock:
+            for correlation in self.correlations:
+                if signal in correlation.reset_on:
+                    correlation.reset()
+
+    def filter_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per console: lines matched, lines past the pre-filter and their ratio."""
+        return {console: matcher.stats() for console, matcher in self.matchers.items()}
+
+    def stats(self) -> Dict[str, int]:
+        """Hits per rule/correlation name (ones removed by a reload keep their count)."""
+        with self._lock:
+            return dict(self.counts)
+
+
+# =============================================================================
+# One-shot metadata extractors
+# =============================================================================
+class Extractor:
+    """
+    Pulls run metadata out of one kind of line: `literal` on `console`,
+    `parse(line)` -> {field: value} or None when the line is not usable.
+    """
+
+    __slots__ = ("name", "console", "literal", "parse")
+
+    def __init__(self, name: str, console: str, literal: str, parse: Callable[[str], Optional[Dict[str, str]]]):
+        self.name = name
+        self.console = console
+        self.literal = literal
+        self.parse = parse
+
+
+class ExtractorRegistry:
+    """
+    Extractors for test-environment info (firmware versions, HW variant...)
+    that retire once they have captured their value.
+
+    The host registers each extractor's literal with its per-line matcher
+    and calls feed() only for lines whose hits contain it; the first line
+    that parses stores the fields, retires the extractor and calls
+    `on_retire(extractor)` so the host can drop the literal (RuleEngine.
+    remove_static()), after which the extractor costs nothing per line.
+    Values are saved to `path` as JSON on every capture and load() prefills
+    them at the next start, so reports show them before the first boot;
+    the extractors still run once per run to pick up a changed target.
+    """
+
+    def __init__(self, path: Optional[str] = None, on_retire: Optional[Callable[[Extractor], None]] = None):
+        self.path = path
+        self.on_retire = on_retire
+        self.values: Dict[str, str] = {}
+        self._active: Dict[str, List[Extractor]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, extractor: Extractor):
+        self._active.setdefault(extractor.console, []).append(extractor)
+
+    def active(self) -> List[Extractor]:
+        return [extractor for extractors in self._active.values() for extractor in extractors]
+
+    def get(self, field: str, default: str = "-") -> str:
+        return self.values.get(field, default)
+
+    def set(self, values: Dict[str, str]):
+        with self._lock:
+            self.values.update(values)
+        self.save()
+
+    def feed(self, console: str, line: str, hits: FrozenSet[str]) -> Optional[Extractor]:
+        """Run the extractors whose literal is in `hits`; returns the one that captured."""
+        for extractor in self._active.get(console, ()):
+            if extractor.literal not in hits:
+                continue
+            try:
+                values = extractor.parse(line)
+            except (ValueError, IndexError, UnicodeError):
+                values = None
+            if not values:
+                continue
+            with self._lock:
+                active = self._active[console]
+                if extractor not in active:
+                    return None
+                # a new list, so a concurrent feed() keeps iterating the old one
+                self._active[console] = [other for other in active if other is not extractor]
+            self.set(values)
+            if self.on_retire is not None:
+                self.on_retire(extractor)
+            return extractor
+        return None
+
+    def load(self):
+        """Prefill values saved by an earlier run (a missing or broken file is ignored)."""
+        if self.path is None:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                values = json.load(f)["values"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        if isinstance(values, dict):
+            self.values.update({str(k): str(v) for k, v in values.items()})
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        if path is None:
+            return
+        with self._lock:
+            data = {"values": dict(self.values)}
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+
+# =============================================================================
+# Trigger waits
+# =============================================================================
+class TriggerEvent:
+    """
+    A trigger log the test sequence blocks on.
+
+    arm() starts a new wait and forgets the previous hit. fire() is called
+    by the monitor with the capture time of the matching line; the first
+    call after arm() records it and wakes the waiter. Later calls, calls
+    while not armed and lines captured before arm() (still queued in the
+    log pipeline) are ignored, so a stale line cannot complete the next
+    wait. wait() returns that capture time, or None on timeout.
+    """
+
+    def __init__(self):
+        self.stamp: Optional[float] = None
+        self.line: Optional[str] = None
+        self._armed = False
+        self._armed_at = float("-inf")
+        self._cond = threading.Condition()
+
+    def arm(self, now: Optional[float] = None):
+        """Start a wait for lines captured at `now` (time.perf_counter(), default: the current time) or later."""
+        with self._cond:
+            self._armed = True
+            self._armed_at = time.perf_counter() if now is None else now
+            self.stamp = self.line = None
+
+    def disarm(self):
+        with self._cond:
+            self._armed = False
+
+    @property
+    def waiting(self) -> bool:
+        return self._armed and self.stamp is None
+
+    def fire(self, stamp: float, line: str = "") -> bool:
+        with self._cond:
+            if not self._armed or self.stamp is not None or stamp < self._armed_at:
+                return False
+            self.stamp, self.line = stamp, line
+            self._cond.notify_all()
+            return True
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[float]:
+        with self._cond:
+            self._cond.wait_for(lambda: self.stamp is not None, timeout)
+            return self.stamp
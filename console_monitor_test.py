@@ -0,0 +1,305 @@
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import unittest
+
+import console_monitor as mod
+
+
+class TestPatternMatcher(unittest.TestCase):
+
+    LITERALS = [
+        "PMT:ASEE T.O.", "I:1:PMT:ASEE T.O.", "PMT:ASEE High",
+        "devctl(STR) result: 11", "devctl(STR) result: 120", "devctl(STR) result: -",
+        "OemPm I [KPI]str_ctrl() devctl(STR) result: 0", "ab", "abc", "b",
+    ]
+
+    def matcher(self):
+        m = mod.PatternMatcher()
+        m.extend(self.LITERALS, "monitor")
+        return m
+
+    def test_same_result_as_separate_in_tests(self):
+        m = self.matcher()
+        rnd = random.Random(1)
+        pieces = self.LITERALS + ["x", " ", "PMT:", "devctl(STR) result: 1"]
+        for _ in range(2000):
+            line = "".join(rnd.choice(pieces) for _ in range(rnd.randint(0, 6)))
+            self.assertEqual(m.match(line), {lit for lit in self.LITERALS if lit in line}, line)
+
+    def test_no_hit_returns_shared_empty_set(self):
+        self.assertIs(self.matcher().match("ordinary line"), mod.NO_HITS)
+        self.assertIs(mod.PatternMatcher().match("PMT:ASEE High"), mod.NO_HITS)
+
+    def test_tags_in_registration_order(self):
+        m = self.matcher()
+        m.add("PMT:ASEE High", "trigger")
+        hits = m.match("I:1:PMT:ASEE High")
+        self.assertEqual(m.tagged(hits), [("monitor", "PMT:ASEE High"), ("trigger", "PMT:ASEE High")])
+
+    def test_trie_pattern_matches_longest_literal(self):
+        pattern = mod.trie_pattern(["PMT:ASEE T.O.", "PMT:ASEE High", "ab", "abc"])
+        self.assertEqual(pattern, r"(?:PMT:ASEE\ (?:High|T\.O\.)|ab(?:c)?)")
+        self.assertEqual(re.findall(pattern, "abcd ab PMT:ASEE High"), ["abc", "ab", "PMT:ASEE High"])
+
+    def test_filter_stats(self):
+        m = self.matcher()
+        for line in ["slog2info", "PMT:ASEE High", "x", "VHM:APSROn"]:
+            m.match(line)
+        self.assertEqual(m.stats(), {"lines": 4, "passed": 1, "ratio": 0.25})
+
+    def test_add_after_match_recompiles(self):
+        m = self.matcher()
+        self.assertEqual(m.match("VHM:APSROn"), set())
+        m.add("VHM:APSROn")
+        self.assertEqual(m.match("VHM:APSROn"), {"VHM:APSROn"})
+
+
+class TestRuleEngine(unittest.TestCase):
+
+    RULES = [
+        {"name": "r11", "console": "qnx", "pattern": "result: 11", "group": "qnx", "actions": [["log"]]},
+        {"name": "core", "console": "qnx", "pattern": "dumping to", "require": [".core"], "group": "qnx",
+         "actions": [["log"]]},
+        {"name": "fmt", "console": "qnx", "pattern": "Format:", "when": ["running"], "group": "qnx",
+         "actions": [["log"], ["set", "task", "error"]]},
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "rules.json")
+        self.write(self.RULES)
+        self.logged, self.state, self.errors = [], {"running": False}, []
+        self.engine = mod.RuleEngine(
+            self.path,
+            actions={"log": lambda hit: self.logged.append((hit.rule.name, hit.line)),
+                     "set": lambda hit, key, value: self.state.__setitem__(key, value)},
+            conditions={"running": lambda: self.state["running"]},
+            consoles=["qnx", "ucom"],
+            on_error=self.errors.append,
+        )
+        self.engine.add_static("ucom", "VHM:APSROn", "trigger")
+        self.engine.load()
+
+    def write(self, rules, mtime=None):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"rules": rules}, f)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def feed(self, console, line):
+        return [r.name for r in self.engine.evaluate(console, line, self.engine.match(console, line))]
+
+    def test_group_fires_first_applicable_rule_only(self):
+        self.assertEqual(self.feed("qnx", "dumping to /var/log/x.txt result: 11"), ["r11"])
+        self.assertEqual(self.feed("qnx", "dumping to /var/log/x.txt"), [])
+        self.assertEqual(self.feed("qnx", "Format: Log Type"), [])
+        self.state["running"] = True
+        self.assertEqual(self.feed("qnx", "Format: Log Type"), ["fmt"])
+        self.assertEqual(self.state["task"], "error")
+        self.assertEqual(self.engine.stats(), {"r11": 1, "fmt": 1})
+
+    def test_stop_rules_end_the_chain_like_elif(self):
+        def old_chain(line, running):
+            if "dumping to" in line:
+                if ".core" in line:
+                    return ["core"]
+            elif "Format:" in line:
+                if running:
+                    return ["fmt"]
+            elif "result: 11" in line:
+                return ["r11"]
+            return []
+
+        core, fmt = (dict(rule, stop=True) for rule in self.RULES[1:])
+        self.engine.apply([core, fmt, self.RULES[0]])
+        pieces = ["dumping to /var/log/x", ".core", "Format: Log Type", "result: 11"]
+        for mask in range(1, 1 << len(pieces)):
+            line = " ".join(p for i, p in enumerate(pieces) if mask >> i & 1)
+            for running in (False, True):
+                self.state["running"] = running
+                self.assertEqual(self.feed("qnx", line), old_chain(line, running), (line, running))
+
+    def test_static_literals_are_matched(self):
+        self.assertEqual(self.engine.match("ucom", "VHM:APSROn"), {"VHM:APSROn"})
+
+    def test_filter_stats_survive_reload(self):
+        self.engine.match("qnx", "result: 11")
+        self.engine.match("qnx", "slog2info")
+        self.engine.apply(self.RULES[:1])
+        self.engine.match("qnx", "slog2info")
+        self.assertEqual(self.engine.filter_stats()["qnx"]["lines"], 3)
+        self.assertEqual(self.engine.filter_stats()["qnx"]["passed"], 1)
+
+    def test_uncounted_match_takes_no_lock(self):
+        with self.engine._lock:
+            self.assertEqual(self.engine.match("qnx", "result: 11", count=False), {"result: 11"})
+            self.assertEqual(self.engine.match("qnx", "slog2info", count=False), frozenset())
+        self.assertEqual(self.engine.filter_stats()["qnx"]["lines"], 0)
+
+    def test_hot_reload_keeps_counts_and_survives_broken_file(self):
+        self.feed("qnx", "result: 11")
+        mtime = os.stat(self.path).st_mtime
+        self.write(self.RULES + [{"name": "retry", "console": "qnx", "pattern": "str_ctrl_retry",
+                                  "actions": [["log"]]}], mtime + 10)
+        self.assertTrue(self.engine.reload_if_changed(now=100.0))
+        self.assertEqual(self.feed("qnx", "str_ctrl_retry result: 11"), ["r11", "retry"])
+        self.assertEqual(self.engine.stats()["r11"], 2)
+
+        self.write([{"name": "bad", "console": "qnx", "pattern": "x", "actions": [["reboot"]]}], mtime + 20)
+        self.assertFalse(self.engine.reload_if_changed(now=200.0))
+        self.assertEqual(len(self.errors), 1)
+        self.assertEqual(self.feed("qnx", "str_ctrl_retry"), ["retry"])
+        self.assertFalse(self.engine.reload_if_changed(now=300.0))  # same broken file is not re-reported
+        self.assertEqual(len(self.errors), 1)
+
+    def test_reload_is_rate_limited(self):
+        self.write(self.RULES[:1], os.stat(self.path).st_mtime + 10)
+        self.assertTrue(self.engine.reload_if_changed(now=100.0))
+        self.write(self.RULES, os.stat(self.path).st_mtime + 10)
+        self.assertFalse(self.engine.reload_if_changed(now=101.0))
+        self.assertTrue(self.engine.reload_if_changed(now=102.0))
+
+
+class TestCorrelations(unittest.TestCase):
+
+    CORRELATIONS = [
+        {"name": "seq", "kind": "sequence", "within": 2,
+         "steps": [{"console": "ucom", "pattern": "VHM:DSEn"}, {"console": "qnx", "pattern": "STARTUP to RUN"}],
+         "actions": [["log"]]},
+        {"name": "silent", "kind": "absence", "within": 30,
+         "steps": [{"console": "ucom", "pattern": "VHM:APSROn"}, {"console": "qnx", "pattern": "POWER_STATE_ON"}],
+         "actions": [["log"]]},
+        {"name": "asee", "kind": "missing", "reset_on": ["acc_off"],
+         "steps": [{"console": "android", "pattern": "Interrupt disabled", "require": ["Sleep"]},
+                   {"console": "android", "pattern": "Interrupt disabled", "require": ["0xAA03"]},
+                   {"console": "ucom", "pattern": "PMT:ASEE T.O."}],
+         "actions": [["log"]]},
+    ]
+
+    def setUp(self):
+        self.logged = []
+        self.engine = mod.RuleEngine("unused.json", actions={"log": lambda hit: self.logged.append(
+            (hit.rule.name, hit.line))})
+        self.engine.apply([], self.CORRELATIONS)
+
+    def feed(self, console, line, now):
+        hits = self.engine.match(console, line)
+        return [c.name for c in self.engine.evaluate(console, line, hits, now=now)]
+
+    def test_sequence_within_window(self):
+        self.assertEqual(self.feed("ucom", "VHM:DSEn", 10.0), [])
+        self.assertEqual(self.feed("qnx", "STARTUP to RUN", 12.5), [])  # too late
+        self.feed("ucom", "VHM:DSEn", 20.0)
+        self.feed("ucom", "VHM:DSEn", 21.0)  # the latest start counts
+        self.assertEqual(self.feed("qnx", "SYS_MAIN:stat_change STARTUP to RUN", 22.5), ["seq"])
+        self.assertEqual(self.feed("qnx", "STARTUP to RUN", 22.6), [])  # consumed
+
+    def test_absence_fires_when_window_runs_out(self):
+        self.feed("ucom", "VHM:APSROn", 100.0)
+        self.feed("qnx", "POWER_STATE_ON", 110.0)
+        self.assertEqual(self.engine.expire(200.0), [])
+        self.feed("ucom", "VHM:APSROn", 300.0)
+        self.feed("ucom", "VHM:APSROn", 320.0)  # does not extend the window
+        self.assertEqual(self.engine.expire(329.0), [])
+        self.assertEqual([c.name for c in self.engine.expire(331.0)], ["silent"])
+        self.assertEqual(self.logged, [("silent", "VHM:APSROn")])
+        self.assertEqual(self.engine.expire(400.0), [])
+
+    def test_missing_lines_since_reset(self):
+        self.feed("android", "Interrupt disabled successfully Sleep", 1.0)
+        self.assertEqual(self.feed("ucom", "I:1:PMT:ASEE T.O.", 2.0), ["asee"])
+        self.feed("android", "Interrupt disabled successfully 0xAA030000", 3.0)
+        self.assertEqual(self.feed("ucom", "PMT:ASEE T.O.", 4.0), [])
+        self.engine.reset("acc_off")
+        self.assertEqual(self.feed("ucom", "PMT:ASEE T.O.", 5.0), ["asee"])
+        self.assertEqual(self.engine.stats(), {"asee": 2})
+
+    def test_invalid_specs(self):
+        for spec in ({"kind": "absence", "steps": self.CORRELATIONS[1]["steps"]},
+                     {"kind": "later", "steps": self.CORRELATIONS[0]["steps"]},
+                     {"kind": "sequence", "steps": self.CORRELATIONS[0]["steps"][:1]},
+                     {"kind": "sequence", "steps": self.CORRELATIONS[0]["steps"], "actions": [["reboot"]]}):
+            with self.assertRaises(mod.RuleError):
+                self.engine.apply([], [spec])
+        with self.assertRaises(mod.RuleError):
+            self.engine.apply([{"name": "seq", "console": "qnx", "pattern": "x"}], self.CORRELATIONS)
+
+
+class TestExtractorRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "env_info.json")
+        self.engine = mod.RuleEngine("unused.json", actions={}, consoles=["ucom"])
+        self.registry = mod.ExtractorRegistry(
+            self.path, on_retire=lambda ext: self.engine.remove_static(ext.console, ext.literal, "extract"))
+        for ext in (mod.Extractor("system_ucom", "ucom", "I:2:BTM:Sys:",
+                                  lambda line: {"system_ucom": line.split("I:2:BTM:Sys:")[1]}),
+                    mod.Extractor("fcp", "ucom", "I:2:FCP:R:VC=0x",
+                                  lambda line: {"fcp": bytes.fromhex(line.split("=0x")[1][:-3]).decode("ascii")})):
+            self.registry.add(ext)
+            self.engine.add_static(ext.console, ext.literal, "extract")
+        self.engine.apply([])
+
+    def feed(self, line):
+        return self.registry.feed("ucom", line, self.engine.match("ucom", line))
+
+    def test_retires_after_capture_and_persists(self):
+        self.assertIsNone(self.feed("I:2:FCP:R:VC=0xzz.00"))  # unparsable, stays active
+        self.assertEqual(self.feed("I:2:FCP:R:VC=0x334d414130.00").name, "fcp")
+        self.assertEqual(self.registry.get("fcp"), "3MAA0")
+        self.assertEqual(self.engine.match("ucom", "I:2:FCP:R:VC=0x3030.00"), mod.NO_HITS)
+        self.assertEqual([e.name for e in self.registry.active()], ["system_ucom"])
+
+        later = mod.ExtractorRegistry(self.path)
+        later.load()
+        self.assertEqual(later.get("fcp"), "3MAA0")
+        self.assertEqual(later.get("system_ucom"), "-")
+
+
+class TestTriggerEvent(unittest.TestCase):
+
+    def test_ignores_lines_until_armed(self):
+        ev = mod.TriggerEvent()
+        self.assertFalse(ev.fire(1.0, "PMT:ASEE High"))
+        self.assertIsNone(ev.wait(0))
+        ev.arm(1.5)
+        self.assertTrue(ev.waiting)
+        self.assertTrue(ev.fire(2.0, "PMT:ASEE High"))
+        self.assertFalse(ev.fire(3.0, "PMT:ASEE High"))
+        self.assertEqual((ev.wait(0), ev.line), (2.0, "PMT:ASEE High"))
+        ev.arm(3.5)
+        self.assertIsNone(ev.wait(0))
+
+    def test_line_captured_before_arm_does_not_complete_the_wait(self):
+        ev = mod.TriggerEvent()
+        queued = time.perf_counter()
+        ev.arm()
+        self.assertFalse(ev.fire(queued, "PMT:ASEE High"))
+        self.assertIsNone(ev.wait(0))
+        self.assertTrue(ev.waiting)
+        self.assertTrue(ev.fire(time.perf_counter(), "PMT:ASEE High"))
+
+    def test_wakes_blocked_waiter(self):
+        ev = mod.TriggerEvent()
+        ev.arm()
+        woke = []
+        t = threading.Thread(target=lambda: woke.append((ev.wait(5.0), time.perf_counter())))
+        t.start()
+        time.sleep(0.05)
+        fired = time.perf_counter()
+        ev.fire(fired, "VHM:APSROn")
+        t.join()
+        self.assertEqual(woke[0][0], fired)
+        self.assertLess(woke[0][1] - fired, 0.05)  # no 100 ms polling step
+
+
+if __name__ == "__main__":
+    unittest.main()
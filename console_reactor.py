@@ -0,0 +1,604 @@
+# -*- coding: utf-8 -*-
+"""
+Single-thread console reactor for the suspend/resume test tools.
+
+Every console UART (uCom / QNX / Android / SAIL) and the pika-pachi port is
+read on one loop instead of one polling thread per port:
+  - reads pull everything waiting on the port in one call (no readline())
+    and split it into lines with console_io.LineSplitter; every line of a
+    chunk carries the chunk's time.perf_counter() arrival time,
+  - a port that fails is closed and reopened with a backoff that starts at
+    `first_retry` and doubles up to `retry_wait` seconds; a PortSupervisor
+    watching the USB-serial enumeration reopens it as soon as it reappears.
+
+Commands go out through one PortWriter thread per port, so a queued command
+is written as soon as it is put instead of on the reader's next pass. Slow
+line-edit consoles (SAIL) can be echo-paced: each piece is written as soon
+as the console has echoed the previous one.
+
+On POSIX the loop blocks in a selector on the port descriptors. Windows COM
+ports have no descriptor, so there the loop falls back to a short idle wait.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import selectors
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import serial
+from serial import SerialException
+
+from serial.tools import list_ports
+
+from console_io import Backoff, LineSplitter, PortHealth
+
+# (bytes to write, seconds to wait before the next piece may be written)
+WritePiece = Tuple[bytes, float]
+
+
+class CommandRecord:
+    """Timing of one command: taken off the queue, written, echoed back (time.perf_counter() seconds)."""
+
+    __slots__ = ("text", "picked", "started", "sent", "echoed", "pieces", "fallbacks")
+
+    def __init__(self, text: str, picked: float, pieces: int = 1):
+        self.text = text
+        self.picked = picked
+        self.started: Optional[float] = None
+        self.sent: Optional[float] = None
+        self.echoed: Optional[float] = None
+        self.pieces = pieces
+        self.fallbacks = 0
+
+    def chars_per_sec(self) -> Optional[float]:
+        """Write rate of a multi-piece command, first piece to last."""
+        if self.started is None or self.sent is None or self.sent <= self.started:
+            return None
+        return self.pieces / (self.sent - self.started)
+
+    def echo_ms(self) -> Optional[float]:
+        if self.sent is None or self.echoed is None:
+            return None
+        return (self.echoed - self.sent) * 1000
+
+
+class Console:
+    """One serial port served by the reactor."""
+
+    def __init__(
+        self,
+        name: str,
+        port_name: str,
+        baudrate: int,
+        on_line: Optional[Callable[[str, str, float], None]] = None,
+        on_chunk: Optional[Callable[[str, bytes, float], None]] = None,
+        write_queue: Optional[queue.Queue] = None,
+        encode: Optional[Callable[[object], List[WritePiece]]] = None,
+        on_error: Optional[Callable[[str, Exception], None]] = None,
+        silence_timeout: Optional[float] = None,
+        on_silence: Optional[Callable[[str], None]] = None,
+        drop_when_closed: bool = False,
+        track_echo: bool = True,
+        on_sent: Optional[Callable[[str, CommandRecord], None]] = None,
+        on_echo: Optional[Callable[[str, CommandRecord], None]] = None,
+        on_reopen: Optional[Callable[[str, float], None]] = None,
+        echo_paced: bool = False,
+        pace_min_gap: float = 0.0,
+        **serial_kwargs,
+    ):
+        self.name = name
+        self.port_name = port_name
+        self.baudrate = baudrate
+        self.on_line = on_line
+        self.on_chunk = on_chunk
+        self.write_queue = write_queue
+        self.encode = encode
+        self.on_error = on_error
+        self.silence_timeout = silence_timeout
+        self.on_silence = on_silence
+        self.drop_when_closed = drop_when_closed
+        self.track_echo = track_echo
+        self.on_sent = on_sent
+        self.on_echo = on_echo
+        self.on_reopen = on_reopen
+        self.echo_paced = echo_paced
+        self.pace_min_gap = pace_min_gap
+        self.serial_kwargs = serial_kwargs
+
+        self.ser: Optional[serial.Serial] = None
+        self.opened = threading.Event()
+        self.reopen_requested = False
+        self.retry_at = 0.0
+        self.backoff = Backoff()
+        self.health = PortHealth()
+        self.last_rx = time.perf_counter()
+        self.splitter = LineSplitter()
+        self.writer: Optional[PortWriter] = None
+
+
+class PortWriter:
+    """
+    Dedicated writer thread for one console.
+
+    Blocks in write_queue.get() and writes as soon as an item is put;
+    put()/join()/task_done() keep their usual meaning for the callers. The
+    pieces returned by `encode` go out in order with their gap in between.
+    The last `history` commands are kept as CommandRecords, and for consoles
+    with `track_echo` the reactor stamps `echoed` when the command text comes
+    back on the same port within `echo_timeout` seconds.
+
+    With `echo_paced` the gap of each piece becomes a fallback timeout: the
+    next piece goes out once the previous one has been echoed (but never
+    sooner than `pace_min_gap` after it), or when the gap runs out.
+    """
+
+    def __init__(self, reactor: "ConsoleReactor", console: Console, echo_timeout: float = 5.0, history: int = 200):
+        self.reactor = reactor
+        self.console = console
+        self.echo_timeout = echo_timeout
+        self.history: Deque[CommandRecord] = deque(maxlen=history)
+        self._awaiting: List[CommandRecord] = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.pacing = False
+        self._rx = bytearray()
+        self._rx_event = threading.Event()
+        self.paced_chars = 0
+        self.paced_seconds = 0.0
+        self.paced_fallbacks = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    def awaiting_echo(self) -> bool:
+        return bool(self._awaiting)
+
+    def pace_rate(self) -> Optional[float]:
+        """Characters/sec over every echo-paced command so far."""
+        if not self.paced_seconds:
+            return None
+        return self.paced_chars / self.paced_seconds
+
+    def feed_raw(self, data: bytes):
+        """Reactor side: raw bytes received while a paced command is being written."""
+        with self._lock:
+            self._rx += data
+        self._rx_event.set()
+
+    def match_echo(self, line: str, arrival: float):
+        """Reactor side: check one received line against the commands still waiting for their echo."""
+        matched = None
+        with self._lock:
+            for record in list(self._awaiting):
+                if record.sent is not None and arrival - record.sent > self.echo_timeout:
+                    self._awaiting.remove(record)
+                elif matched is None and record.text in line:
+                    record.echoed = arrival
+                    self._awaiting.remove(record)
+                    matched = record
+        if matched is not None:
+            self._notify(self.console.on_echo, matched)
+
+    def _run(self):
+        write_queue = self.console.write_queue
+        while not self._stop_event.is_set():
+            try:
+                item = write_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._send(item)
+            finally:
+                write_queue.task_done()
+
+    def _send(self, item):
+        console = self.console
+        picked = time.perf_counter()
+        try:
+            pieces = console.encode(item) if console.encode else []
+        except UnicodeEncodeError:
+            pieces = []
+        if not pieces:
+            return
+
+        # a closed port holds the command until the reactor has reopened it,
+        # except for consoles (pika) where a late command is worse than none
+        while not console.opened.wait(0 if console.drop_when_closed else 0.5):
+            if console.drop_when_closed or self._stop_event.is_set():
+                self.reactor.report(console, SerialException(f"{console.port_name} not open, command dropped"))
+                return
+
+        text = b"".join(data for data, _ in pieces).decode("utf-8", "replace").strip()
+        record = CommandRecord(text, picked, len(pieces))
+        paced = console.echo_paced and len(pieces) > 1
+        self.pacing = paced
+        try:
+            ser = console.ser
+            last = len(pieces) - 1
+            for index, (data, gap) in enumerate(pieces):
+                if paced:
+                    with self._lock:
+                        self._rx.clear()
+                if index == last:
+                    # the echo can come back before write() returns
+                    self._expect_echo(record)
+                try:
+                    ser.write(data)
+                except (SerialException, OSError, AttributeError) as e:
+                    with self._lock:
+                        if record in self._awaiting:
+                            self._awaiting.remove(record)
+                    self.reactor.request_reopen(console, e)
+                    return
+                written = time.perf_counter()
+                if index == 0:
+                    record.started = written
+                if index == last:
+                    self._sent(record, written)
+                if paced:
+                    if not self._wait_echo(data, written + gap):
+                        record.fallbacks += 1
+                    rest = written + console.pace_min_gap - time.perf_counter()
+                    if rest > 0:
+                        self._stop_event.wait(rest)
+                elif gap:
+                    self._stop_event.wait(gap)
+        finally:
+            self.pacing = False
+        if paced:
+            self.paced_chars += record.pieces
+            self.paced_seconds += record.sent - record.started
+            self.paced_fallbacks += record.fallbacks
+
+    def _expect_echo(self, record: CommandRecord):
+        if self.console.track_echo and record.text:
+            with self._lock:
+                self._awaiting.append(record)
+
+    def _sent(self, record: CommandRecord, sent: float):
+        record.sent = sent
+        self.history.append(record)
+        self._notify(self.console.on_sent, record)
+
+    def _wait_echo(self, data: bytes, deadline: float) -> bool:
+        """Wait until `data` has come back (any line end for CR/LF), or the deadline passes."""
+        line_end = data in (b"\r", b"\n", b"\r\n")
+        while True:
+            with self._lock:
+                if (b"\r" in self._rx or b"\n" in self._rx) if line_end else data in self._rx:
+                    return True
+                self._rx_event.clear()
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or self._stop_event.is_set():
+                return False
+            self._rx_event.wait(remaining)
+
+    def _notify(self, callback, record: CommandRecord):
+        if callback is None:
+            return
+        try:
+            callback(self.console.name, record)
+        except Exception as e:
+            print(f"[{self.console.name}] command callback error: {e}")
+
+
+class ConsoleReactor:
+    """
+    Read all registered consoles from one thread; each console with a write
+    queue gets its own PortWriter.
+    """
+
+    def __init__(self, idle_wait: float = 0.01, retry_wait: float = 5.0, first_retry: float = 0.05):
+        self.idle_wait = idle_wait
+        self.retry_wait = retry_wait
+        self.first_retry = first_retry
+        self._consoles: Dict[str, Console] = {}
+        # (console, present) from the PortSupervisor, applied on the reactor thread
+        self._port_events: Deque[Tuple[Console, bool]] = deque()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._wake = threading.Event()
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._wake_r: Optional[int] = None
+        self._wake_w: Optional[int] = None
+        if os.name == "posix":
+            self._selector = selectors.DefaultSelector()
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_r, False)
+            os.set_blocking(self._wake_w, False)
+            self._selector.register(self._wake_r, selectors.EVENT_READ)
+
+    def add_console(self, name: str, port_name: str, baudrate: int, **kwargs) -> Console:
+        """Register a port. Must be called before start()."""
+        console = Console(name, port_name, baudrate, **kwargs)
+        console.backoff = Backoff(self.first_retry, self.retry_wait)
+        if console.write_queue is not None:
+            console.writer = PortWriter(self, console)
+        self._consoles[name] = console
+        return console
+
+    def console(self, name: str) -> Console:
+        return self._consoles[name]
+
+    def consoles(self) -> List[Console]:
+        return list(self._consoles.values())
+
+    def health(self) -> Dict[str, Dict[str, float]]:
+        """Per port: open state, current/total uptime, lost-log windows and seconds."""
+        now = time.perf_counter()
+        return {name: console.health.snapshot(now) for name, console in self._consoles.items()}
+
+    def start(self):
+        # first open pass runs here so commands queued right after start() find their port
+        for console in self._consoles.values():
+            self._open(console)
+        for console in self._consoles.values():
+            if console.writer is not None:
+                console.writer.start()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        for console in self._consoles.values():
+            if console.writer is not None:
+                console.writer.stop()
+        self._stop_event.set()
+        self.notify()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self._wake_r = self._wake_w = None
+
+    def notify(self):
+        """Wake the loop (reopen or stop requested)."""
+        if self._wake_w is not None:
+            try:
+                os.write(self._wake_w, b"\0")
+            except BlockingIOError:
+                pass
+        else:
+            self._wake.set()
+
+    def request_reopen(self, console: Console, error: Exception):
+        """Writer side: a write failed, let the reactor thread close and reopen the port."""
+        console.opened.clear()
+        console.reopen_requested = True
+        self.report(console, error)
+        self.notify()
+
+    def port_event(self, console: Console, present: bool):
+        """Supervisor side: the port's device appeared in / vanished from the system."""
+        self._port_events.append((console, present))
+        self.notify()
+
+    def report(self, console: Console, error: Exception):
+        if console.on_error is not None:
+            try:
+                console.on_error(console.name, error)
+            except Exception as e:
+                print(f"[{console.name}] error handler failed: {e}")
+
+    # ------------------------------------------------------------------ loop
+    def _run(self):
+        try:
+            while not self._stop_event.is_set():
+                while self._port_events:
+                    self._apply_port_event(*self._port_events.popleft())
+                now = time.perf_counter()
+                for console in self._consoles.values():
+                    if console.reopen_requested:
+                        console.reopen_requested = False
+                        self._fail(console, None)
+                    if console.ser is None:
+                        if now >= console.retry_at:
+                            self._open(console)
+                        if console.ser is None:
+                            continue
+                    self._service_reads(console, now)
+                self._wait(self._next_timeout())
+        finally:
+            for console in self._consoles.values():
+                self._close(console, lost=False)
+
+    def _next_timeout(self) -> float:
+        now = time.perf_counter()
+        timeout = self.idle_wait if self._selector is None else 0.5
+        for console in self._consoles.values():
+            if console.ser is None:
+                timeout = min(timeout, console.retry_at - now)
+        return max(timeout, 0.0)
+
+    def _wait(self, timeout: float):
+        if self._selector is not None:
+            for key, _ in self._selector.select(timeout):
+                if key.fileobj == self._wake_r:
+                    try:
+                        while os.read(self._wake_r, 512):
+                            pass
+                    except BlockingIOError:
+                        pass
+        else:
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    # ------------------------------------------------------------ port state
+    def _apply_port_event(self, console: Console, present: bool):
+        if present:
+            # skip the pending backoff, the device is back
+            if console.ser is None:
+                console.backoff.reset()
+                console.retry_at = 0.0
+        elif console.ser is not None:
+            self._fail(console, SerialException(f"{console.port_name} removed"))
+
+    def _open(self, console: Console):
+        try:
+            console.ser = serial.Serial(console.port_name, console.baudrate, timeout=0, **console.serial_kwargs)
+        except (SerialException, OSError, ValueError) as e:
+            console.ser = None
+            # report the first failure of an outage only; retries follow the backoff
+            first = console.backoff.failures == 0
+            console.retry_at = time.perf_counter() + console.backoff.next()
+            if first:
+                self.report(console, e)
+            return
+        now = time.perf_counter()
+        console.last_rx = now
+        console.backoff.reset()
+        if self._selector is not None:
+            self._selector.register(console.ser.fileno(), selectors.EVENT_READ, console)
+        console.opened.set()
+        lost = console.health.up(now)
+        if lost is not None and console.on_reopen is not None:
+            try:
+                console.on_reopen(console.name, lost)
+            except Exception as e:
+                print(f"[{console.name}] reopen handler error: {e}")
+
+    def _close(self, console: Console, lost: bool = True):
+        console.opened.clear()
+        if console.ser is None:
+            return
+        if lost:
+            console.health.down(time.perf_counter())
+        if self._selector is not None:
+            try:
+                self._selector.unregister(console.ser.fileno())
+            except (KeyError, ValueError, OSError):
+                pass
+        try:
+            console.ser.close()
+        except Exception:
+            pass
+        console.ser = None
+
+    def _fail(self, console: Console, error: Optional[Exception]):
+        """Close a broken port and schedule a reopen."""
+        self._close(console)
+        console.splitter.flush()
+        console.retry_at = time.perf_counter() + console.backoff.next()
+        if error is not None:
+            self.report(console, error)
+
+    # ----------------------------------------------------------------- reads
+    def _service_reads(self, console: Console, now: float):
+        try:
+            waiting = console.ser.in_waiting
+            data = console.ser.read(waiting) if waiting else b""
+        except (SerialException, OSError) as e:
+            self._fail(console, e)
+            return
+
+        if data:
+            arrival = time.perf_counter()
+            console.last_rx = arrival
+            writer = console.writer
+            if writer is not None and writer.pacing:
+                writer.feed_raw(data)
+            if console.on_chunk is not None:
+                try:
+                    console.on_chunk(console.name, data, arrival)
+                except Exception as e:
+                    print(f"[{console.name}] chunk handler error: {e}")
+            if console.on_line is None:
+                return
+            for line in console.splitter.feed(data):
+                if writer is not None and writer.awaiting_echo():
+                    writer.match_echo(line, arrival)
+                try:
+                    console.on_line(console.name, line, arrival)
+                except Exception as e:
+                    print(f"[{console.name}] line handler error: {e}")
+        elif console.silence_timeout is not None and now - console.last_rx > console.silence_timeout:
+            self._close(console, lost=False)
+            self._open(console)
+            if console.ser is None:
+                console.health.down(now)
+            if console.on_silence is not None:
+                console.on_silence(console.name)
+
+
+class PortSupervisor:
+    """
+    Hot-plug watcher for the reactor's ports.
+
+    Polls serial.tools.list_ports every `poll_interval` seconds, and every
+    `missing_interval` seconds while a watched port is missing (on Windows
+    each scan is a SetupAPI enumeration, so the steady-state rate is kept
+    low). When a port's device disappears (USB hub dropped the adapter
+    during a power cycle) the reactor closes it right away; when it
+    reappears the pending backoff is skipped and the port is reopened on
+    the reactor's next pass. Ports that never show up in the listing
+    (ptys, network ports) are left to the reactor's normal backoff.
+
+    `owner` is a ConsoleReactor or anything else with consoles() and
+    port_event(console, present); `port_of(console)` names the device to
+    look for (default: console.port_name).
+    """
+
+    def __init__(self, owner, poll_interval: float = 1.0, missing_interval: float = 0.2,
+                 port_of: Callable[[object], str] = lambda console: console.port_name):
+        self.owner = owner
+        self.poll_interval = poll_interval
+        self.missing_interval = missing_interval
+        self.port_of = port_of
+        self._present: Dict[str, bool] = {}
+        self._missing: set = set()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    @staticmethod
+    def _key(port_name: str) -> str:
+        return port_name.upper() if os.name == "nt" else os.path.realpath(port_name)
+
+    def poll(self):
+        """One scan of the system's serial ports."""
+        try:
+            devices = {self._key(port.device) for port in list_ports.comports()}
+        except Exception as e:
+            print(f"[supervisor] port scan error: {e}")
+            return
+        for console in self.owner.consoles():
+            present = self._key(self.port_of(console)) in devices
+            before = self._present.get(console.name)
+            self._present[console.name] = present
+            if before is not None and before != present:
+                if present:
+                    self._missing.discard(console.name)
+                else:
+                    self._missing.add(console.name)
+                self.owner.port_event(console, present)
+
+    def next_interval(self) -> float:
+        """Seconds to the next scan: short while a port that was listed before is missing."""
+        return self.missing_interval if self._missing else self.poll_interval
+
+    def _run(self):
+        while not self._stop_event.wait(self.next_interval()):
+            self.poll()
@@ -0,0 +1,238 @@
+import os
+import queue
+import threading
+import time
+import tty
+import unittest
+from unittest import mock
+
+import serial
+
+import console_reactor as mod
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class Device:
+    """Master side of a pty pair standing in for a console's UART; optionally echoes what it reads."""
+
+    def __init__(self, echo=False):
+        self.master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self.echo = echo
+        self.received = bytearray()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def send(self, data: bytes):
+        os.write(self.master, data)
+
+    def close(self):
+        self._stop = True
+        os.close(self._slave)
+        self._thread.join(timeout=2.0)
+        os.close(self.master)
+
+    def _run(self):
+        while not self._stop:
+            try:
+                data = os.read(self.master, 1024)
+            except OSError:
+                return
+            self.received += data
+            if self.echo:
+                os.write(self.master, data)
+
+
+class ReactorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.device = Device()
+        self.addCleanup(self.device.close)
+        self.lines = []
+        self.errors = []
+
+    def reactor(self, **kwargs):
+        reactor = mod.ConsoleReactor(**kwargs)
+        self.addCleanup(reactor.stop)
+        return reactor
+
+    def on_line(self, name, line, arrival):
+        self.lines.append(line)
+
+    def on_error(self, name, error):
+        self.errors.append(str(error))
+
+
+class TestReads(ReactorTestCase):
+
+    def test_lines_split_across_chunks(self):
+        reactor = self.reactor()
+        reactor.add_console("qnx", self.device.port, 115200, on_line=self.on_line)
+        reactor.start()
+        self.device.send(b"first li")
+        time.sleep(0.05)
+        self.device.send(b"ne\nsecond\nthi")
+        self.assertTrue(wait_until(lambda: len(self.lines) == 2))
+        self.device.send(b"rd\n")
+        self.assertTrue(wait_until(lambda: len(self.lines) == 3))
+        self.assertEqual(self.lines, ["first line", "second", "third"])
+
+    def test_silent_port_is_reopened(self):
+        silences = []
+        reactor = self.reactor()
+        reactor.add_console("qnx", self.device.port, 115200, on_line=self.on_line,
+                            silence_timeout=0.1, on_silence=silences.append)
+        reactor.start()
+        self.assertTrue(wait_until(lambda: silences))
+        self.device.send(b"after reopen\n")
+        self.assertTrue(wait_until(lambda: self.lines == ["after reopen"]))
+
+    def test_stop_closes_the_wake_pipe(self):
+        reactor = mod.ConsoleReactor()
+        reactor.add_console("qnx", self.device.port, 115200)
+        reactor.start()
+        fds = (reactor._wake_r, reactor._wake_w)
+        reactor.stop()
+        self.assertEqual((reactor._wake_r, reactor._wake_w), (None, None))
+        for fd in fds:
+            with self.assertRaises(OSError):
+                os.fstat(fd)
+
+
+class TestPortWriter(ReactorTestCase):
+
+    def writer_console(self, reactor, gap, echo_paced=True, **kwargs):
+        return reactor.add_console(
+            "sail", self.device.port, 115200, on_line=self.on_line, write_queue=queue.Queue(),
+            encode=lambda text: [(bytes([c]), gap) for c in text.encode()] + [(b"\r\n", gap)],
+            echo_paced=echo_paced, **kwargs)
+
+    def send(self, console, text):
+        console.write_queue.put(text)
+        console.write_queue.join()
+        return console.writer.history[-1]
+
+    def test_echo_paced_write_goes_on_each_echo(self):
+        self.device.echo = True
+        reactor = self.reactor()
+        console = self.writer_console(reactor, gap=0.5)
+        reactor.start()
+        began = time.monotonic()
+        record = self.send(console, "setlog")
+        self.assertLess(time.monotonic() - began, 0.5)
+        self.assertEqual((record.pieces, record.fallbacks), (7, 0))
+        self.assertTrue(wait_until(lambda: record.echoed is not None))
+        self.assertLessEqual(record.picked, record.started)
+        self.assertLessEqual(record.started, record.sent)
+        self.assertLessEqual(record.started, record.echoed)
+        self.assertEqual(bytes(self.device.received), b"setlog\r\n")
+
+    def test_space_is_paced_on_its_own_echo(self):
+        self.device.echo = True
+        reactor = self.reactor()
+        console = self.writer_console(reactor, gap=0.5)
+        reactor.start()
+        began = time.monotonic()
+        record = self.send(console, "setloginfo el1\t1")
+        self.assertLess(time.monotonic() - began, 0.5)
+        self.assertEqual(record.fallbacks, 0)
+
+    def test_pieces_without_echo_wait_for_the_fallback(self):
+        reactor = self.reactor()
+        console = self.writer_console(reactor, gap=0.05)
+        reactor.start()
+        began = time.monotonic()
+        record = self.send(console, "ab")
+        self.assertGreaterEqual(time.monotonic() - began, 0.15)
+        self.assertEqual(record.fallbacks, 3)
+        self.assertEqual(console.writer.paced_fallbacks, 3)
+        self.assertIsNone(record.echoed)
+
+    def test_closed_port_drops_the_command(self):
+        reactor = self.reactor(first_retry=10.0, retry_wait=10.0)
+        console = reactor.add_console("pika", "/dev/nonexistent-port", 9600, write_queue=queue.Queue(),
+                                      encode=lambda text: [(text.encode(), 0)], on_error=self.on_error,
+                                      drop_when_closed=True)
+        reactor.start()
+        console.write_queue.put("ACC OFF")
+        console.write_queue.join()
+        self.assertEqual(len(self.errors), 2)
+        self.assertIn("command dropped", self.errors[1])
+        self.assertEqual(len(console.writer.history), 0)
+
+
+class TestReopen(ReactorTestCase):
+
+    def test_lost_port_retries_with_backoff_and_reopens_on_arrival(self):
+        real = serial.Serial
+        opens = []
+        gone = threading.Event()
+        reopened = []
+
+        def opener(*args, **kwargs):
+            opens.append(time.monotonic())
+            if gone.is_set():
+                raise serial.SerialException("no such device")
+            return real(*args, **kwargs)
+
+        with mock.patch.object(mod.serial, "Serial", opener):
+            reactor = self.reactor(first_retry=0.05, retry_wait=1.0)
+            console = reactor.add_console("ucom", self.device.port, 115200, on_line=self.on_line,
+                                          on_error=self.on_error,
+                                          on_reopen=lambda name, lost: reopened.append(lost))
+            reactor.start()
+            gone.set()
+            removed = time.monotonic()
+            reactor.port_event(console, False)
+            self.assertTrue(wait_until(lambda: len(opens) == 5))
+            # first retry after 0.05 s, then doubling; only the removal is reported
+            gaps = [b - a for a, b in zip([removed] + opens[1:], opens[1:])]
+            for gap, expected in zip(gaps, [0.05, 0.1, 0.2, 0.4]):
+                self.assertGreaterEqual(gap, expected - 0.01)
+                self.assertLess(gap, expected + 0.15)
+            self.assertEqual(len(self.errors), 1)
+            self.assertIn("removed", self.errors[0])
+            self.assertFalse(console.opened.is_set())
+
+            # the device is back: the 0.8 s backoff step is skipped
+            gone.clear()
+            arrived = time.monotonic()
+            reactor.port_event(console, True)
+            self.assertTrue(console.opened.wait(0.5))
+            self.assertLess(time.monotonic() - arrived, 0.3)
+            self.assertEqual(len(reopened), 1)
+            self.device.send(b"back\n")
+            self.assertTrue(wait_until(lambda: self.lines == ["back"]))
+
+
+class TestPortSupervisor(unittest.TestCase):
+
+    def test_changes_in_the_port_listing_are_posted_to_the_reactor(self):
+        reactor = mod.ConsoleReactor()
+        self.addCleanup(reactor.stop)
+        console = reactor.add_console("ucom", "/dev/ttyUSB0", 115200)
+        reactor.add_console("pty", "/dev/pts/99", 115200)
+        listing = []
+        supervisor = mod.PortSupervisor(reactor)
+        with mock.patch.object(mod.list_ports, "comports", lambda: listing), \
+                mock.patch.object(reactor, "port_event") as port_event:
+            intervals = []
+            for listing in ([mock.Mock(device="/dev/ttyUSB0")], [], [], [mock.Mock(device="/dev/ttyUSB0")]):
+                supervisor.poll()
+                intervals.append(supervisor.next_interval())
+            self.assertEqual(intervals, [1.0, 0.2, 0.2, 1.0])
+        self.assertEqual(port_event.call_args_list, [mock.call(console, False), mock.call(console, True)])
+
+
+if __name__ == "__main__":
+    unittest.main()
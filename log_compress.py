@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+Console logs compressed while they are captured, readable at any offset.
+
+A compressed log is a sequence of independent frames, each holding about
+`frame_bytes` of text (whole lines), plus a sidecar frame index:
+
+    qnx_3.log.gz        gzip members, one per frame (zcat / gzip -dc read the whole file)
+    qnx_3.log.gz.fidx   one FRAME_INDEX record per frame: (compressed offset, text offset)
+    qnx_3.log.zst       the same with zstd frames (needs the optional `zstandard` package)
+
+Every flush ends with a sync flush of the open frame, so everything that
+was flushed can be read back while the file is still being written, and
+reading at an offset only decompresses the frames that cover it:
+
+    with CompressedLog('log/20240102/qnx_3.log.gz') as log:
+        print(log.read(log.size() - 4096, 4096).decode())
+"""
+from __future__ import annotations
+
+import bisect
+import os
+import struct
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+from console_io import FSYNC_FLUSH, ConsoleLogWriter, segment_key, segment_path
+
+try:
+    import zstandard
+except ImportError:  # optional: gzip frames work without it
+    zstandard = None
+
+# frame index record: byte offset of the frame in the compressed file, offset of its first text byte
+FRAME_INDEX = struct.Struct("<QQ")
+INDEX_SUFFIX = ".fidx"
+LOG_EXTS = (".log", ".log.gz", ".log.zst")
+
+
+# =============================================================================
+# Codecs
+# =============================================================================
+class GzipFrames:
+    """One gzip member per frame."""
+
+    ext = ".log.gz"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+        self._c = None
+
+    def start(self):
+        self._c = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data)
+
+    def sync(self) -> bytes:
+        return self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        data = self._c.flush(zlib.Z_FINISH)
+        self._c = None
+        return data
+
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        """Text of the frame at the start of `data` (an unfinished frame gives what was synced)."""
+        return zlib.decompressobj(31).decompress(data)
+
+
+class ZstdFrames:
+    """One zstd frame per frame (zstandard package)."""
+
+    ext = ".log.zst"
+
+    def __init__(self, level: int = 3):
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        self._cctx = zstandard.ZstdCompressor(level=level)
+        self._c = None
+
+    def start(self):
+        self._c = self._cctx.compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data)
+
+    def sync(self) -> bytes:
+        return self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        data = self._c.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+        self._c = None
+        return data
+
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        if zstandard is None:
+            raise ValueError("reading .zst logs needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+CODECS = {"gzip": GzipFrames, "zstd": ZstdFrames}
+
+
+def codec_for(path: str):
+    """Codec class from the file name (.log.gz / .log.zst)."""
+    for codec in CODECS.values():
+        if path.endswith(codec.ext):
+            return codec
+    raise ValueError(f"not a compressed log: {path}")
+
+
+# =============================================================================
+# Writer
+# =============================================================================
+class CompressedLogWriter(ConsoleLogWriter):
+    """
+    ConsoleLogWriter that writes `<name>_<index>.log.gz` (or .zst) through
+    `codec` ('gzip' / 'zstd'). Flush, rotation and log index handling are
+    ConsoleLogWriter's. `rotate_bytes` counts compressed bytes on disk only:
+    pending text is left out because its compressed size is not known until
+    it is flushed, so a part can overshoot by one flush.
+    """
+
+    def __init__(self, directory: str, name: str, codec: str = "gzip", level: Optional[int] = None,
+                 frame_bytes: int = 4 * 1024 * 1024, **writer_kwargs):
+        super().__init__(directory, name, **writer_kwargs)
+        self.codec = CODECS[codec]() if level is None else CODECS[codec](level)
+        self.frame_bytes = frame_bytes
+        self._idx = None
+        self._text_offset = 0
+        self._frame_size: Optional[int] = None
+
+    def path(self, index: int, part: int = 0) -> str:
+        return segment_path(self.directory, self.name, index, part, self.codec.ext)
+
+    def _open(self):
+        path = self.path(self.index, self.part)
+        # appending to a file from an earlier run: new frames continue its text offsets
+        self._text_offset = 0
+        if os.path.exists(path):
+            with CompressedLog(path) as log:
+                self._text_offset = log.size()
+        super()._open()
+        self._idx = open(path + INDEX_SUFFIX, "ab")
+        self._frame_size = None
+
+    def _text_position(self) -> int:
+        return self._text_offset
+
+    def _rotation_size(self) -> int:
+        return self._part_size
+
+    def _flush(self):
+        if not self._pending or self._f is None:
+            return
+        data = self._encode_pending()
+        out = []
+        if self._frame_size is None:
+            self._idx.write(FRAME_INDEX.pack(self._f.tell(), self._text_offset))
+            self._idx.flush()
+            self.codec.start()
+            self._frame_size = 0
+        out.append(self.codec.compress(data))
+        self._frame_size += len(data)
+        self._text_offset += len(data)
+        if self._frame_size >= self.frame_bytes:
+            out.append(self.codec.finish())
+            self._frame_size = None
+        else:
+            out.append(self.codec.sync())
+        compressed = b"".join(out)
+        self._f.write(compressed)
+        self._f.flush()
+        if self.fsync_mode == FSYNC_FLUSH:
+            os.fsync(self._f.fileno())
+        self._pending = []
+        self._pending_size = 0
+        self._part_size += len(compressed)
+
+    def _close(self):
+        if self._f is None:
+            return
+        self._flush()
+        if self._frame_size is not None:
+            self._f.write(self.codec.finish())
+            self._frame_size = None
+        self._idx.close()
+        self._idx = None
+        super()._close()
+
+
+# =============================================================================
+# Reader
+# =============================================================================
+class CompressedLog:
+    """
+    Random access to a compressed log through its frame index. A torn last
+    index record is ignored; a missing index is rebuilt in memory by
+    walking the gzip members (zstd logs need the index).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.codec = codec_for(path)
+        self._f = open(path, "rb")
+        self._file_size = os.fstat(self._f.fileno()).st_size
+        self._frames = self._load_index()
+        self._starts = [text for _, text in self._frames]
+        self._cache: Tuple[int, bytes] = (-1, b"")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._f.close()
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def _load_index(self) -> List[Tuple[int, int]]:
+        try:
+            with open(self.path + INDEX_SUFFIX, "rb") as f:
+                index = f.read()
+        except FileNotFoundError:
+            return self._scan() if self.codec is GzipFrames else []
+        index = index[:len(index) - len(index) % FRAME_INDEX.size]
+        return [rec for rec in FRAME_INDEX.iter_unpack(index) if rec[0] < self._file_size]
+
+    def _scan(self) -> List[Tuple[int, int]]:
+        frames = []
+        self._f.seek(0)
+        data = self._f.read()
+        offset = text = 0
+        while offset < len(data):
+            d = zlib.decompressobj(31)
+            try:
+                text_len = len(d.decompress(data[offset:]))
+            except zlib.error:
+                break
+            frames.append((offset, text))
+            text += text_len
+            if not d.eof:
+                break
+            offset = len(data) - len(d.unused_data)
+        return frames
+
+    def frame(self, i: int) -> bytes:
+        """Decompressed text of frame i."""
+        if self._cache[0] == i:
+            return self._cache[1]
+        start = self._frames[i][0]
+        end = self._frames[i + 1][0] if i + 1 < len(self._frames) else self._file_size
+        self._f.seek(start)
+        text = self.codec.decompress(self._f.read(end - start))
+        self._cache = (i, text)
+        return text
+
+    def size(self) -> int:
+        """Length of the text written so far."""
+        if not self._frames:
+            return 0
+        return self._frames[-1][1] + len(self.frame(len(self._frames) - 1))
+
+    def read(self, offset: int, length: int) -> bytes:
+        """`length` bytes of text from `offset`, decompressing only the frames that hold them."""
+        out = []
+        i = max(bisect.bisect_right(self._starts, offset) - 1, 0)
+        while length > 0 and i < len(self._frames):
+            text = self.frame(i)
+            start = max(offset - self._frames[i][1], 0)
+            piece = text[start:start + length]
+            out.append(piece)
+            length -= len(piece)
+            offset += len(piece)
+            i += 1
+        return b"".join(out)
+
+    def chunks(self, offset: int = 0) -> Iterator[bytes]:
+        """Text from `offset` to the end, one frame at a time."""
+        i = max(bisect.bisect_right(self._starts, offset) - 1, 0)
+        for j in range(i, len(self._frames)):
+            text = self.frame(j)
+            yield text[max(offset - self._frames[j][1], 0):]
+
+
+# =============================================================================
+# Plain and compressed logs alike
+# =============================================================================
+def log_paths(directory: str, name: str, index: int) -> List[str]:
+    """Parts of one log index in write order, whichever of LOG_EXTS they were written as."""
+    parts = []
+    for entry in os.listdir(directory):
+        key = segment_key(entry)
+        if key and key[0] == name and key[1] == index and entry.endswith(LOG_EXTS):
+            parts.append((key[2], entry))
+    return [os.path.join(directory, entry) for _, entry in sorted(parts)]
+
+
+def read_text_lines(path: str, encoding: str = "utf-8", errors: str = "replace") -> Iterator[str]:
+    """Lines (with their '\\n') of a .log, .log.gz or .log.zst file."""
+    if path.endswith(".log"):
+        with open(path, encoding=encoding, errors=errors) as f:
+            yield from f
+        return
+    with CompressedLog(path) as log:
+        tail = b""
+        for chunk in log.chunks():
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                yield line.decode(encoding, errors) + "\n"
+        if tail:
+            yield tail.decode(encoding, errors)
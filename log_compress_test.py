@@ -0,0 +1,108 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+import log_compress as mod
+from console_io import OFFSET_CYCLE, OffsetIndex
+
+
+class TestCompressedLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.lines = [f"[2024-01-01 00:00:{i % 60:02d}.000] SYS_MAIN:stat_change {i}\n" for i in range(500)]
+        self.text = "".join(self.lines).encode()
+
+    def write(self, codec="gzip", close=True):
+        w = mod.CompressedLogWriter(self.tmp.name, "qnx", codec=codec, frame_bytes=2000, flush_bytes=500)
+        for line in self.lines:
+            w.write(0, line)
+        if close:
+            w.close()
+        return w, os.path.join(self.tmp.name, "qnx_0" + w.codec.ext)
+
+    def test_random_access_by_frame(self):
+        _, path = self.write()
+        with gzip.open(path) as f:
+            self.assertEqual(f.read(), self.text)
+        with mod.CompressedLog(path) as log:
+            self.assertGreater(len(log), 5)
+            self.assertEqual(log.size(), len(self.text))
+            self.assertEqual(log.read(12345, 300), self.text[12345:12645])
+            self.assertEqual(log.read(len(self.text) - 10, 100), self.text[-10:])
+            self.assertEqual(b"".join(log.chunks(4000)), self.text[4000:])
+
+    def test_flushed_text_is_readable_before_close(self):
+        w, path = self.write(close=False)
+        w.flush()
+        with mod.CompressedLog(path) as log:
+            self.assertEqual(log.read(0, len(self.text)), self.text)
+        w.close()
+
+    def test_missing_index_is_rebuilt_from_gzip_members(self):
+        _, path = self.write()
+        with mod.CompressedLog(path) as indexed:
+            frames = indexed._frames
+        os.remove(path + mod.INDEX_SUFFIX)
+        with mod.CompressedLog(path) as log:
+            self.assertEqual(log._frames, frames)
+            self.assertEqual(log.read(7000, 50), self.text[7000:7050])
+
+    def test_plain_and_compressed_parts_read_alike(self):
+        self.write()
+        w = mod.ConsoleLogWriter(self.tmp.name, "qnx")
+        w.part = 1
+        w.write(0, "plain part\n")
+        w.close()
+        os.rename(os.path.join(self.tmp.name, "qnx_0.log"), os.path.join(self.tmp.name, "qnx_0.1.log"))
+        paths = mod.log_paths(self.tmp.name, "qnx", 0)
+        self.assertEqual([os.path.basename(p) for p in paths], ["qnx_0.log.gz", "qnx_0.1.log"])
+        self.assertEqual([line for p in paths for line in mod.read_text_lines(p)], self.lines + ["plain part\n"])
+
+    def test_offset_index_holds_text_offsets(self):
+        w = mod.CompressedLogWriter(self.tmp.name, "qnx", frame_bytes=2000, flush_bytes=500, offset_index=True)
+        for i, line in enumerate(self.lines):
+            if i % 100 == 0:
+                w.mark(0, OFFSET_CYCLE, 0, i // 100)
+            w.write(0, line)
+        w.close()
+        path = os.path.join(self.tmp.name, "qnx_0.log.gz")
+        with mod.CompressedLog(path) as log:
+            for cycle, offset in OffsetIndex(path).cycles().items():
+                self.assertEqual(log.read(offset, len(self.lines[cycle * 100])), self.lines[cycle * 100].encode())
+
+    def test_mark_flushed_before_its_line_waits_for_it(self):
+        w = mod.CompressedLogWriter(self.tmp.name, "qnx", flush_bytes=1, offset_index=True)
+        w.write(0, "boot\n")
+        w.mark(0, OFFSET_CYCLE, 0, 1)
+        w.flush()
+        w.write(0, "cycle 1\n")
+        w.mark(0, OFFSET_CYCLE, 0, 2)
+        w.close()
+        path = os.path.join(self.tmp.name, "qnx_0.log.gz")
+        self.assertEqual(OffsetIndex(path).cycles(), {1: 5, 2: 13})
+        with mod.CompressedLog(path) as log:
+            self.assertEqual(log.read(5, 100), b"cycle 1\n")
+
+    def test_rotate_bytes_counts_compressed_bytes(self):
+        w = mod.CompressedLogWriter(self.tmp.name, "qnx", frame_bytes=2000, flush_bytes=500, rotate_bytes=2000)
+        for line in self.lines:
+            w.write(0, line)
+        w.close()
+        paths = mod.log_paths(self.tmp.name, "qnx", 0)
+        self.assertGreater(len(paths), 1)
+        for path in paths[:-1]:
+            self.assertGreaterEqual(os.path.getsize(path), 2000)
+        self.assertEqual([line for p in paths for line in mod.read_text_lines(p)], self.lines)
+
+    @unittest.skipIf(mod.zstandard is None, "zstandard not installed")
+    def test_zstd_frames(self):
+        _, path = self.write(codec="zstd")
+        with mod.CompressedLog(path) as log:
+            self.assertEqual(log.read(12345, 300), self.text[12345:12645])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel search of the console logs of a run directory (log/<date>/).
+
+    python log_search.py LOGDIR PATTERN [PATTERN ...] [-F] [-i] [--names ucom,qnx]
+                         [--index 3] [--cycles 8700-8731] [--since '2024-01-02 03:00:00']
+                         [--until '2024-01-02 04:00:00'] [--jobs 8] [--out hits.txt]
+
+Every `<name>_<index>[.<part>].log` (and .log.gz / .log.zst) is cut into
+ranges of about `chunk` bytes of text that worker processes search with
+one combined regex over the memory-mapped file (the frames that cover the
+range for compressed logs), so only matching lines are ever decoded.
+
+--cycles / --since / --until narrow the ranges with the offset index
+(`<segment>.oidx`) where a segment has one; a segment without it is
+searched whole and its lines filtered by stamp (cycles through the times
+in cycles.jsonl). Hits of all consoles come out merged in time order, in
+the timeline format:
+
+    [2024-01-02 03:04:05.678] qnx     | SYS_MAIN:stat_change STARTUP to RUN
+"""
+from __future__ import annotations
+
+import argparse
+import heapq
+import itertools
+import json
+import mmap
+import multiprocessing
+import os
+import re
+import sys
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from console_io import OFFSET_CYCLE, OFFSET_FAILURE, OFFSET_MARKER, OFFSET_SUFFIX, OffsetIndex, segment_key
+from log_compress import LOG_EXTS, CompressedLog
+from log_timeline import parse_line, timeline_line, unique_labels
+from run_records import JOURNAL_NAME
+
+NAMES = ("ucom", "qnx", "android", "sail")
+STAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+STAMP_LEN = 19
+# stamp at the start of a line or of a banner
+LINE_STAMP = re.compile(rb"(?:#+ )?\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?:\.\d+)?)\]")
+# how far back to look for the stamp of an unstamped line (rest of a multi-line record)
+STAMP_LOOKBACK = 64 * 1024
+
+Event = Tuple[str, str, str]
+# path, source, text start, text end, regex, regex flags, since stamp, until stamp
+Task = Tuple[str, str, int, int, bytes, int, Optional[str], Optional[str]]
+
+
+def compile_patterns(patterns: List[str], fixed: bool = False, ignore_case: bool = False) -> Tuple[bytes, int]:
+    """
+    One alternation of all patterns (utf-8 bytes) and its flags; ^ and $
+    match at line boundaries. Checked here so workers cannot fail on it.
+    """
+    parts = [re.escape(p) if fixed else p for p in patterns]
+    regex = "|".join(f"(?:{p})" for p in parts).encode("utf-8")
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    re.compile(regex, flags)
+    return regex, flags
+
+
+def parse_stamp(text: str) -> float:
+    """'YYYY-mm-dd HH:MM:SS' (local time, like the log stamps) -> epoch seconds."""
+    return datetime.strptime(text, STAMP_FORMAT).timestamp()
+
+
+def format_stamp(wall: float) -> str:
+    return datetime.fromtimestamp(wall).strftime(STAMP_FORMAT)
+
+
+# =============================================================================
+# Segments and ranges
+# =============================================================================
+def find_segments(directory: str, names=NAMES, indexes: Optional[List[int]] = None) -> Dict[str, List[str]]:
+    """Console name -> its log segments in write order (log index, then part)."""
+    found: Dict[str, List[Tuple[int, int, str]]] = {name: [] for name in names}
+    for entry in os.listdir(directory):
+        key = segment_key(entry)
+        if key is None or key[0] not in found or not entry.endswith(LOG_EXTS):
+            continue
+        if indexes is not None and key[1] not in indexes:
+            continue
+        found[key[0]].append((key[1], key[2], os.path.join(directory, entry)))
+    return {name: [path for _, _, path in sorted(segments)] for name, segments in found.items()}
+
+
+def text_size(path: str) -> int:
+    if path.endswith(".log"):
+        return os.path.getsize(path)
+    with CompressedLog(path) as log:
+        return log.size()
+
+
+def cycle_window(directory: str, first: int, last: int) -> Optional[Tuple[float, float]]:
+    """Wall-clock span of cycles first..last from cycles.jsonl (None: no journal or no such cycles)."""
+    path = os.path.join(directory, JOURNAL_NAME)
+    if not os.path.exists(path):
+        return None
+    times = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if first <= record.get("cycle", -1) <= last:
+                times += [record[key] for key in ("acc_off", "suspend_log", "acc_on", "resume_log", "end")
+                          if isinstance(record.get(key), (int, float))]
+    return (min(times), max(times)) if times else None
+
+
+def cycle_spans(index: OffsetIndex, carried: Optional[int]) -> Tuple[List[Tuple[int, Optional[int]]], Optional[int]]:
+    """
+    (start offset, cycle) of every stretch of one segment, and the cycle
+    still running at its end. The text before the first cycle start
+    belongs to `carried` (the cycle running at the end of the previous
+    segment) or, after a deleted segment, to the cycle of its first marker.
+    """
+    if carried is None:
+        carried = next((key for kind, _, key, _ in index.records if kind in (OFFSET_MARKER, OFFSET_FAILURE)), None)
+    spans = [(0, carried)]
+    for kind, _, key, offset in index.records:
+        if kind == OFFSET_CYCLE:
+            spans.append((offset, key))
+            carried = key
+    return spans, carried
+
+
+def intersect(a: List[Tuple[int, int]], b: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    out = []
+    for start, end in a:
+        for lo, hi in b:
+            lo, hi = max(start, lo), min(end, hi)
+            if lo < hi:
+                out.append((lo, hi))
+    return out
+
+
+def plan(directory: str, segments: Dict[str, List[str]], regex: bytes, flags: int,
+         cycles: Optional[Tuple[int, int]] = None, since: Optional[float] = None, until: Optional[float] = None,
+         chunk: int = 64 * 1024 * 1024) -> Dict[str, List[Task]]:
+    """Search tasks per console, in file order, each at most `chunk` bytes of text."""
+    window = cycle_window(directory, *cycles) if cycles else None
+    tasks: Dict[str, List[Task]] = {}
+    for name, paths in segments.items():
+        tasks[name] = []
+        carried = None
+        for path in paths:
+            index = OffsetIndex(path) if os.path.exists(path + OFFSET_SUFFIX) else None
+            if index is not None and cycles:
+                spans, carried = cycle_spans(index, carried)
+            if since is not None and os.path.getmtime(path) < since:
+                continue    # last written before the window
+            size = text_size(path)
+            ranges = [(0, size)]
+            line_since, line_until = since, until
+            if index is not None:
+                if cycles:
+                    ends = [offset for offset, _ in spans[1:]] + [size]
+                    ranges = [(start, end) for (start, cycle), end in zip(spans, ends)
+                              if cycle is not None and cycles[0] <= cycle <= cycles[1] and start < end]
+                if since is not None or until is not None:
+                    start = 0 if since is None else index.second(since)
+                    end = size if until is None else index.second(int(until) + 1)
+                    start = size if start is None else start
+                    ranges = intersect(ranges, [(start, size if end is None else end)])
+            elif cycles:
+                if window is None:
+                    raise ValueError(f"{os.path.basename(path)}: no offset index and no {JOURNAL_NAME} for --cycles")
+                line_since = window[0] if since is None else max(since, window[0])
+                line_until = window[1] if until is None else min(until, window[1])
+            stamps = (None if line_since is None else format_stamp(line_since),
+                      None if line_until is None else format_stamp(line_until))
+            for start, end in ranges:
+                for lo in range(start, end, chunk):
+                    tasks[name].append((path, name, lo, min(lo + chunk, end), regex, flags) + stamps)
+    return tasks
+
+
+# =============================================================================
+# Worker
+# =============================================================================
+def previous_stamp(buf, start: int) -> str:
+    """Stamp of the nearest stamped line before `start` (within STAMP_LOOKBACK)."""
+    limit = max(start - STAMP_LOOKBACK, 0)
+    while start > limit:
+        prev = buf.rfind(b"\n", 0, start - 1) + 1
+        m = LINE_STAMP.match(buf, prev)
+        if m:
+            return m.group(1).decode("ascii")
+        start = prev
+    return ""
+
+
+def scan(buf, lo: int, hi: int, task: Task) -> List[Event]:
+    """Matching lines of `buf` that start in [lo, hi); `lo` is a line start."""
+    _, source, _, _, regex, flags, since, until = task
+    pattern = re.compile(regex, flags)
+    limit = buf.find(b"\n", hi - 1) if hi > 0 else 0
+    limit = len(buf) if limit < 0 else limit
+    events = []
+    pos = lo
+    while pos < hi:
+        m = pattern.search(buf, pos, limit)
+        if m is None:
+            break
+        start = buf.rfind(b"\n", 0, m.start()) + 1
+        end = buf.find(b"\n", m.start())
+        end = len(buf) if end < 0 else end
+        if start >= hi:
+            break
+        pos = end + 1
+        line = bytes(buf[start:end]).rstrip(b"\r").decode("utf-8", "replace")
+        stamp, name, text = parse_line(line, "", source)
+        if not stamp:
+            stamp = previous_stamp(buf, start)
+        if (since is not None and stamp[:STAMP_LEN] < since) or (until is not None and stamp[:STAMP_LEN] > until):
+            continue
+        events.append((stamp, name, text))
+    return events
+
+
+def line_start(buf, offset: int) -> int:
+    """First line start at or after `offset`."""
+    if offset == 0 or buf[offset - 1:offset] == b"\n":
+        return offset
+    nl = buf.find(b"\n", offset)
+    return len(buf) if nl < 0 else nl + 1
+
+
+def search_range(task: Task) -> List[Event]:
+    """Hits of one task (run in a worker process)."""
+    path, _, start, end = task[:4]
+    if path.endswith(".log"):
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                return scan(buf, line_start(buf, start), min(end, len(buf)), task)
+    events = []
+    with CompressedLog(path) as log:
+        # frames hold whole lines; only the first chunk may start inside one
+        base = start
+        aligned = start == 0 or log.read(start - 1, 1) == b"\n"
+        for text in log.chunks(start):
+            if base >= end:
+                break
+            lo = 0 if aligned else (text.find(b"\n") + 1 or len(text))
+            aligned = True
+            events += scan(text, lo, min(end - base, len(text)), task)
+            base += len(text)
+    return events
+
+
+# =============================================================================
+# Search
+# =============================================================================
+def search(tasks: Dict[str, List[Task]], jobs: int = 0) -> Iterator[Event]:
+    """
+    Hits of all tasks merged in time order. Each console's tasks are in
+    file order, so its hits are already sorted; the consoles are k-way
+    merged as their results come in. jobs=1 searches in this process.
+    """
+    if jobs == 1:
+        streams = [itertools.chain.from_iterable(map(search_range, console)) for console in tasks.values()]
+        yield from unique_labels(heapq.merge(*streams, key=lambda event: event[0]))
+        return
+    with multiprocessing.Pool(jobs or None) as pool:
+        # round robin, so every console's first ranges are searched first
+        results: Dict[str, list] = {name: [] for name in tasks}
+        for batch in itertools.zip_longest(*tasks.values()):
+            for name, task in zip(tasks, batch):
+                if task is not None:
+                    results[name].append(pool.apply_async(search_range, (task,)))
+        streams = [itertools.chain.from_iterable(r.get() for r in console) for console in results.values()]
+        yield from unique_labels(heapq.merge(*streams, key=lambda event: event[0]))
+
+
+def parse_cycles(text: str) -> Tuple[int, int]:
+    """'8731' or '8700-8731'."""
+    first, _, last = text.partition("-")
+    return int(first), int(last or first)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search the console logs of a run in parallel")
+    parser.add_argument("logdir")
+    parser.add_argument("patterns", nargs="+", metavar="PATTERN", help="regex (any of them matches)")
+    parser.add_argument("-F", "--fixed", action="store_true", help="patterns are literal strings")
+    parser.add_argument("-i", "--ignore-case", action="store_true")
+    parser.add_argument("--names", default=",".join(NAMES))
+    parser.add_argument("--index", help="log indexes, e.g. 3 or 3,4")
+    parser.add_argument("--cycles", type=parse_cycles, help="cycle or range, e.g. 8731 or 8700-8731")
+    parser.add_argument("--since", type=parse_stamp, help="'YYYY-mm-dd HH:MM:SS'")
+    parser.add_argument("--until", type=parse_stamp, help="'YYYY-mm-dd HH:MM:SS' (inclusive)")
+    parser.add_argument("--jobs", type=int, default=0, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-mb", type=int, default=64, help="text per search task")
+    parser.add_argument("--out", help="output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    try:
+        regex, flags = compile_patterns(args.patterns, args.fixed, args.ignore_case)
+    except re.error as e:
+        parser.error(f"bad pattern: {e}")
+    indexes = [int(i) for i in args.index.split(",")] if args.index else None
+    segments = find_segments(args.logdir, args.names.split(","), indexes)
+    try:
+        tasks = plan(args.logdir, segments, regex, flags, args.cycles, args.since, args.until,
+                     args.chunk_mb * 1024 * 1024)
+    except ValueError as e:
+        parser.error(str(e))
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    count = 0
+    try:
+        for stamp, source, text in search(tasks, args.jobs):
+            out.write(timeline_line(stamp, source, text))
+            count += 1
+    finally:
+        if args.out:
+            out.close()
+    print(f"{count} hits in {sum(len(t) for t in tasks.values())} ranges", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
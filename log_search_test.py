@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import unittest
+
+import log_search as mod
+from console_io import OFFSET_CYCLE, ConsoleLogs
+from log_compress import CompressedLogWriter
+
+T0 = mod.parse_stamp("2024-01-02 03:00:00")
+
+
+def stamp(second):
+    return f"[{mod.format_stamp(T0 + second)}.000]"
+
+
+class TestLogSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write_run(self, offset_index=True, **kw):
+        """Cycles 1..3, 10 s each; qnx and ucom log every second, ucom half a second later."""
+        logs = ConsoleLogs(self.tmp.name, ["qnx", "ucom"], offset_index=offset_index, flush_bytes=100, **kw)
+        for second in range(30):
+            if second % 10 == 0:
+                logs.mark(0, OFFSET_CYCLE, 0, second // 10 + 1)
+                logs.label(0, f"#################### {stamp(second)} pikapati ACC OFF ####################\n")
+            logs.write("qnx", 0, f"{stamp(second)} qnx tick {second}\n", int(T0) + second)
+            logs.write("ucom", 0, f"{stamp(second)[:-4]}500] ucom tick {second}\n", int(T0) + second)
+        logs.close()
+
+    def search(self, patterns, jobs=1, chunk=64, fixed=False, **kw):
+        regex, flags = mod.compile_patterns(patterns, fixed)
+        tasks = mod.plan(self.tmp.name, mod.find_segments(self.tmp.name, ["qnx", "ucom"]), regex, flags,
+                         chunk=chunk, **kw)
+        return list(mod.search(tasks, jobs))
+
+    def test_hits_are_merged_in_time_order_whatever_the_chunking(self):
+        self.write_run()
+        hits = self.search([r"tick 1\d$"])
+        self.assertEqual([text for _, _, text in hits],
+                         [f"{name} tick {s}" for s in range(10, 20) for name in ("qnx", "ucom")])
+        self.assertEqual(hits, self.search([r"tick 1\d$"], chunk=1 << 20))
+        self.assertEqual(hits, self.search([r"tick 1\d$"], jobs=2))
+
+    def test_banners_once_and_literal_patterns(self):
+        self.write_run()
+        hits = self.search(["ACC OFF", "tick 2."], fixed=True)
+        self.assertEqual([(source, text) for _, source, text in hits],
+                         [("tool", "pikapati ACC OFF")] * 3)
+
+    def test_cycle_and_time_restriction_use_the_offset_index(self):
+        self.write_run()
+        hits = self.search(["qnx tick"], cycles=(2, 2))
+        self.assertEqual([text for _, _, text in hits], [f"qnx tick {s}" for s in range(10, 20)])
+        hits = self.search(["tick"], since=T0 + 5, until=T0 + 6)
+        self.assertEqual([text for _, _, text in hits], ["qnx tick 5", "ucom tick 5", "qnx tick 6", "ucom tick 6"])
+
+    def test_cycles_without_offset_index_use_the_journal(self):
+        self.write_run(offset_index=False)
+        with open(os.path.join(self.tmp.name, "cycles.jsonl"), "w") as f:
+            f.write(json.dumps({"cycle": 3, "acc_off": T0 + 20, "end": T0 + 22}) + "\n")
+        hits = self.search(["qnx tick"], cycles=(3, 3))
+        self.assertEqual([text for _, _, text in hits], ["qnx tick 20", "qnx tick 21", "qnx tick 22"])
+
+    def test_compressed_logs(self):
+        self.write_run(log_writer=CompressedLogWriter, frame_bytes=300)
+        hits = self.search(["qnx tick"], cycles=(3, 3), chunk=100)
+        self.assertEqual([text for _, _, text in hits], [f"qnx tick {s}" for s in range(20, 30)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+One time-ordered timeline of all consoles plus tool events (ACC on/off,
+pikapati actions, commands sent).
+
+Live:    TimelineWriter is fed from the log pipeline and writes
+         `timeline_<index>.log` next to the per-console logs
+         (CompressedTimelineWriter: `timeline_<index>.log.gz` / `.zst`).
+Offline: merge_logs() k-way merges stored `<name>_<index>.log` files.
+
+    python log_timeline.py LOGDIR [--index 0] [--names ucom,qnx,android,sail] [--out timeline.txt]
+
+Both stream: live keeps only the last `delay` seconds of events in memory,
+offline holds one line per input file, so multi-GB runs can be merged.
+Timeline lines look like
+
+    [2024-01-02 03:04:05.678] qnx     | SYS_MAIN:stat_change STARTUP to RUN
+"""
+from __future__ import annotations
+
+import argparse
+import heapq
+import itertools
+import os
+import re
+import sys
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from console_io import ConsoleLogWriter
+from log_compress import CompressedLogWriter, log_paths, read_text_lines
+
+TOOL = "tool"
+
+
+def timeline_line(stamp: str, source: str, text: str) -> str:
+    return f"[{stamp}] {source:<7} | {text}\n"
+
+
+# =============================================================================
+# Live merge
+# =============================================================================
+class TimelineMerger:
+    """
+    Reorder buffer for events that arrive slightly out of order (command
+    records come from the writer threads, lines from the reactor). push()
+    keeps events in a heap; release(now) hands back, in time order, every
+    event older than `now - delay`. An event older than one already released
+    is `late` and goes out with the next release.
+    """
+
+    def __init__(self, delay: float = 0.5):
+        self.delay = delay
+        self.late = 0
+        self._heap: List[Tuple[float, int, object]] = []
+        self._seq = itertools.count()
+        self._released = float("-inf")
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, mono: float, event: object):
+        if mono < self._released:
+            self.late += 1
+        heapq.heappush(self._heap, (mono, next(self._seq), event))
+
+    def release(self, now: float) -> List[Tuple[float, object]]:
+        return self._pop_until(now - self.delay)
+
+    def drain(self) -> List[Tuple[float, object]]:
+        return self._pop_until(float("inf"))
+
+    def _pop_until(self, limit: float) -> List[Tuple[float, object]]:
+        out = []
+        heap = self._heap
+        while heap and heap[0][0] <= limit:
+            mono, _, event = heapq.heappop(heap)
+            out.append((mono, event))
+        if out:
+            self._released = max(self._released, out[-1][0])
+        return out
+
+
+class TimelineWriter(ConsoleLogWriter):
+    """
+    `timeline_<index>.log` written through a TimelineMerger. add() takes
+    (log index, capture time, source, text); events reach the file once they
+    are `delay` seconds old, in flush_if_due() (ConsoleLogs' flush thread) or
+    on close(). The log index never goes backwards, so a late event does not
+    reopen the previous file.
+    """
+
+    def __init__(self, directory: str, format_time: Callable[[float], str], delay: float = 0.5, **writer_kwargs):
+        super().__init__(directory, "timeline", **writer_kwargs)
+        self.format_time = format_time
+        self.merger = TimelineMerger(delay)
+        self._last_index = 0
+
+    def add(self, index: int, mono: float, source: str, text: str):
+        with self._lock:
+            self.merger.push(mono, (index, source, text))
+
+    def flush_if_due(self, now: Optional[float] = None):
+        with self._lock:
+            self._emit(self.merger.release(time.perf_counter() if now is None else now))
+        super().flush_if_due(now)
+
+    def close(self):
+        with self._lock:
+            self._emit(self.merger.drain())
+        super().close()
+
+    def _emit(self, released: List[Tuple[float, object]]):
+        for mono, (index, source, text) in released:
+            if index > self._last_index:
+                self._last_index = index
+            if self._last_index != self.index:
+                self._switch(self._last_index)
+            elif self._rotation_due():
+                self._rotate()
+            if not self._pending:
+                self._pending_since = time.perf_counter()
+            stamp = self.format_time(mono)
+            for part in text.splitlines() or [""]:
+                line = timeline_line(stamp, source, part)
+                self._pending.append(line)
+                self._pending_size += len(line)
+        if self._pending_size >= self.flush_bytes:
+            self._flush()
+
+
+class CompressedTimelineWriter(TimelineWriter, CompressedLogWriter):
+    """TimelineWriter writing `timeline_<index>.log.gz` (or .zst) frames like the console logs."""
+
+
+# =============================================================================
+# Offline merge
+# =============================================================================
+STAMPED = re.compile(r"\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?:\.\d+)?)\] ?(.*)")
+LABEL = re.compile(r"#+ \[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?:\.\d+)?)\] +(.*?) *#+\s*")
+
+
+def banner_text(line: str) -> str:
+    """'#### [stamp] ACC OFF ####' -> 'ACC OFF' (other text unchanged)."""
+    m = LABEL.fullmatch(line)
+    return m.group(2) if m else line.strip()
+
+
+def parse_line(line: str, stamp: str, source: str) -> Tuple[str, str, str]:
+    """
+    (stamp, source, text) of one console log line. A banner written by
+    ConsoleLogs.label() comes out with source TOOL; a line without a stamp
+    (the rest of a multi-line record) gets `stamp`, the previous line's.
+    """
+    m = LABEL.fullmatch(line)
+    if m:
+        return m.group(1), TOOL, m.group(2)
+    m = STAMPED.match(line)
+    if m:
+        return m.group(1), source, m.group(2)
+    return stamp, source, line
+
+
+def read_log(path: str, source: str) -> Iterator[Tuple[str, str, str]]:
+    """(stamp, source, text) for every line of one console log (see parse_line())."""
+    stamp = ""
+    for line in read_text_lines(path):
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        stamp, name, text = parse_line(line, stamp, source)
+        yield stamp, name, text
+
+
+def read_parts(paths: List[str], source: str) -> Iterator[Tuple[str, str, str]]:
+    """read_log() over the rotated parts of one log index, in order."""
+    for path in paths:
+        yield from read_log(path, source)
+
+
+def merge_logs(directory: str, index: int = 0, names: Iterable[str] = ("ucom", "qnx", "android", "sail")
+               ) -> Iterator[Tuple[str, str, str]]:
+    """
+    k-way merge of `<name>_<index>.log` by stamp (each file is already in
+    capture order; rotated parts `<name>_<index>.<part>.log` follow it;
+    compressed .log.gz / .log.zst parts are read the same way).
+    Banners are in every console log; each is emitted once.
+    """
+    streams = [read_parts(log_paths(directory, name, index), name) for name in names]
+    return unique_labels(heapq.merge(*streams, key=lambda event: event[0]))
+
+
+def unique_labels(events: Iterable[Tuple[str, str, str]]) -> Iterator[Tuple[str, str, str]]:
+    """Time-ordered events with each banner (written into every console log) once."""
+    labels_at, labels = None, set()
+    for stamp, source, text in events:
+        if source == TOOL:
+            if stamp != labels_at:
+                labels_at, labels = stamp, set()
+            if text in labels:
+                continue
+            labels.add(text)
+        yield stamp, source, text
+
+
+def write_timeline(events: Iterable[Tuple[str, str, str]], out: TextIO) -> int:
+    count = 0
+    for stamp, source, text in events:
+        out.write(timeline_line(stamp, source, text))
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge console logs into one time-ordered timeline")
+    parser.add_argument("logdir")
+    parser.add_argument("--index", type=int, default=0, help="log index (<name>_<index>.log)")
+    parser.add_argument("--names", default="ucom,qnx,android,sail")
+    parser.add_argument("--out", help="output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    events = merge_logs(args.logdir, args.index, args.names.split(","))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as out:
+            write_timeline(events, out)
+    else:
+        write_timeline(events, sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import io
+import os
+import tempfile
+import unittest
+
+import log_timeline as mod
+
+
+class TestTimelineMerger(unittest.TestCase):
+
+    def test_releases_in_time_order_after_delay(self):
+        m = mod.TimelineMerger(delay=0.5)
+        m.push(10.2, "qnx")
+        m.push(10.0, "ucom")
+        m.push(10.1, "cmd")
+        self.assertEqual(m.release(10.55), [(10.0, "ucom")])
+        self.assertEqual(m.release(11.0), [(10.1, "cmd"), (10.2, "qnx")])
+        m.push(10.15, "late")
+        self.assertEqual(m.late, 1)
+        self.assertEqual(m.drain(), [(10.15, "late")])
+        self.assertEqual(len(m), 0)
+
+
+class TestTimelineWriter(unittest.TestCase):
+
+    def test_file_is_time_ordered_and_follows_index(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            w = mod.TimelineWriter(tmp, format_time=lambda mono: f"2024-01-01 00:00:{mono:06.3f}", delay=0.5)
+            w.add(0, 1.0, "ucom", "VHM:DSEn")
+            w.add(0, 0.9, "qnx", ">> slog2info")
+            w.add(1, 2.0, "tool", "pikapati ACC ON")
+            w.add(0, 2.1, "sail", "old index after the switch")
+            w.flush_if_due(1.6)
+            w.close()
+            with open(os.path.join(tmp, "timeline_0.log"), encoding="utf-8") as f:
+                self.assertEqual(f.read(), "[2024-01-01 00:00:00.900] qnx     | >> slog2info\n"
+                                           "[2024-01-01 00:00:01.000] ucom    | VHM:DSEn\n")
+            with open(os.path.join(tmp, "timeline_1.log"), encoding="utf-8") as f:
+                self.assertEqual(f.read(), "[2024-01-01 00:00:02.000] tool    | pikapati ACC ON\n"
+                                           "[2024-01-01 00:00:02.100] sail    | old index after the switch\n")
+
+    def test_compressed_timeline(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            w = mod.CompressedTimelineWriter(tmp, format_time=lambda mono: f"2024-01-01 00:00:{mono:06.3f}",
+                                             delay=0.5, frame_bytes=40)
+            w.add(0, 1.0, "ucom", "VHM:DSEn")
+            w.add(0, 0.9, "qnx", ">> slog2info")
+            w.close()
+            self.assertFalse(os.path.exists(os.path.join(tmp, "timeline_0.log")))
+            self.assertEqual(list(mod.read_text_lines(os.path.join(tmp, "timeline_0.log.gz"))),
+                             ["[2024-01-01 00:00:00.900] qnx     | >> slog2info\n",
+                              "[2024-01-01 00:00:01.000] ucom    | VHM:DSEn\n"])
+
+
+class TestMergeLogs(unittest.TestCase):
+
+    def test_k_way_merge_with_banners_once(self):
+        banner = "#################### [2024-01-01 00:00:02.000]  pikapati ACC OFF  ####################\n"
+        files = {
+            "ucom_0.log": "[2024-01-01 00:00:01.000] VHM:DSEn\n" + banner + "[2024-01-01 00:00:03.000] PMT:ASEE High\n",
+            "qnx_0.log": "[2024-01-01 00:00:01.500] dump start\ncontinued\n" + banner,
+            "sail_0.log": banner + "[2024-01-01 00:00:02.500] >> setloginfo_el1\n",
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, text in files.items():
+                with open(os.path.join(tmp, name), "w", encoding="utf-8") as f:
+                    f.write(text)
+            out = io.StringIO()
+            self.assertEqual(mod.write_timeline(mod.merge_logs(tmp, 0), out), 6)
+        self.assertEqual(out.getvalue().splitlines(), [
+            "[2024-01-01 00:00:01.000] ucom    | VHM:DSEn",
+            "[2024-01-01 00:00:01.500] qnx     | dump start",
+            "[2024-01-01 00:00:01.500] qnx     | continued",
+            "[2024-01-01 00:00:02.000] tool    | pikapati ACC OFF",
+            "[2024-01-01 00:00:02.500] sail    | >> setloginfo_el1",
+            "[2024-01-01 00:00:03.000] ucom    | PMT:ASEE High",
+        ])
+
+    def test_rotated_parts_follow_the_first(self):
+        files = {
+            "qnx_0.log": "[2024-01-01 00:00:01.000] part 0\n",
+            "qnx_0.2.log": "[2024-01-01 00:00:03.000] part 2\n",
+            "ucom_0.1.log": "[2024-01-01 00:00:02.000] first part pruned\n",
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, text in files.items():
+                with open(os.path.join(tmp, name), "w", encoding="utf-8") as f:
+                    f.write(text)
+            self.assertEqual([text for _, _, text in mod.merge_logs(tmp, 0)],
+                             ["part 0", "first part pruned", "part 2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
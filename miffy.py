@@ -12,6 +12,7 @@ import subprocess
 import configparser
 import shutil
 import json
+import functools
 import tkinter as tk
 from tkinter import scrolledtext
 from tkinter import ttk
@@ -20,7 +21,16 @@ from tkinter import messagebox
 import serial
 import serial.tools.list_ports
 import cv2
-import requests
+import http.client
+
+from console_reactor import ConsoleReactor, PortSupervisor
+from console_io import (CaptureClock, ConsoleLogs, ConsoleLogWriter, CounterHeader, LogPipeline, LogRetention,
+                        OFFSET_CYCLE, OFFSET_FAILURE, OFFSET_MARKER)
+from console_monitor import Extractor, ExtractorRegistry, RuleEngine, RuleError, TriggerEvent
+from log_compress import CompressedLogWriter, zstandard
+from log_timeline import CompressedTimelineWriter, TimelineWriter, banner_text
+from run_records import CycleJournal, CycleRecorder, LatencyHistogram
+from teams_notifier import TeamsNotifier, adaptive_card, post_json
 
 #######################################################
 #User Setting
@@ -86,9 +96,73 @@ CAMERA_FRAME_HEIGHT = 720
 TEAMS_ENABLE = 0
 TEAMS_TITLE = 'サスレジ試験:齊藤席'
 TEAMS_URL = ''
+# Teams通知の送信(試験シーケンスとは別スレッドで送信する)
+# 接続/応答待ちのタイムアウト(秒)、この秒数内に続いた通知は1件にまとめる
+# 送信できなかった通知はTEAMS_SPOOL_FILEへ保存し、接続できた時点(次回の試験を含む)で古い順に送信する
+TEAMS_CONNECT_TIMEOUT = 5
+TEAMS_READ_TIMEOUT = 10
+TEAMS_COALESCE_SEC = 10
+TEAMS_SPOOL_FILE = 'teams_spool.jsonl'
 
 #0=無効、1=設定用のwindowでテスト環境設定を行う
 TOOL_EXE_GENMODE = 1
+
+# コンソールログの書き込み設定
+# 書き込み待ちデータがLOG_FLUSH_BYTES(byte)を超えるか、LOG_FLUSH_SEC(秒)経過でファイルへ書き込む
+LOG_FLUSH_BYTES = 64 * 1024
+LOG_FLUSH_SEC = 1
+# "fsyncなし(OS任せ) = 0" or "書き込み毎にfsync = 1" or "ログファイル切り替え時にfsync = 2"
+LOG_FSYNC_MODE = 0
+# コンソールログの分割(同じlog_index内でも分割する。0=分割しない)
+# LOG_ROTATE_BYTES(byte)を超えるか、LOG_ROTATE_SEC(秒)経過で<console>_N.1.log, <console>_N.2.log...へ切り替える
+# (LOG_ROTATE_BYTESは非圧縮時は書き込み待ちを含むログのbyte数、圧縮時はファイルに書き込み済みの圧縮後のbyte数)
+LOG_ROTATE_BYTES = 256 * 1024 * 1024
+LOG_ROTATE_SEC = 3600
+# ログフォルダの容量上限(byte、0=上限なし(既定。ログは削除しない))
+# 設定した場合のみ、超えた時に古いコンソールログから削除する。エラーを検知したlog_indexのログと、直近LOG_KEEP_SEC秒以内に書き込んだログは削除しない
+# (例: 100GB = 100 * 1024 * 1024 * 1024)
+LOG_DISK_BUDGET = 0
+LOG_KEEP_SEC = 900
+# コンソールログの圧縮 "圧縮しない = 0" or "gzip = 1" or "zstd = 2"(zstandardパッケージが無い場合はgzip)
+# 圧縮時は<console>_N.log.gz(.zst)へLOG_FRAME_BYTES(byte)毎に独立したフレームで書き込み、<console>_N.log.gz.fidxにフレームの位置を保存する
+# (試験中も書き込み済みの範囲を読める。読み出しはlog_compress.CompressedLog、.gzはzcat/7-Zip等でも展開できる)
+LOG_COMPRESS = 0
+LOG_FRAME_BYTES = 4 * 1024 * 1024
+# コンソールログのオフセット索引 "作成しない = 0" or "作成する = 1"
+# <console>_N.log.oidxに1秒毎の先頭行、サイクル開始、ACC/+B操作、エラー検知の位置を保存する
+# (巨大なログでもcycle 8731等へ直接移動できる。読み出しはconsole_io.OffsetIndex)
+LOG_OFFSET_INDEX = 1
+
+# SAILコマンド送信間隔
+# 1文字送信毎にエコーを待って次の文字を送信する(最短SAIL_PACE_MIN_GAP秒、エコーが無ければSAIL_PACE_TIMEOUT秒で次の文字へ)
+SAIL_PACE_MIN_GAP = 0.005
+SAIL_PACE_TIMEOUT = 0.2
+
+# "受信データそのまま保存 有効:1/無効:0"
+# 有効時はコンソールログ(.log)に加えて、受信バイト列を<console>_N.binへ、受信時刻の索引を<console>_N.idxへ保存する
+# (ANSIエスケープ/バイナリダンプもそのまま残る。読み出しはconsole_io.RawCaptureを使用)
+RAW_CAPTURE = 0
+
+# "全コンソールの時刻順ログ 有効:1/無効:0"
+# 有効時はucom/qnx/android/sailのログとツールの操作(ACC ON/OFF・ぴかぱち送信・コマンド送信)を受信時刻順に並べてtimeline_N.logへ保存する
+# (保存済みのログからは python log_timeline.py <ログフォルダ> --index N で作成できる)
+# 各コンソールのログをもう一度書き込むため既定は無効。LOG_COMPRESS設定時はtimeline_N.log.gz(.zst)へ圧縮して書き込む
+TIMELINE_LOG = 0
+
+# 監視ルールファイル(コンソール/検知ログ/条件/処理)
+# ファイルが無い場合は既定のルールで生成する。試験中に編集した内容は数秒以内に反映される
+MONITOR_RULES_FILE = 'monitor_rules.json'
+
+# 試験環境情報(SoC/System uCom/SAIL/FCP/HWバリ/WK)の保存先
+# 起動ログから一度取得した項目は以降の照合から外す。次回の試験はこのファイルの値を初期値として開始する(ログフォルダにも保存)
+ENV_INFO_FILE = 'env_info.json'
+
+# "サイクル毎の記録 有効:1/無効:0"
+# 有効時はサスペンド/レジューム1回毎の結果(ACC OFF/ON・トリガー/成功判定ログの時刻、フェールセーフ検知)をcycles.jsonlへ追記し、
+# 集計用にcycles.sqliteへも登録する(python run_records.py <ログフォルダ> で結果/トリガー毎の回数を表示)
+CYCLE_RECORDS = 1
+# 試験終了時に試験スレッドの終了を待つ最大時間(秒)。待った後にcycles.jsonlを閉じる
+SUSRES_STOP_TIMEOUT = 30
 #######################################################
 #Constant Definition
 #######################################################
@@ -124,6 +198,21 @@ TESTLOG_END = 9
 
 TESTLOG_MAX_COUNT = 1000
 
+#オフセット索引のマーカー種別
+MARKER_OTHER = 0
+MARKER_ACC_OFF = 1
+MARKER_ACC_ON = 2
+MARKER_BATT_OFF = 3
+MARKER_BATT_ON = 4
+
+#オフセット索引のエラー種別
+FAILURE_SUS_TIMEOUT = 1
+FAILURE_RES_TIMEOUT = 2
+FAILURE_RESET_SUS = 3
+FAILURE_RESET_RES = 4
+FAILURE_ERROR = 5
+FAILURE_STOP = 6
+
 SERIAL_READ = 0
 SERIAL_WRITE = 1
 
@@ -135,6 +224,8 @@ EV_ANDROID_SER_WRITE = 0
 
 EV_SAIL_SER_WRITE = 0
 
+EV_PIKA_SER_WRITE = 0
+
 EV_CAMERA_SS_SUSPEND = 0
 EV_CAMERA_SS_RESUME = 1
 EV_CAMERA_SS_SUS_ERR = 2
@@ -146,8 +237,16 @@ EV_CAMERA_SS_RES_ERR = 3
 #######################################################
 tool_state = TOOL_STATE_RUN
 
-suspend_wait_flag = 0
-resume_wait_flag = 0
+#トリガーログ待ち(監視スレッドが検知時刻付きで通知し、試験シーケンスはこれを直接待つ)
+suspend_trigger = TriggerEvent()
+resume_trigger = TriggerEvent()
+#トリガー検知からACC操作までの時間(ms)
+trigger_latency = {}
+#ACC ON後の成功判定ログ(VHM:APSROn)
+resume_success = TriggerEvent()
+#サスペンド時間(ACC OFF→トリガーログ)/レジューム時間(ACC ON→成功判定ログ)(ms)
+suspend_latency = LatencyHistogram()
+resume_latency = LatencyHistogram()
 
 suspend_count = 0
 resume_count = 0
@@ -175,8 +274,20 @@ q_ucom = queue.Queue()
 q_qnx = queue.Queue()
 q_android = queue.Queue()
 q_sail = queue.Queue()
+q_pika = queue.Queue()
 q_camera = queue.Queue()
 
+capture_clock = CaptureClock()
+console_reactor = None
+port_supervisor = None
+console_logs = None
+log_timeline = None
+log_retention = None
+log_pipeline = None
+rule_engine = None
+teams_notifier = None
+cycle_recorder = CycleRecorder(None)
+
 ramdump_timeoutcnt = 0
 
 ucom_failsafe_list = [
@@ -208,6 +319,68 @@ ucom_failsafe_list = [
     ]
     
     
+#監視対象のコンソール
+MONITOR_CONSOLES = ['ucom', 'qnx', 'android', 'sail']
+
+#既定の監視ルール(MONITOR_RULES_FILEが無い場合にこの内容で生成する)
+#  console:コンソール, pattern:検知ログ, require/exclude:同じ行に含まれる(含まれない)ログ, when:条件,
+#  group:同じgroupのルールは先に一致した1つだけ実行(if/elif),
+#  stop:検知ログが一致した時点でgroupの判定を終える(require/whenを満たさない場合も後のルールは判定しない), actions:処理
+#  処理 log:テストログへ出力(引数は見出し), set:変数設定, print:コンソール表示, record:サイクルの記録に追加(引数は項目名),
+#       (フェールセーフの検知はルールファイルに関係なくサイクルの記録に追加する)
+#       asee_teststop/dump_end/ramdump:試験状態の変更
+DEFAULT_MONITOR_RULES = [
+        {'name': 'meter_fin_end',  'console': 'ucom', 'pattern': 'PMT:Meter Fin End', 'group': 'ucom_sleep',
+         'actions': [['set', 'sleep_chk_flg', 1]]},
+        {'name': 'asee_timeout',   'console': 'ucom', 'pattern': 'PMT:ASEE T.O.',     'group': 'ucom_sleep',
+         'actions': [['set', 'sleep_chk_flg', 10]]},
+        {'name': 'asee_high',      'console': 'ucom', 'pattern': 'PMT:ASEE High',     'group': 'ucom_sleep',
+         'actions': [['set', 'sleep_chk_flg', 0]]},
+    ] + [
+        {'name': f'failsafe_{i}', 'console': 'ucom', 'pattern': failsafe[1], 'group': 'failsafe',
+         'actions': [['log', failsafe[0]]]}
+        for i, failsafe in enumerate(ucom_failsafe_list)
+    ] + [
+        {'name': 'str_result_11',  'console': 'qnx', 'pattern': 'devctl(STR) result: 11',  'group': 'qnx_error', 'actions': [['log']]},
+        {'name': 'str_result_16',  'console': 'qnx', 'pattern': 'devctl(STR) result: 16',  'group': 'qnx_error', 'actions': [['log']]},
+        {'name': 'str_result_120', 'console': 'qnx', 'pattern': 'devctl(STR) result: 120', 'group': 'qnx_error', 'actions': [['log']]},
+        {'name': 'str_result_neg', 'console': 'qnx', 'pattern': 'devctl(STR) result: -',   'group': 'qnx_error', 'actions': [['log']]},
+        {'name': 'str_retry_cnt',  'console': 'qnx', 'pattern': 'devctl(STR): retry_cnt:', 'group': 'qnx_error', 'actions': [['log']]},
+        {'name': 'str_ctrl_retry', 'console': 'qnx', 'pattern': 'str_ctrl_retry',          'group': 'qnx_error', 'actions': [['log']]},
+        {'name': 'core_dump',      'console': 'qnx', 'pattern': 'dumping to /var/log/', 'require': ['.core'],
+         'group': 'qnx_error', 'stop': True, 'actions': [['log']]},
+        {'name': 'dump_format',    'console': 'qnx', 'pattern': 'Format: Log Type - Time(microsec)', 'when': ['not_init'],
+         'group': 'qnx_error', 'stop': True, 'actions': [['log'], ['dump_end']]},
+        {'name': 'ramdump_loaded', 'console': 'qnx', 'pattern': 'RamDump -  Image Loaded, Delta', 'when': ['not_init'],
+         'group': 'qnx_error', 'stop': True, 'actions': [['ramdump']]},
+        {'name': 'abnormal_reset', 'console': 'android', 'pattern': 'abnormal_reset',     'group': 'android_error', 'actions': [['log']]},
+        {'name': 'power_down',     'console': 'android', 'pattern': 'reboot: Power down', 'group': 'android_error', 'actions': [['log']]},
+        {'name': 'sail_interrupt1', 'console': 'android', 'pattern': 'Interrupt disabled successfully',
+         'require': ['prvXBLDeInit_Sleep xSleepDriverAck Success'], 'group': 'android_error',
+         'actions': [['print']]},
+        {'name': 'sail_interrupt2', 'console': 'android', 'pattern': 'Interrupt disabled successfully',
+         'require': ['Ack to MD : 0xAA030000'], 'group': 'android_error',
+         'actions': [['print']]},
+    ]
+
+#既定の相関ルール(複数コンソールのログの前後関係/時間窓による判定。MONITOR_RULES_FILEのcorrelationsに書く)
+#  kind sequence:stepsが順に出力され最後がwithin秒以内 / absence:steps[0]の後within秒以内にsteps[1]が出ない
+#       missing:steps[-1]の出力時にそれ以前のstepsが出ていない(withinを省略した場合はreset_onの時点から)
+#  reset_on:状態をクリアするタイミング(acc_off:ACC OFF時)
+DEFAULT_MONITOR_CORRELATIONS = [
+        #SAILの特定ログが検出されない状態で、'PMT:ASEE T.O'を検知した場合はテストを停止(ASEE_TO_TESTSTOP=1の場合)
+        {'name': 'asee_without_sail_interrupt', 'kind': 'missing', 'reset_on': ['acc_off'],
+         'steps': [{'console': 'android', 'pattern': 'Interrupt disabled successfully',
+                    'require': ['prvXBLDeInit_Sleep xSleepDriverAck Success']},
+                   {'console': 'android', 'pattern': 'Interrupt disabled successfully',
+                    'require': ['Ack to MD : 0xAA030000']},
+                   {'console': 'ucom', 'pattern': 'PMT:ASEE T.O.'}],
+         'actions': [['asee_teststop']]},
+    ]
+
+#監視ルールのset処理で変更できる変数
+RULE_VARIABLES = ['sleep_chk_flg']
+
 suspend_select_trigger = 9
 suspend_trigger_list = [
     
@@ -251,18 +424,11 @@ suspend_time = ACC_OFFON_TIME
 resume_time = ACC_OFFON_TIME
 sleep_chk_flg = 0
 
-sail_Interrupt_check1 = 0
-sail_Interrupt_check2 = 0
-
 log_max_count = TESTLOG_MAX_COUNT
 test_stop_flag = False
 
-build_number = '-'
-system_ucom = '-'
-sail_img_id = '-'
-fcp = '-'
-hw_vari = '-'
-wk_ev = '-'
+#試験環境情報(build_number/system_ucom/sail_img_id/fcp/hw_vari/wk_ev)
+env_info = ExtractorRegistry(ENV_INFO_FILE)
 
 #######################################################
 #main
@@ -290,14 +456,24 @@ def main():
         with open('config.ini', 'w',encoding='shift_jis') as configfile:
             config.write(configfile)
     
-    # 電源状態初期化
-    pika_init()
-    
     # ログフォルダの作成
     logfpath = currentpath + "/" "log" + "/" + datastr_get()
     os.makedirs(currentpath + "/" + "log", exist_ok=True)
     os.makedirs(logfpath, exist_ok=True)
 
+    # コンソールログの書き込み開始
+    console_logs_start()
+    if CYCLE_RECORDS == 1:
+        cycle_recorder.journal = CycleJournal(logfpath)
+    teams_notifier_start()
+    log_pipeline_start()
+
+    # シリアル通信の開始(全コンソール+ぴかぱちを1スレッドで処理)
+    console_reactor_start()
+
+    # 電源状態初期化
+    pika_init()
+
     def click_close():
         global tool_state
         tool_state = TOOL_STATE_END
@@ -312,6 +488,10 @@ def main():
             res_err_counter.set('Resume Error:' + str(resume_error_count))
             con_counter.set('consecutive success:' + str(consecutive_success_count))
             con_max_counter.set('consecutive success max:' + str(consecutive_success_max_count))
+            pipeline_counter.set(log_pipeline_status())
+            latency_counter.set(latency_text('Suspend', suspend_latency) + ' / ' + latency_text('Resume', resume_latency))
+            #ログが途絶えても相関ルール(absence)の時間切れを判定する
+            rule_engine.expire()
             masterwin.update()
             masterwin.after(1000, test_count_cycle)
     
@@ -394,7 +574,7 @@ def main():
     #マスターウインドウの設定
     masterwin = tk.Tk()
     masterwin.title ('test Count')
-    masterwin.geometry("200x150+1210+0")
+    masterwin.geometry("200x170+1210+0")
     masterwin.protocol("WM_DELETE_WINDOW", click_close)
     susres_counter = tk.StringVar()
     susres_counter.set('Suspend:' + str(suspend_count) + ' / Resume:'  + str(resume_count))
@@ -422,6 +602,16 @@ def main():
     con_max_counter.set('consecutive success max:' + str(consecutive_success_max_count))
     countlabel5 = tk.Label(masterwin, textvariable=con_max_counter)
     countlabel5.pack()
+
+    pipeline_counter = tk.StringVar()
+    pipeline_counter.set(log_pipeline_status())
+    countlabel6 = tk.Label(masterwin, textvariable=pipeline_counter)
+    countlabel6.pack()
+
+    latency_counter = tk.StringVar()
+    latency_counter.set(latency_text('Suspend', suspend_latency) + ' / ' + latency_text('Resume', resume_latency))
+    countlabel7 = tk.Label(masterwin, textvariable=latency_counter)
+    countlabel7.pack()
     
     end_btn_text = tk.StringVar()
     end_btn_text.set('次のサイクルでテスト終了')
@@ -533,26 +723,33 @@ def main():
     masterwin.after(900, android_cyclechcek)
     
     # スレッドの作成
-    thread_ucom = threading.Thread(target=ucom_serial_communication, daemon=True)
-    thread_qnx = threading.Thread(target=qnx_serial_communication, daemon=True)
-    thread_sail = threading.Thread(target=android_serial_communication, daemon=True)
-    thread_android = threading.Thread(target=sail_serial_communication, daemon=True)
     thread_susres_test = threading.Thread(target=func_susres_test, daemon=True)
     
     if CAMERA_ENABLE == True:
         thread_canera = threading.Thread(target=camera_control, daemon=True)
     
-    thread_ucom.start()
-    thread_qnx.start()
-    thread_sail.start()
-    thread_android.start()
     thread_susres_test.start()
     if CAMERA_ENABLE == True:
         thread_canera.start()
     
     masterwin.mainloop()
+    #試験スレッドの終了('aborted'等の記録)を待ってからサイクルの記録を閉じる
+    thread_susres_test.join(timeout=SUSRES_STOP_TIMEOUT)
     time.sleep(1)
+    sail_pace_report()
+    console_health_report()
+    rule_engine_report()
+    trigger_latency_report()
+    latency_report()
+    log_retention_report()
+    env_info.save(os.path.join(logfpath, ENV_INFO_FILE))
+    cycle_records_close()
+    port_supervisor.stop()
+    console_reactor.stop()
+    log_pipeline.stop()
+    console_logs.close()
     susres_test_info(into_info='試験終了')
+    teams_notifier_stop()
     
 #######################################################
 #Function
@@ -1257,393 +1454,431 @@ def datastr_get():
 
 #日時取得-ログのタイムスタンプ用
 def timestamp_get():
-    
-    dt_now = datetime.datetime.now()
-    
-    time = dt_now.strftime('%Y-%m-%d %H:%M:%S.%f')
-    timestamp = "[" + time[:-3] + "] "
-    return timestamp
 
+    return timestamp_from(capture_clock.now())
+
+#受信時刻(perf_counter)からログのタイムスタンプを生成
+def timestamp_from(mono):
+
+    return "[" + capture_clock.format(mono) + "] "
+
+
+#コンソールログの書き込み開始
+#コンソール毎にログファイルを開いたままにし、まとめて書き込む(log_index変更時はファイルを切り替え)
+def console_logs_start():
+    global console_logs
+    global log_timeline
+    global log_retention
+
+    if LOG_DISK_BUDGET > 0:
+        log_retention = LogRetention(logfpath, LOG_DISK_BUDGET, ['ucom', 'qnx', 'android', 'sail', 'timeline'],
+                                     keep_seconds=LOG_KEEP_SEC)
+    log_writer = ConsoleLogWriter
+    timeline_writer = TimelineWriter
+    if LOG_COMPRESS != 0:
+        codec = 'zstd' if LOG_COMPRESS == 2 and zstandard is not None else 'gzip'
+        log_writer = functools.partial(CompressedLogWriter, codec=codec, frame_bytes=LOG_FRAME_BYTES)
+        timeline_writer = functools.partial(CompressedTimelineWriter, codec=codec, frame_bytes=LOG_FRAME_BYTES)
+    console_logs = ConsoleLogs(logfpath, ['ucom', 'qnx', 'android', 'sail'], raw=(RAW_CAPTURE == 1), retention=log_retention,
+                               log_writer=log_writer, offset_index=(LOG_OFFSET_INDEX == 1),
+                               flush_bytes=LOG_FLUSH_BYTES, flush_interval=LOG_FLUSH_SEC, fsync_mode=LOG_FSYNC_MODE,
+                               rotate_bytes=LOG_ROTATE_BYTES, rotate_seconds=LOG_ROTATE_SEC)
+    if TIMELINE_LOG == 1:
+        #前後0.5秒の範囲で受信時刻順に並べ替えて書き込む(書き込みは各コンソールログと同じスレッド)
+        log_timeline = timeline_writer(logfpath, capture_clock.format, flush_bytes=LOG_FLUSH_BYTES,
+                                       flush_interval=LOG_FLUSH_SEC, fsync_mode=LOG_FSYNC_MODE,
+                                       rotate_bytes=LOG_ROTATE_BYTES, rotate_seconds=LOG_ROTATE_SEC)
+        console_logs.attach(log_timeline)
+    console_logs.start()
+
+#パイプラインの滞留数(最大)と破棄数
+def log_pipeline_status():
+    stats = log_pipeline.stats()
+    depth = max(stage['depth'] for stage in stats.values())
+    max_depth = max(stage['max_depth'] for stage in stats.values())
+    dropped = sum(stage['dropped'] for stage in stats.values())
+    return f'log queue:{depth}({max_depth}) drop:{dropped}'
+
+#受信ログのパイプライン開始
+#reactorスレッドは受信のみ行い、ログ保存と監視はそれぞれの消費スレッドで行う
+def log_pipeline_start():
+    global log_pipeline
+
+    rule_engine_start()
+    log_pipeline = LogPipeline(is_priority=console_log_is_priority, on_drop=console_log_drop)
+    log_pipeline.add_stage('persist', console_log_persist)
+    log_pipeline.add_stage('monitor', console_log_monitor)
+    log_pipeline.start()
+
+#監視ルールの読み込み
+#コンソール毎に監視ルールのログとトリガー/成功判定ログを1つのPatternMatcherにまとめ、受信1行につき1回の照合で該当ログを全て取得する
+def rule_engine_start():
+    global rule_engine
+
+    rule_engine = RuleEngine(MONITOR_RULES_FILE,
+                             actions={'log': rule_log, 'set': rule_set, 'print': rule_print, 'record': rule_record,
+                                      'asee_teststop': rule_asee_teststop, 'dump_end': rule_dump_end, 'ramdump': rule_ramdump},
+                             conditions={'not_init': lambda: test_task != TASK_INIT},
+                             consoles=MONITOR_CONSOLES, on_error=rule_engine_error)
+    env_info_start()
+    for failsafe in ucom_failsafe_list:
+        rule_engine.add_static('ucom', failsafe[1], 'failsafe')
+    for trigger in suspend_trigger_list + resume_trigger_list:
+        if trigger[0] in MONITOR_CONSOLES:
+            rule_engine.add_static(trigger[0], trigger[1], 'trigger')
+        if trigger[2] in MONITOR_CONSOLES:
+            rule_engine.add_static(trigger[2], trigger[3], 'success')
+
+    if not os.path.exists(MONITOR_RULES_FILE):
+        with open(MONITOR_RULES_FILE, 'w', encoding='utf-8') as rules_f:
+            json.dump({'rules': DEFAULT_MONITOR_RULES, 'correlations': DEFAULT_MONITOR_CORRELATIONS},
+                      rules_f, ensure_ascii=False, indent=1)
+    try:
+        rule_engine.load()
+    except (OSError, RuleError) as e:
+        #読み込めない場合は既定のルールで試験を行う
+        rule_engine_error(f'{e} (既定のルールで監視します)')
+        rule_engine.apply(DEFAULT_MONITOR_RULES, DEFAULT_MONITOR_CORRELATIONS)
+
+#試験環境情報の取得開始
+#前回の値を読み込み、起動ログから取得する項目のログを照合対象に追加する(取得後は照合対象から外す)
+def env_info_start():
+    env_info.on_retire = env_info_captured
+    env_info.load()
+    for extractor in [Extractor('system_ucom', 'ucom', 'I:2:BTM:Sys:', system_ucom_extract),
+                      Extractor('fcp', 'ucom', 'I:2:FCP:R:VC=0x', fcp_extract),
+                      Extractor('hw_vari', 'ucom', 'I:2:FCP:R:HV=', hwvari_extract),
+                      Extractor('sail_img_id', 'sail', 'SAIL image id: ', sail_img_id_extract)]:
+        env_info.add(extractor)
+        rule_engine.add_static(extractor.console, extractor.literal, 'extract')
+
+def env_info_captured(extractor):
+    rule_engine.remove_static(extractor.console, extractor.literal, 'extract')
+    env_info.save(os.path.join(logfpath, ENV_INFO_FILE))
+
+def rule_engine_error(message):
+    testlog_write(TESTLOG_WRITE, f'[tool]    :{timestamp_get()} 監視ルールエラー {message}')
+
+#監視ルール毎の検知回数(試験終了時にテストログへ出力)
+def rule_engine_report():
+    for name, count in rule_engine.stats().items():
+        testlog_write(TESTLOG_WRITE, f'[tool]    :{timestamp_get()} 監視ルール {name} 検知{count}回')
+    #受信時の照合(監視対象ログを含む行の割合)。割合が高い場合は監視ルールのパターンを見直す
+    for name, stats in rule_engine.filter_stats().items():
+        if stats['lines']:
+            testlog_write(TESTLOG_WRITE, f'{CONSOLE_LOG_PREFIX[name]}{timestamp_get()} 監視対象行 '
+                          f'{stats["passed"]}/{stats["lines"]}行({stats["ratio"] * 100:.2f}%)')
+
+#検知ログのテストログ見出し(集計スクリプトが参照するため従来の書式のまま。見出し付き(フェールセーフ)は'[ucom]    :')
+RULE_LOG_PREFIX = {
+    'ucom'    : '[ucom]     :',
+    'qnx'     : '[qnx]     :',
+    'android' : '[android] :',
+    'sail'    : '[sail]    :',
+}
+RULE_LOG_LABEL_PREFIX = {
+    'ucom'    : '[ucom]    :',
+}
+
+#監視ルールの処理
+def rule_log(hit, label=None):
+    if label is None:
+        error_data = RULE_LOG_PREFIX[hit.console] + hit.timestamp + ' ' + hit.line
+    else:
+        prefix = RULE_LOG_LABEL_PREFIX.get(hit.console, RULE_LOG_PREFIX[hit.console])
+        error_data = f'{prefix}{hit.timestamp} {label} : {hit.line}'
+    testlog_write(TESTLOG_WRITE, error_data)
+
+def rule_set(hit, name, value):
+    if name not in RULE_VARIABLES:
+        raise ValueError(f'{name} は変更できません')
+    globals()[name] = value
+
+def rule_print(hit):
+    print(f'"{hit.line}"を検知')
+
+def rule_record(hit, key):
+    #フェールセーフはfailsafe_record()で記録済み(以前のバージョンで生成したルールファイルの['record', 'failsafe']は無視する)
+    if key == 'failsafe':
+        return
+    cycle_recorder.add(key, {'rule': hit.rule.name, 'console': hit.console, 'at': hit.timestamp, 'line': hit.line})
+
+#フェールセーフ検知をサイクルの記録に追加する(ルールファイルの内容に関係なく、一覧の先に一致した1つのみ)
+def failsafe_record(name, readdata, hits, mono):
+    if name != 'ucom':
+        return
+    for i, failsafe in enumerate(ucom_failsafe_list):
+        if failsafe[1] in hits:
+            cycle_recorder.add('failsafe', {'rule': f'failsafe_{i}', 'console': name, 'at': timestamp_from(mono), 'line': readdata})
+            return
+
+#SAILの特定ログが検出されない状態で、'PMT:ASEE T.O'を検知した場合は停止(相関ルールから呼ばれる)
+def rule_asee_teststop(hit):
+    global test_task
 
-def ucom_serial_communication():
-    global ucom_console_list
-    global suspend_wait_flag
-    global resume_wait_flag
-    
-    ucom_contine_flag = True
-    ucom_timeout_count = 0
-    while tool_state == TOOL_STATE_RUN:
-        try:
-            if ucom_contine_flag == True:
-                ser_ucom = serial.Serial(UCOM_COM_PORT, 115200, timeout=1)
-                ucom_contine_flag = False
-            ucom_readdata = ser_ucom.readline().decode('utf-8')
-            if ucom_readdata:
-                ucom_timeout_count = 0
-                ucom_readdata = ucom_readdata.strip()
-                if ucom_readdata:
-                    lock1.acquire()
-                    ucom_console_list.append(ucom_readdata)
-                    if len(ucom_console_list) > 1000:
-                        ucom_console_list.pop(0)
-                    lock1.release()
-                    timestamp = timestamp_get()
-                    ucom_error_monitor(ucom_readdata,timestamp)
-                    with open(logfpath + '/ucom_' + str(log_index) + '.log', 'a',encoding="utf-8") as ucom_f:
-                        ucom_f.write(timestamp + ucom_readdata + "\n")
-                    if suspend_trigger_list[suspend_select_trigger][0] == 'ucom':
-                        if suspend_trigger_list[suspend_select_trigger][1] in ucom_readdata:
-                            suspend_wait_flag = 0
-                            
-                    if resume_trigger_list[resume_select_trigger][0] == 'ucom':
-                        if resume_trigger_list[resume_select_trigger][1] in ucom_readdata:
-                            resume_wait_flag = 0
-            else:
-                ucom_timeout_count += ucom_timeout_count
-                if ucom_timeout_count > 500:
-                    ser_ucom.close()
-                    ser_ucom = serial.Serial(UCOM_COM_PORT, 115200, timeout=1)
-                    timestamp = timestamp_get()
-                    testlog_write(TESTLOG_WRITE, '[ucom]     :' + timestamp_get() + 'serial通信途絶(500sec).' )
-                    ucom_timeout_count = 0
-                
-            if not q_ucom.empty():
-                ucom_evid, ucom_evdata = q_ucom.get()
-                if ucom_evid == EV_UCOM_SER_WRITE:
-                    ucom_senddata = ucom_evdata + "\r"
-                    ser_ucom.write(ucom_senddata.encode('utf-8'))
-                else:
-                    pass
-                q_ucom.task_done()
-        except UnicodeDecodeError as e:
-            pass
-        except UnicodeEncodeError as e:
-            pass
-        except serial.SerialException as e:
-            if ser_ucom.isOpen() == True:
-                ser_ucom.close()
-            testlog_write(TESTLOG_WRITE, '[ucom]     :' + timestamp_get() + 'serial通信接続失敗,5秒後に再接続実施' )
-            ucom_contine_flag = True
-            time.sleep(5) 
-    if ser_ucom.isOpen() == True:
-        ser_ucom.close()
-
-
-def qnx_serial_communication():
-    global qnx_console_list
-    global suspend_wait_flag
-    global resume_wait_flag
-    
-    qnx_contine_flag = True
-    qnx_timeout_count = 0
-    while tool_state == TOOL_STATE_RUN:
-        try:
-            if qnx_contine_flag == True:
-                ser_qnx = serial.Serial(QNX_COM_PORT, 115200, timeout=1)
-                qnx_contine_flag = False
-            qnx_readdata = ser_qnx.readline().decode('utf-8')
-            if qnx_readdata:
-                qnx_timeout_count = 0
-                qnx_readdata = qnx_readdata.strip()
-                if qnx_readdata:
-                    lock2.acquire()
-                    qnx_console_list.append(qnx_readdata)
-                    if len(qnx_console_list) > 1000:
-                        qnx_console_list.pop(0)
-                    lock2.release()
-                    timestamp = timestamp_get()
-                    qnx_error_monitor(qnx_readdata,timestamp)
-                    with open(logfpath + '/qnx_' + str(log_index) + '.log', 'a',encoding="utf-8") as qnx_f:
-                        qnx_f.write(timestamp + qnx_readdata + "\n")
-                    if suspend_trigger_list[suspend_select_trigger][0] == 'qnx':
-                        if suspend_trigger_list[suspend_select_trigger][1] in qnx_readdata:
-                            suspend_wait_flag = 0
-                            
-                    if resume_trigger_list[resume_select_trigger][0] == 'qnx':
-                        if resume_trigger_list[resume_select_trigger][1] in qnx_readdata:
-                            resume_wait_flag = 0
-            else:
-                qnx_timeout_count += qnx_timeout_count
-                if qnx_timeout_count > 500:
-                    ser_qnx.close()
-                    ser_qnx = serial.Serial(QNX_COM_PORT, 115200, timeout=1)
-                    timestamp = timestamp_get()
-                    testlog_write(TESTLOG_WRITE, '[qnx]     :' + timestamp_get() + 'serial通信途絶(500sec).' )
-                    qnx_timeout_count = 0
-                
-            if not q_qnx.empty():
-                qnx_evid, qnx_evdata = q_qnx.get()
-                if qnx_evid == EV_QNX_SER_WRITE:
-                    qnx_senddata = qnx_evdata + "\r"
-                    ser_qnx.write(qnx_senddata.encode('utf-8'))
-                else:
-                    pass
-                q_qnx.task_done()
-        except UnicodeDecodeError as e:
-            pass
-        except UnicodeEncodeError as e:
-            pass
-        except serial.SerialException as e:
-            if ser_qnx.isOpen() == True:
-                ser_qnx.close()
-            testlog_write(TESTLOG_WRITE, '[qnx]     :' + timestamp_get() + 'serial通信接続失敗,5秒後に再接続実施' )
-            qnx_contine_flag = True
-            time.sleep(5) 
-    if ser_qnx.isOpen() == True:
-        ser_qnx.close()
-
-
-def android_serial_communication():
-    global android_console_list
-    
-    android_contine_flag = True
-    android_timeout_count = 0
-    while tool_state == TOOL_STATE_RUN:
-        try:
-            if android_contine_flag == True:
-                ser_android = serial.Serial(ANDROID_COM_PORT, 115200, timeout=1)
-                android_contine_flag = False
-            android_readdata = ser_android.readline().decode('utf-8')
-            if android_readdata:
-                android_timeout_count = 0
-                android_readdata = android_readdata.strip()
-                if android_readdata:
-                    lock3.acquire()
-                    android_console_list.append(android_readdata)
-                    if len(android_console_list) > 1000:
-                        android_console_list.pop(0)
-                    lock3.release()
-                    timestamp = timestamp_get()
-                    android_error_monitor(android_readdata,timestamp)
-                    with open(logfpath + '/android_' + str(log_index) + '.log', 'a',encoding="utf-8") as android_f:
-                        android_f.write(timestamp + android_readdata + "\n")
-            else:
-                android_timeout_count += android_timeout_count
-                if android_timeout_count > 500:
-                    ser_android.close()
-                    ser_android = serial.Serial(ANDROID_COM_PORT, 115200, timeout=1)
-                    timestamp = timestamp_get()
-                    testlog_write(TESTLOG_WRITE, '[android] :' + timestamp_get() + 'serial通信途絶(500sec).' )
-                    android_timeout_count = 0
-                
-            if not q_android.empty():
-                android_evid, android_evdata = q_android.get()
-                if android_evid == EV_ANDROID_SER_WRITE:
-                    android_senddata = android_evdata + "\r"
-                    ser_android.write(android_senddata.encode('utf-8'))
-                else:
-                    pass
-                q_android.task_done()
-        except UnicodeDecodeError as e:
-            pass
-        except UnicodeEncodeError as e:
-            pass
-        except serial.SerialException as e:
-            if ser_android.isOpen() == True:
-                ser_android.close()
-            testlog_write(TESTLOG_WRITE, '[android] :' + timestamp_get() + 'serial通信接続失敗,5秒後に再接続実施' )
-            android_contine_flag = True
-            time.sleep(5) 
-    if ser_android.isOpen() == True:
-        ser_android.close()
-
-
-def sail_serial_communication():
-    global sail_console_list
-    
-    sail_contine_flag = True
-    sail_timeout_count = 0
-    while tool_state == TOOL_STATE_RUN:
-        try:
-            if sail_contine_flag == True:
-                ser_sail = serial.Serial(SAIL_COM_PORT, 115200, timeout=1)
-                sail_contine_flag = False
-            sail_readdata = ser_sail.readline().decode('utf-8')
-            if sail_readdata:
-                sail_timeout_count = 0
-                sail_readdata = sail_readdata.strip()
-                if sail_readdata:
-                    lock4.acquire()
-                    sail_console_list.append(sail_readdata)
-                    if len(sail_console_list) > 1000:
-                        sail_console_list.pop(0)
-                    lock4.release()
-                    timestamp = timestamp_get()
-                    sail_error_monitor(sail_readdata,timestamp)
-                    with open(logfpath + '/sail_' + str(log_index) + '.log', 'a',encoding="utf-8") as sail_f:
-                        sail_f.write(timestamp + sail_readdata + "\n")
-            else:
-                sail_timeout_count += sail_timeout_count
-                if sail_timeout_count > 500:
-                    ser_sail.close()
-                    ser_sail = serial.Serial(SAIL_COM_PORT, 115200, timeout=1)
-                    timestamp = timestamp_get()
-                    testlog_write(TESTLOG_WRITE, '[sail]     :' + timestamp_get() + 'serial通信途絶(500sec).再接続実施' )
-                    sail_timeout_count = 0
-                
-            if not q_sail.empty():
-                sail_evid, sail_evdata = q_sail.get()
-                if sail_evid == EV_SAIL_SER_WRITE:
-                    sail_senddata = list(sail_evdata)
-                    sail_senddata.append('\r')
-                    for data in sail_senddata:
-                        ser_sail.write(data.encode('utf-8'))
-                        time.sleep(0.2)
-                else:
-                    pass
-                q_sail.task_done()
-        except UnicodeDecodeError as e:
-            pass
-        except UnicodeEncodeError as e:
-            pass
-        except serial.SerialException as e:
-            if ser_sail.isOpen() == True:
-                ser_sail.close()
-            testlog_write(TESTLOG_WRITE, '[sail]     :' + timestamp_get() + 'serial通信接続失敗,5秒後に再接続実施' )
-            sail_contine_flag = True
-            time.sleep(5) 
-    if ser_sail.isOpen() == True:
-        ser_sail.close()
-
-
-def ucom_error_monitor(readdata, time):
-    global sleep_chk_flg
+    if ASEE_TO_TESTSTOP == 1 and test_task == TASK_SUPEND_WAIT:
+        print('"PMT:ASEE T.O"を検知')
+        test_task = TASK_STOP
+
+def rule_dump_end(hit):
     global test_task
-    
-    ucom_error_flg = 0
-#    system_ucom_extract(readdata)
-#    fcp_extract(readdata)
-#    hwvari_extract(readdata)
-    
-    if 'PMT:Meter Fin End' in readdata:
-        sleep_chk_flg = 1
-    elif 'PMT:ASEE T.O.' in readdata:
-        sleep_chk_flg = 10
-        #SAILの特定ログが検出されない状態で、'PMT:ASEE T.O'を検知した場合は停止
-        if ASEE_TO_TESTSTOP == 1 and test_task == TASK_SUPEND_WAIT:
-            if sail_Interrupt_check1 == 0 or sail_Interrupt_check2 == 0:
-                print('"PMT:ASEE T.O"を検知')
-                test_task = TASK_STOP
-    elif 'PMT:ASEE High' in readdata:
-        sleep_chk_flg = 0
-
-    if ucom_error_flg == 1:
-        error_data = '[ucom]     :' + time + ' ' + readdata
-        testlog_write(TESTLOG_WRITE, error_data)
-
-    for i in range(len(ucom_failsafe_list)):
-        if ucom_failsafe_list[i][1] in readdata:
-            error_data =f'[ucom]    :{time} {ucom_failsafe_list[i][0]} : {readdata}'
-            testlog_write(TESTLOG_WRITE, error_data)
-            break
+    global test_task_copy
 
+    if DUMP_MODE == 2:
+        if test_task == TASK_RUMDUMP_WAIT:
+            #RAMdumpの終了判定(RAMDump終了後のリセットタイミング)
+            test_task = TASK_ERROR
+    else:
+        if test_task != TASK_ERROR:
+            test_task_copy = test_task
+            test_task = TASK_ERROR
 
-def qnx_error_monitor(readdata, time):
+def rule_ramdump(hit):
     global test_task
     global test_task_copy
     global ramdump_timeoutcnt
 
-    qnx_error_flg = 0
-    if 'devctl(STR) result: 11' in readdata:
-        qnx_error_flg = 1
-    elif 'devctl(STR) result: 16' in readdata:
-        qnx_error_flg = 1
-    elif 'devctl(STR) result: 120' in readdata:
-        qnx_error_flg = 1
-    elif 'devctl(STR) result: -' in readdata:
-        qnx_error_flg = 1
-    elif 'devctl(STR): retry_cnt:' in readdata:
-        qnx_error_flg = 1
-    elif 'str_ctrl_retry' in readdata:
-        qnx_error_flg = 1
-    elif 'dumping to /var/log/' in readdata:
-        if '.core' in readdata:
-            qnx_error_flg = 1
-    elif 'Format: Log Type - Time(microsec)' in readdata:
-        if test_task != TASK_INIT:
-            qnx_error_flg = 1
-            if DUMP_MODE == 2:
-                if test_task == TASK_RUMDUMP_WAIT:
-                    #RAMdumpの終了判定(RAMDump終了後のリセットタイミング)
-                    test_task = TASK_ERROR
+    if DUMP_MODE == 2:
+        if test_task != TASK_RUMDUMP_WAIT and test_task != TASK_ERROR:
+            if '(0 Bytes)' in hit.line:
+                #RamDumpデータなし
+                test_task_copy = test_task
+                test_task = TASK_ERROR
             else:
-                if test_task != TASK_ERROR:
-                    test_task_copy = test_task
-                    test_task = TASK_ERROR
-    elif 'RamDump -  Image Loaded, Delta' in readdata:
-        if test_task != TASK_INIT:
-            if DUMP_MODE == 2:
-                if test_task != TASK_RUMDUMP_WAIT and test_task != TASK_ERROR:
-                    if '(0 Bytes)' in readdata:
-                        #RamDumpデータなし
-                        test_task_copy = test_task
-                        test_task = TASK_ERROR
-                    else:
-                        #RAMdumpの開始判定
-                        qnx_error_flg = 1
-                        test_task_copy = test_task
-                        ramdump_timeoutcnt = 0
-                        test_task = TASK_RUMDUMP_WAIT
-    else:
-        qnx_error_flg = 0
-    if qnx_error_flg == 1:
-        error_data = '[qnx]     :' + time + ' ' + readdata
-        testlog_write(TESTLOG_WRITE, error_data)
-
-def android_error_monitor(readdata, time):
-    global sail_Interrupt_check1
-    global sail_Interrupt_check2
-    
-    android_error_flg = 0
-    if 'abnormal_reset' in readdata:
-        android_error_flg = 1
-    elif 'reboot: Power down' in readdata:
-        android_error_flg = 1
-    elif 'Interrupt disabled successfully' in readdata:
-        if 'prvXBLDeInit_Sleep xSleepDriverAck Success' in readdata:
-            sail_Interrupt_check1 = 1
-            print(f'"{readdata}"を検知')
-        elif 'Ack to MD : 0xAA030000' in readdata:
-            sail_Interrupt_check2 = 1
-            print(f'"{readdata}"を検知')
-    if android_error_flg == 1:
-        error_data = '[android] :' + time + ' ' + readdata
-        testlog_write(TESTLOG_WRITE, error_data)
-
-def sail_error_monitor(readdata, time):
-    sail_error_flg = 0
-#    sail_img_id_extract(readdata)
-    if sail_error_flg == 1:
-        error_data = '[sail]    :' + time + ' ' + readdata
-        testlog_write(TESTLOG_WRITE, error_data)
+                #RAMdumpの開始判定
+                rule_log(hit)
+                test_task_copy = test_task
+                ramdump_timeoutcnt = 0
+                test_task = TASK_RUMDUMP_WAIT
+
+#シリアル通信の開始
+#uCom/QNX/android/SAIL/ぴかぱちの全ポートを1つのreactorで多重化する
+def console_reactor_start():
+    global console_reactor
+    global port_supervisor
+
+    raw_capture = console_chunk_receive if RAW_CAPTURE == 1 else None
+    console_reactor = ConsoleReactor()
+    console_reactor.add_console('ucom', UCOM_COM_PORT, 115200, on_line=console_line_receive, on_chunk=raw_capture,
+                                write_queue=q_ucom, encode=console_write_encode,
+                                on_error=console_serial_error, silence_timeout=500, on_silence=console_serial_silence,
+                                on_sent=console_command_sent, on_echo=console_command_echo, on_reopen=console_serial_reopen)
+    console_reactor.add_console('qnx', QNX_COM_PORT, 115200, on_line=console_line_receive, on_chunk=raw_capture,
+                                write_queue=q_qnx, encode=console_write_encode,
+                                on_error=console_serial_error, silence_timeout=500, on_silence=console_serial_silence,
+                                on_sent=console_command_sent, on_echo=console_command_echo, on_reopen=console_serial_reopen)
+    console_reactor.add_console('android', ANDROID_COM_PORT, 115200, on_line=console_line_receive, on_chunk=raw_capture,
+                                write_queue=q_android, encode=console_write_encode,
+                                on_error=console_serial_error, silence_timeout=500, on_silence=console_serial_silence,
+                                on_sent=console_command_sent, on_echo=console_command_echo, on_reopen=console_serial_reopen)
+    console_reactor.add_console('sail', SAIL_COM_PORT, 115200, on_line=console_line_receive, on_chunk=raw_capture,
+                                write_queue=q_sail, encode=sail_write_encode,
+                                on_error=console_serial_error, silence_timeout=500, on_silence=console_serial_silence,
+                                on_sent=console_command_sent, on_echo=console_command_echo, on_reopen=console_serial_reopen,
+                                echo_paced=True, pace_min_gap=SAIL_PACE_MIN_GAP)
+    console_reactor.add_console('pika', PIKA_COM_PORT, 38400, write_queue=q_pika, encode=pika_write_encode,
+                                on_error=console_serial_error, on_reopen=console_serial_reopen,
+                                drop_when_closed=True, track_echo=False,
+                                parity=serial.PARITY_NONE)
+    console_reactor.start()
+    #USBシリアルの抜け/再認識を監視し、再認識したポートは即時に再接続する
+    port_supervisor = PortSupervisor(console_reactor)
+    port_supervisor.start()
+
+CONSOLE_LOG_PREFIX = {
+    'ucom'    : '[ucom]     :',
+    'qnx'     : '[qnx]     :',
+    'android' : '[android] :',
+    'sail'    : '[sail]     :',
+    'pika'    : '[pika]    :',
+}
+
+def console_serial_error(name, error):
+    testlog_write(TESTLOG_WRITE, CONSOLE_LOG_PREFIX[name] + timestamp_get() + 'serial通信接続失敗,再接続待ち(' + str(error) + ')' )
+
+def console_serial_reopen(name, lost):
+    testlog_write(TESTLOG_WRITE, CONSOLE_LOG_PREFIX[name] + timestamp_get() + f'serial再接続完了(ログ欠落{lost:.2f}sec)' )
+
+#ポート毎の接続時間/ログ欠落回数(試験終了時にテストログへ出力)
+def console_health_report():
+    for name, health in console_reactor.health().items():
+        testlog_write(TESTLOG_WRITE, CONSOLE_LOG_PREFIX[name] + timestamp_get() +
+                      f'接続時間{health["up_seconds"]:.0f}sec ログ欠落{health["lost_windows"]}回({health["lost_seconds"]:.1f}sec)' )
+
+def console_serial_silence(name):
+    testlog_write(TESTLOG_WRITE, CONSOLE_LOG_PREFIX[name] + timestamp_get() + 'serial通信途絶(500sec).再接続実施' )
+
+#コマンド送信記録(writerスレッド)
+#送信完了時刻とエコー受信までの時間を該当コンソールログに残す
+def console_command_sent(name, record):
+    senddata = '>> ' + record.text
+    cps = record.chars_per_sec()
+    if cps is not None:
+        senddata += f' ({cps:.1f}char/s'
+        if record.fallbacks:
+            senddata += f' エコー待ちタイムアウト:{record.fallbacks}'
+        senddata += ')'
+    log_pipeline.put(('cmd:' + name, log_index, record.sent, senddata))
+
+#SAILコマンドの送信速度(試験終了時にテストログへ出力)
+def sail_pace_report():
+    writer = console_reactor.console('sail').writer
+    cps = writer.pace_rate()
+    if cps is not None:
+        testlog_write(TESTLOG_WRITE, f'[sail]     :{timestamp_get()} コマンド送信速度 {cps:.1f}char/s '
+                      f'({writer.paced_chars}文字 エコー待ちタイムアウト:{writer.paced_fallbacks})')
+
+def console_command_echo(name, record):
+    log_pipeline.put(('cmd:' + name, log_index, record.echoed, f'<< echo(+{record.echo_ms():.0f}ms) ' + record.text))
+
+#コマンド送信データ(ucom/qnx/android共通:末尾CR)
+def console_write_encode(item):
+    evid, evdata = item
+    if evid in (EV_UCOM_SER_WRITE, EV_QNX_SER_WRITE, EV_ANDROID_SER_WRITE):
+        return [((evdata + "\r").encode('utf-8'), 0)]
+    return []
+
+#SAILは1文字ずつ送信(エコー受信で次の文字、最大SAIL_PACE_TIMEOUT秒待ち)
+def sail_write_encode(item):
+    sail_evid, sail_evdata = item
+    if sail_evid == EV_SAIL_SER_WRITE:
+        sail_senddata = list(sail_evdata)
+        sail_senddata.append('\r')
+        return [(data.encode('utf-8'), SAIL_PACE_TIMEOUT) for data in sail_senddata]
+    return []
+
+#ぴかぱち(SW Control → 操作コードの順に送信)
+def pika_write_encode(item):
+    pika_evid, pika_evdata = item
+    if pika_evid == EV_PIKA_SER_WRITE:
+        return pika_evdata
+    return []
+
+#受信データ保存(reactorスレッド)
+#デコード等は行わず、受信したバイト列と受信時刻をそのまま書き込む
+def console_chunk_receive(name, data, mono):
+    console_logs.capture(name, log_index, data, capture_clock.wall(mono))
+
+#受信処理(reactorスレッド)
+#受信時刻(チャンク受信時のperf_counter値)を付与してパイプラインへ渡すのみ。監視対象ログの照合・ログ保存・監視は各消費スレッドで行う
+def console_line_receive(name, readdata, mono):
+    readdata = readdata.strip()
+    if readdata:
+        log_pipeline.put((name, log_index, mono, readdata))
+
+#取りこぼしてはいけないログ(フェールセーフ/トリガー/エラー判定対象)
+#リングが満杯で破棄する直前の行のみ照合する(通常は受信スレッドで照合しない)
+#受信スレッドが監視ルールの再読み込みを待たないよう、ロックなし・集計なしで照合する
+def console_log_is_priority(item):
+    name, index, mono, readdata = item
+    return name in ('tool', 'mark') or bool(rule_engine.match(name, readdata, count=False))
+
+def console_log_drop(stage, count):
+    testlog_write(TESTLOG_WRITE, f'[tool]    :{timestamp_get()} ログ処理遅延のため{count}行を破棄({stage})')
+
+#ログ保存(消費スレッド)
+def console_log_persist(item):
+    global ucom_console_list
+    global qnx_console_list
+    global android_console_list
+    global sail_console_list
+
+    name, index, mono, readdata = item
+    if name == 'mark':
+        console_logs.mark(index, *readdata)
+        return
+    second = int(capture_clock.wall(mono))
+    if log_timeline is not None:
+        if name == 'tool':
+            log_timeline.add(index, mono, 'tool', banner_text(readdata))
+        else:
+            log_timeline.add(index, mono, name.replace('cmd:', ''), readdata)
+    if name == 'tool':
+        console_logs.label(index, readdata)
+        return
+    if name.startswith('cmd:'):
+        console_logs.write(name[4:], index, timestamp_from(mono) + readdata + "\n", second)
+        return
+    if name == 'ucom':
+        lock1.acquire()
+        ucom_console_list.append(readdata)
+        if len(ucom_console_list) > 1000:
+            ucom_console_list.pop(0)
+        lock1.release()
+    elif name == 'qnx':
+        lock2.acquire()
+        qnx_console_list.append(readdata)
+        if len(qnx_console_list) > 1000:
+            qnx_console_list.pop(0)
+        lock2.release()
+    elif name == 'android':
+        lock3.acquire()
+        android_console_list.append(readdata)
+        if len(android_console_list) > 1000:
+            android_console_list.pop(0)
+        lock3.release()
+    elif name == 'sail':
+        lock4.acquire()
+        sail_console_list.append(readdata)
+        if len(sail_console_list) > 1000:
+            sail_console_list.pop(0)
+        lock4.release()
+    console_logs.write(name, index, timestamp_from(mono) + readdata + "\n", second)
+
+#ログ監視(消費スレッド)
+def console_log_monitor(item):
+    name, index, mono, readdata = item
+    if name not in MONITOR_CONSOLES:
+        return
+    if rule_engine.reload_if_changed():
+        testlog_write(TESTLOG_WRITE, f'[tool]    :{timestamp_get()} 監視ルールを再読み込みしました({MONITOR_RULES_FILE})')
+    rule_engine.expire(mono)
+    #大半の行はどのログにも一致しない(前段のフィルタで除外される)ので、ここで終了する
+    hits = rule_engine.match(name, readdata)
+    if not hits:
+        return
+    rule_engine.evaluate(name, readdata, hits, timestamp_from(mono), mono)
+    failsafe_record(name, readdata, hits, mono)
+    env_info.feed(name, readdata, hits)
+
+    if suspend_trigger_list[suspend_select_trigger][0] == name:
+        if suspend_trigger_list[suspend_select_trigger][1] in hits:
+            suspend_trigger.fire(mono, readdata)
+
+    if resume_trigger_list[resume_select_trigger][0] == name:
+        if resume_trigger_list[resume_select_trigger][1] in hits:
+            resume_trigger.fire(mono, readdata)
+
+    if suspend_trigger_list[suspend_select_trigger][2] == name:
+        if suspend_trigger_list[suspend_select_trigger][3] in hits:
+            resume_success.fire(mono, readdata)
+
+
+#testlog.txt先頭の回数欄
+def testlog_counter_header():
+    return CounterHeader(logfpath + "/testlog.txt",
+                         ['suspend_count', 'resume_count', 'suspend_error_count', 'resume_error_count',
+                          'consecutive_success_count', 'consecutive_success_max_count'],
+                         "COUNTLOG:------------------------------------------------------------------\n",
+                         "TESTLOG:-------------------------------------------------------------------\n")
+
+def testlog_counts():
+    return {
+        'suspend_count': suspend_count,
+        'resume_count': resume_count,
+        'suspend_error_count': supend_error_count,
+        'resume_error_count': resume_error_count,
+        'consecutive_success_count': consecutive_success_count,
+        'consecutive_success_max_count': consecutive_success_max_count,
+    }
 
 def testlog_write(req, writedata):
     lock5.acquire()
     if req == COUNTLOG_WRITE_INIT:
-        lines = []
-        lines.append("COUNTLOG:------------------------------------------------------------------\n")
-        lines.append("suspend_count:" + str(suspend_count) + "\n")
-        lines.append("resume_count:" + str(resume_count) + "\n")
-        lines.append("suspend_error_count:" + str(supend_error_count) + "\n")
-        lines.append("resume_error_count:" + str(resume_error_count) + "\n")
-        lines.append("consecutive_success_count:" + str(consecutive_success_count) + "\n")
-        lines.append("consecutive_success_max_count:" + str(consecutive_success_max_count) + "\n")
-        lines.append("TESTLOG:-------------------------------------------------------------------\n")
-        with open(logfpath + "/testlog.txt", 'w',encoding="utf-8") as test_f:
-            test_f.writelines(lines)
+        testlog_counter_header().create(testlog_counts())
     elif req == COUNTLOG_WRITE:
-        with open(logfpath + "/testlog.txt", 'r',encoding="utf-8") as test_f:
-            lines = test_f.readlines()
-        lines[0] = "COUNTLOG:------------------------------------------------------------------\n"
-        lines[1] = "suspend_count:" + str(suspend_count) + "\n"
-        lines[2] = "resume_count:" + str(resume_count) + "\n"
-        lines[3] = "suspend_error_count:" + str(supend_error_count) + "\n"
-        lines[4] = "resume_error_count:" + str(resume_error_count) + "\n"
-        lines[5] = "consecutive_success_count:" + str(consecutive_success_count) + "\n"
-        lines[6] = "consecutive_success_max_count:" + str(consecutive_success_max_count) + "\n"
-        lines[7] = "TESTLOG:-------------------------------------------------------------------\n"
-        with open(logfpath + "/testlog.txt", 'w',encoding="utf-8") as test_f:
-            test_f.writelines(lines)
+        #先頭の回数欄(固定幅)のみを上書きする。testlog.txtの長さに関係なく一定時間で終わる
+        testlog_counter_header().update(testlog_counts())
     elif req == TESTLOG_WRITE:
         with open(logfpath + "/testlog.txt", 'a',encoding="utf-8") as test_f:
             test_f.write(writedata + "\n")
@@ -1834,25 +2069,15 @@ def func_wait(timedata):
             break
     return result
 
-def consol_log_label(str_data):
-
-    timestamp = timestamp_get()
+def consol_log_label(str_data, marker=MARKER_OTHER):
 
-    with open(logfpath + '/ucom_' + str(log_index) + '.log', 'a',encoding="utf-8") as f:
-        f.write(f'#################### {timestamp} {str_data} ####################\n')
+    mono = capture_clock.now()
+    timestamp = timestamp_from(mono)
 
-    with open(logfpath + '/qnx_' + str(log_index) + '.log', 'a',encoding="utf-8") as f:
-        f.write(f'#################### {timestamp} {str_data} ####################\n')
-
-    with open(logfpath + '/android_' + str(log_index) + '.log', 'a',encoding="utf-8") as f:
-        f.write(f'#################### {timestamp} {str_data} ####################\n')
-
-    with open(logfpath + '/sail_' + str(log_index) + '.log', 'a',encoding="utf-8") as f:
-        f.write(f'#################### {timestamp} {str_data} ####################\n')
+    log_mark(OFFSET_MARKER, marker, cycle_recorder.cycles)
+    log_pipeline.put(('tool', log_index, mono, f'#################### {timestamp} {str_data} ####################\n'))
 
 def func_susres_test():
-    global suspend_wait_flag
-    global resume_wait_flag
     global log_index
     global suspend_count
     global resume_count
@@ -1868,18 +2093,23 @@ def func_susres_test():
     global resume_select_trigger
     global resume_time
     global sleep_chk_flg
-    global sail_Interrupt_check1
-    global sail_Interrupt_check2
     global resume_after_trigger
     global tool_state
     global log_max_count
    
     time.sleep(5)
     testlog_write(COUNTLOG_WRITE_INIT,'')
+    if ADB_SS_ENABLE == 1:
+        build_number_extract()
     susres_test_info(into_info='試験開始')
+    accon_done = False
+    accoff_done = False
     while tool_state == TOOL_STATE_RUN:
+        #トリガー待ちで0.1秒ブロックした周回は末尾の待ちを省略する
+        waited = False
         if  test_task == TASK_INIT:
             sleep_chk_flg = 0
+            accoff_done = False
             log_max_count = TESTLOG_MAX_COUNT
             resume_after_trigger = ['','']
             senddata = 'slog2info'
@@ -2007,7 +2237,10 @@ def func_susres_test():
 
             for i in range(5):
                 acconoffreason=f"initial ACC&IG ON {i+1}/5"
-                pika_stop(acconoffreason) 
+                #折り返しで既にACC OFFしている場合は1回目のACC OFFを送らない
+                if not accoff_done:
+                    pika_stop(acconoffreason) 
+                accoff_done = False
                 time.sleep(10)
                 pika_restart(acconoffreason)
                 time.sleep(10)
@@ -2018,10 +2251,13 @@ def func_susres_test():
 
         elif test_task == TASK_SUPEND:
                #add
-            pika_stop(accoff_reason)
-            suspend_wait_flag = 1
-            sail_Interrupt_check1 = 0
-            sail_Interrupt_check2 = 0
+            #ACC OFF直後に出るトリガーも取りこぼさないよう、ACC OFF前から待ち受ける
+            suspend_trigger.arm(capture_clock.now())
+            cycle_start()
+            accoff_time = pika_stop(accoff_reason)
+            cycle_recorder.mark('acc_off', capture_clock.wall(accoff_time))
+            accon_done = False
+            rule_engine.reset('acc_off')
             accoff_start_time = int(time.time())
             if TOOL_MODE == 0:
                 senddata = '/vendor/bin/candy-test-ivehicle set 557924608 0 int32Values 1 0 0 0'
@@ -2057,10 +2293,12 @@ def func_susres_test():
                     sleep_chk_flg = 0
             
             if TEST_MODE == 0 or TEST_MODE == 1 or TEST_MODE >= 4:
-                if suspend_wait_flag == 1:
+                if suspend_trigger.wait(0.1) is None:
+                    waited = True
                     elapsed_time = int(time.time() - accoff_start_time)
                     if elapsed_time > 300:
                         testlog_write(TESTLOG_SUS_ERROR, "")
+                        cycle_recorder.finish('suspend_timeout', time.time())
                         test_task = TASK_INIT
                         test_task_copy = TASK_NONE
                         supend_error_count += 1
@@ -2068,17 +2306,27 @@ def func_susres_test():
                         if CAMERA_ENABLE == True:
                             q_camera.put(EV_CAMERA_SS_SUS_ERR)
                             q_camera.join()
+                        log_failure(FAILURE_SUS_TIMEOUT)
                         log_index += 1
                         susres_test_info(into_info='エラー検知')
                         if test_stop_flag == True:
                             tool_state = TOOL_STATE_END
 
                 else:
+                    cycle_recorder.mark('suspend_log', capture_clock.wall(suspend_trigger.stamp))
+                    latency_record(suspend_latency, 'suspend_ms', accoff_time, suspend_trigger.stamp)
                     if TEST_MODE == 0 or TEST_MODE >= 4:
                         result = func_wait(5)
                         accon_reason = ''
                     elif TEST_MODE == 1:
                         accon_reason = f'Detection of log "{suspend_trigger_list[suspend_select_trigger][1]}"'
+                        #折り返し:検知したら集計/撮影より先にACC ONする
+                        resume_trigger.arm(capture_clock.now())
+                        resume_success.arm(capture_clock.now())
+                        accon_time = trigger_foldback(suspend_trigger, pika_restart, accon_reason, 'ACC ON')
+                        accon_start_time = int(capture_clock.wall(accon_time))
+                        cycle_recorder.mark('acc_on', capture_clock.wall(accon_time))
+                        accon_done = True
                     if test_task == TASK_SUPEND_WAIT:
                         suspend_count += 1
                         testlog_write(COUNTLOG_WRITE,'')
@@ -2101,14 +2349,18 @@ def func_susres_test():
 
         elif test_task == TASK_RESUME:
                  #add
-            resume_wait_flag = 1
-            if TEST_MODE == 0 or TEST_MODE >= 4:
-                pika_restart()
-            else:
-                pika_restart(accon_reason)
+            if not accon_done:
+                resume_trigger.arm(capture_clock.now())
+                resume_success.arm(capture_clock.now())
+                if TEST_MODE == 0 or TEST_MODE >= 4:
+                    accon_time = pika_restart()
+                else:
+                    accon_time = pika_restart(accon_reason)
+                cycle_recorder.mark('acc_on', capture_clock.wall(accon_time))
+                accon_start_time = int(time.time())
+            accon_done = False
             wait_count = 0
             sleep_chk_flg = 0
-            accon_start_time = int(time.time())
             if TEST_MODE >= 4:
                 if TEST_MODE == 5:
                     resume_time = ACC_OFFON_TIME
@@ -2196,10 +2448,12 @@ def func_susres_test():
 
         elif test_task == TASK_RESUME_WAIT:
             if TEST_MODE <= 4:
-                if resume_wait_flag == 1:
+                if resume_trigger.wait(0.1) is None:
+                    waited = True
                     elapsed_time = int(time.time() - accon_start_time)
                     if elapsed_time > 180:
                         testlog_write(TESTLOG_RES_ERROR, "")
+                        cycle_recorder.finish('resume_timeout', time.time())
                         test_task = TASK_INIT
                         test_task_copy = TASK_NONE
                         resume_error_count += 1
@@ -2218,15 +2472,21 @@ def func_susres_test():
                         if CAMERA_ENABLE == True:
                             q_camera.put(EV_CAMERA_SS_RES_ERR)
                             q_camera.join()
+                        log_failure(FAILURE_RES_TIMEOUT)
                         log_index += 1
                         susres_test_info(into_info='エラー検知')
                         if test_stop_flag == True:
                             tool_state = TOOL_STATE_END
                 else:
+                    cycle_recorder.mark('resume_log', capture_clock.wall(resume_trigger.stamp))
                     if TEST_MODE == 4:
                         accoff_reason = f'Detection of log "{resume_trigger_list[resume_select_trigger][1]}"'
                         resume_after_trigger[0] = resume_trigger_list[resume_select_trigger][1]
                         resume_after_trigger[1] = resume_trigger_list[resume_select_trigger][4]
+                        #折り返し:検知したら集計/撮影より先にACC OFFする
+                        acc_time = trigger_foldback(resume_trigger, pika_stop, accoff_reason, 'ACC OFF')
+                        cycle_recorder.mark('foldback_acc_off', capture_clock.wall(acc_time))
+                        accoff_done = True
                     else:
                         accoff_reason = None
                         result = func_wait(20)
@@ -2235,6 +2495,8 @@ def func_susres_test():
                     if test_task == TASK_RESUME_WAIT:
                         resume_count += 1
                         consecutive_success_count += 1
+                        resume_latency_record(accon_time)
+                        cycle_recorder.finish('ok', time.time())
                         
                         if consecutive_success_count > consecutive_success_max_count:
                             consecutive_success_max_count = consecutive_success_count
@@ -2285,6 +2547,8 @@ def func_susres_test():
                     accoff_reason = f'{elapsed_time} seconds after Acc On'
                     resume_count += 1
                     consecutive_success_count += 1
+                    resume_latency_record(accon_time)
+                    cycle_recorder.finish('ok', time.time())
                     
                     testlog_write(COUNTLOG_WRITE,'')
                     
@@ -2307,6 +2571,8 @@ def func_susres_test():
             # サスペンド動作中にリセットを検知した場合
             if test_task_copy == TASK_SUPEND or test_task_copy == TASK_SUPEND_WAIT:
                 testlog_write(TESTLOG_RESET_SUS_ERROR, "")
+                cycle_recorder.finish('reset_during_suspend', time.time())
+                log_failure(FAILURE_RESET_SUS)
                 supend_error_count += 1
                 consecutive_success_count = 0
                 if CAMERA_ENABLE == True:
@@ -2315,13 +2581,16 @@ def func_susres_test():
             # レジューム動作中にリセットを検知した場合
             elif test_task_copy == TASK_RESUME or test_task_copy == TASK_RESUME_WAIT:
                 testlog_write(TESTLOG_RESET_RES_ERROR, "")
+                cycle_recorder.finish('reset_during_resume', time.time())
+                log_failure(FAILURE_RESET_RES)
                 resume_error_count += 1
                 consecutive_success_count = 0
                 if CAMERA_ENABLE == True:
                     q_camera.put(EV_CAMERA_SS_RES_ERR)
                     q_camera.join()
             else:
-                pass
+                cycle_recorder.finish('error', time.time())
+                log_failure(FAILURE_ERROR)
             
             # 10秒間待機。エラー時のログ収集のため。
             for i in range(0, 10, 1):
@@ -2349,6 +2618,8 @@ def func_susres_test():
         elif test_task == TASK_STOP:
             #一度入ったらシリアルログ通信以外の動作を行わない
             print('テスト停止、ログは継続')
+            log_failure(FAILURE_STOP)
+            cycle_recorder.finish('stopped', time.time())
             while tool_state == TOOL_STATE_RUN:
                 time.sleep(1)
                 if test_stop_flag == True:
@@ -2356,12 +2627,99 @@ def func_susres_test():
             if test_stop_flag == True:
                 tool_state = TOOL_STATE_END
 
-        time.sleep(0.1)
+        if not waited:
+            time.sleep(0.1)
     
+    cycle_recorder.finish('aborted', time.time())
     testlog_write(COUNTLOG_WRITE,'')
     testlog_write(TESTLOG_END,'')
 
 
+#トリガー検知で即座にACCを切り替える(TEST_MODE 1/4の折り返し)
+#トリガーログの受信時刻から1回目のACC操作コード送信完了までの時間を記録する
+#戻り値:ACC操作の送信完了時刻(perf_counter)
+def trigger_foldback(trigger, pika_switch, reason, label):
+    acc_time = pika_switch(reason)
+    latency = (acc_time - trigger.stamp) * 1000
+    trigger_latency.setdefault(label, []).append(latency)
+    cycle_recorder.mark('foldback_ms', round(latency, 1))
+    testlog_write(TESTLOG_WRITE, f'[tool]    :{timestamp_get()} トリガー検知→{label} {latency:.1f}ms')
+    return acc_time
+
+#エラー検知をオフセット索引に記録する
+#エラーを検知したlog_indexのコンソールログは容量上限を超えても削除しない
+def log_failure(failure):
+    log_mark(OFFSET_FAILURE, failure, cycle_recorder.cycles)
+    if log_retention is not None:
+        log_retention.mark_failure(log_index)
+
+#オフセット索引に次に書き込む行の位置を記録する(全コンソールログ)
+def log_mark(kind, code, key):
+    log_pipeline.put(('mark', log_index, capture_clock.now(), (kind, code, key)))
+
+#容量上限のために削除したコンソールログ(試験終了時にテストログへ出力)
+def log_retention_report():
+    if log_retention is not None and log_retention.pruned_files:
+        testlog_write(TESTLOG_WRITE, f'[tool]    :{timestamp_get()} 容量上限によりコンソールログを削除 '
+                      f'{log_retention.pruned_files}ファイル({log_retention.pruned_bytes // (1024 * 1024)}MB)')
+
+#サスペンド/レジューム時間(受信時刻から算出)をヒストグラムとサイクルの記録に追加する
+def latency_record(histogram, field, start, stamp):
+    latency = (stamp - start) * 1000
+    histogram.record(latency)
+    cycle_recorder.mark(field, round(latency, 1))
+
+#レジューム時間はACC ON後に成功判定ログを受信した場合のみ(折り返しで先にACC OFFした場合は記録しない)
+def resume_latency_record(accon_time):
+    if resume_success.stamp is not None:
+        latency_record(resume_latency, 'resume_ms', accon_time, resume_success.stamp)
+
+def latency_text(name, histogram):
+    summary = histogram.summary()
+    if not summary['count']:
+        return f'{name} p50/p95/p99/max: -'
+    return f'{name} p50/p95/p99/max: ' + '/'.join(f'{summary[key]:.0f}' for key in ['p50', 'p95', 'p99', 'max']) + 'ms'
+
+#サスペンド/レジューム時間の分布(試験終了時にテストログへ出力)
+def latency_report():
+    for name, histogram in [('サスペンド時間', suspend_latency), ('レジューム時間', resume_latency)]:
+        summary = histogram.summary()
+        if summary['count']:
+            testlog_write(TESTLOG_WRITE, f'[tool]    :{timestamp_get()} {name} {summary["count"]}回 '
+                          f'p50:{summary["p50"]:.0f}ms p95:{summary["p95"]:.0f}ms p99:{summary["p99"]:.0f}ms '
+                          f'最大:{summary["max"]:.0f}ms')
+
+#サイクルの記録開始(ACC OFF前)。TEST_MODE 1/4は使用するトリガーの略称も記録する
+#オフセット索引にサイクルの開始位置を記録する
+def cycle_start():
+    if TEST_MODE == 1:
+        trigger = suspend_trigger_list[suspend_select_trigger][4]
+    elif TEST_MODE == 4:
+        trigger = resume_trigger_list[resume_select_trigger][4]
+    else:
+        trigger = None
+    cycle = cycle_recorder.start(test_mode=TEST_MODE, trigger=trigger, log_index=log_index)
+    log_mark(OFFSET_CYCLE, 0, cycle)
+
+#サイクルの記録を閉じる(索引の登録に失敗した件数はテストログへ出力。cycles.jsonlから再作成できる)
+def cycle_records_close():
+    journal = cycle_recorder.journal
+    if journal is None:
+        return
+    cycle_recorder.finish('aborted', time.time())
+    #試験スレッドが終了待ちの時間内に終わらなかった場合も、以降の記録は書き込まない
+    cycle_recorder.journal = None
+    if journal.index_errors:
+        testlog_write(TESTLOG_WRITE, f'[tool]    :{timestamp_get()} cycles.sqlite 登録失敗{journal.index_errors}件 '
+                      f'(python run_records.py <ログフォルダ> --rebuild で再作成)')
+    journal.close()
+
+#トリガー検知→ACC操作の時間(試験終了時にテストログへ出力)
+def trigger_latency_report():
+    for label, latencies in trigger_latency.items():
+        testlog_write(TESTLOG_WRITE, f'[tool]    :{timestamp_get()} トリガー検知→{label} {len(latencies)}回 '
+                      f'平均{sum(latencies) / len(latencies):.1f}ms 最小{min(latencies):.1f}ms 最大{max(latencies):.1f}ms')
+
 def log_index_chek():
     global log_index
     global log_max_count
@@ -2386,7 +2744,7 @@ def pika_init():
 
 def pika_start():
 
-    consol_log_label('pikapati +B OFF / ACC OFF')
+    consol_log_label('pikapati +B OFF / ACC OFF', MARKER_BATT_OFF)
     for i in range(0,3,1):
         batt_off()
         acc_off()
@@ -2398,7 +2756,7 @@ def pika_start():
 
     time.sleep(2)
     
-    consol_log_label('pikapati +B ON / ACC ON  ')
+    consol_log_label('pikapati +B ON / ACC ON  ', MARKER_BATT_ON)
     for i in range(0,3,1):
         batt_on()
         acc_on()
@@ -2406,353 +2764,265 @@ def pika_start():
 #        vsp_on()
 
 
+#戻り値:1回目のACC OFF操作コードの送信完了時刻(perf_counter)
 def pika_stop(reason=None):
 
     if reason == None:
-        consol_log_label(f'pikapati ACC OFF ')
+        consol_log_label(f'pikapati ACC OFF ', MARKER_ACC_OFF)
     else:
-        consol_log_label(f'pikapati ACC OFF (reason : {reason})')
+        consol_log_label(f'pikapati ACC OFF (reason : {reason})', MARKER_ACC_OFF)
     for i in range(0,3,1):
-        acc_off()
+        sent = acc_off()
+        if i == 0:
+            acc_time = sent
         chg_off()
-    
+    return acc_time
+
 
+#戻り値:1回目のACC ON操作コードの送信完了時刻(perf_counter)
 def pika_restart(reason=None):
 
     if reason == None:
-        consol_log_label(f'pikapati ACC ON ')
+        consol_log_label(f'pikapati ACC ON ', MARKER_ACC_ON)
     else:
-        consol_log_label(f'pikapati ACC ON (reason : {reason})')
+        consol_log_label(f'pikapati ACC ON (reason : {reason})', MARKER_ACC_ON)
     for i in range(0,3,1):
-        acc_on()
+        sent = acc_on()
+        if i == 0:
+            acc_time = sent
         chg_on()
+    return acc_time
+
+#ぴかぱちへの送信
+#SW Controlを送信し、interval秒後に操作コードを送信する(送信完了まで待機)
+#戻り値:操作コードの送信完了時刻(perf_counter、送信後の待ち時間は含まない。ポート未接続で破棄した場合は現在時刻)
+def pika_write(sw_control, code, interval=0.01):
+    history = console_reactor.console('pika').writer.history
+    last = history[-1] if history else None
+    q_pika.put((EV_PIKA_SER_WRITE, [(sw_control, interval), (code, 0.01)]))
+    q_pika.join()
+    if history and history[-1] is not last:
+        sent = history[-1].sent
+    else:
+        sent = capture_clock.now()
+    if log_timeline is not None:
+        log_timeline.add(log_index, sent, 'pika', f'>> {sw_control.decode()} {code.decode()}')
+    return sent
 
 def batt_on():
-    pika_ser = serial.Serial(PIKA_COM_PORT, 38400 , parity=serial.PARITY_NONE)
-
-    # SW Control NORMAL
-    pika_ser.write(b'1')
-    pika_ser.read_all()
-
-    # BATT_ON
-    time.sleep(0.01)
-    pika_ser.write(b'a')
-    pika_ser.read_all()
-
-    pika_ser.close()
-
+    # SW Control NORMAL → BATT_ON
+    pika_write(b'1', b'a')
 
 def batt_off():
-    pika_ser = serial.Serial(PIKA_COM_PORT, 38400 , parity=serial.PARITY_NONE)
-
-    # SW Control NORMAL
-    pika_ser.write(b'1')
-    pika_ser.read_all()
-
-    # BATT_OFF
-    time.sleep(0.01)
-    pika_ser.write(b'b')
-    pika_ser.read_all()
-
-    pika_ser.close()
-
+    # SW Control NORMAL → BATT_OFF
+    pika_write(b'1', b'b')
 
 def acc_on():
-    pika_ser = serial.Serial(PIKA_COM_PORT, 38400 , parity=serial.PARITY_NONE)
-
-    # SW Control NORMAL
-    pika_ser.write(b'1')
-    pika_ser.read_all()
-
-    # ACC_ON
-    time.sleep(0.01)
-    pika_ser.write(b'c')
-    pika_ser.read_all()
-
-    pika_ser.close()
-
+    # SW Control NORMAL → ACC_ON
+    return pika_write(b'1', b'c')
 
 def acc_off():
-    pika_ser = serial.Serial(PIKA_COM_PORT, 38400 , parity=serial.PARITY_NONE)
-
-    # SW Control NORMAL
-    pika_ser.write(b'1')
-    pika_ser.read_all()
-
-    # ACC_OFF
-    time.sleep(0.01)
-    pika_ser.write(b'd')
-    pika_ser.read_all()
-
-    time.sleep(0.01)
-
-    pika_ser.close()
-
+    # SW Control NORMAL → ACC_OFF
+    return pika_write(b'1', b'd')
 
 def chg_on():
-    pika_ser = serial.Serial(PIKA_COM_PORT, 38400 , parity=serial.PARITY_NONE)
-
-    # SW Control NORMAL
-    pika_ser.write(b'1')
-    pika_ser.read_all()
-
-    # ACC_ON
-    time.sleep(0.01)
-    pika_ser.write(b'e')
-    pika_ser.read_all()
+    # SW Control NORMAL → CHG_ON
+    pika_write(b'1', b'e')
 
-    pika_ser.close()
-  
 def chg_off():
-    pika_ser = serial.Serial(PIKA_COM_PORT, 38400 , parity=serial.PARITY_NONE)
-
-    # SW Control NORMAL
-    pika_ser.write(b'1')
-    pika_ser.read_all()
-
-    # ACC_ON
-    time.sleep(0.01)
-    pika_ser.write(b'f')
-    pika_ser.read_all()
-
-    pika_ser.close()
-
+    # SW Control NORMAL → CHG_OFF
+    pika_write(b'1', b'f')
 
 def ill_on():
-    pika_ser = serial.Serial(PIKA_COM_PORT, 38400 , parity=serial.PARITY_NONE)
-
-    # SW Control NORMAL
-    pika_ser.write(b'1')
-    pika_ser.read_all()
-
-    # ACC_ON
-    time.sleep(0.01)
-    pika_ser.write(b'g')
-    pika_ser.read_all()
+    # SW Control NORMAL → ILL_ON
+    pika_write(b'1', b'g')
 
-    pika_ser.close()
-  
 def ill_off():
-    pika_ser = serial.Serial(PIKA_COM_PORT, 38400 , parity=serial.PARITY_NONE)
-
-    # SW Control NORMAL
-    pika_ser.write(b'1')
-    pika_ser.read_all()
-
-    # ACC_ON
-    time.sleep(0.01)
-    pika_ser.write(b'h')
-    pika_ser.read_all()
-
-    pika_ser.close()
-
+    # SW Control NORMAL → ILL_OFF
+    pika_write(b'1', b'h')
 
 def bark_on():
-    pika_ser = serial.Serial(PIKA_COM_PORT, 38400 , parity=serial.PARITY_NONE)
-
-    # SW Control NORMAL
-    pika_ser.write(b'1')
-    pika_ser.read_all()
-
-    # ACC_ON
-    time.sleep(0.01)
-    pika_ser.write(b'i')
-    pika_ser.read_all()
+    # SW Control NORMAL → BARK_ON
+    pika_write(b'1', b'i')
 
-    pika_ser.close()
-  
 def bark_off():
-    pika_ser = serial.Serial(PIKA_COM_PORT, 38400 , parity=serial.PARITY_NONE)
-
-    # SW Control NORMAL
-    pika_ser.write(b'1')
-    pika_ser.read_all()
-
-    # ACC_ON
-    time.sleep(0.01)
-    pika_ser.write(b'j')
-    pika_ser.read_all()
-
-    pika_ser.close()
-
+    # SW Control NORMAL → BARK_OFF
+    pika_write(b'1', b'j')
 
 def park_on():
-    pika_ser = serial.Serial(PIKA_COM_PORT, 38400 , parity=serial.PARITY_NONE)
-
-    # SW Control NORMAL
-    pika_ser.write(b'1')
-    pika_ser.read_all()
-
-    # ACC_ON
-    time.sleep(0.01)
-    pika_ser.write(b'k')
-    pika_ser.read_all()
-
-    pika_ser.close()
+    # SW Control NORMAL → PARK_ON
+    pika_write(b'1', b'k')
 
 def park_off():
-    pika_ser = serial.Serial(PIKA_COM_PORT, 38400 , parity=serial.PARITY_NONE)
-    
-    # SW Control NORMAL
-    pika_ser.write(b'1')
-    pika_ser.read_all()
-    
-    # ACC_ON
-    time.sleep(0.01)
-    pika_ser.write(b'l')
-    pika_ser.read_all()
-    
-    pika_ser.close()
+    # SW Control NORMAL → PARK_OFF
+    pika_write(b'1', b'l')
 
 def vsp_on():
-    pika_ser = serial.Serial(PIKA_COM_PORT, 38400 , parity=serial.PARITY_NONE)
-    
-    # SW Control PULSE_ON
-    pika_ser.write(b'2')
-    pika_ser.read_all()
-    
-    # VSP_ON
-    time.sleep(0.02)
-    pika_ser.write(b'00')
-    pika_ser.read_all()
-    
-    pika_ser.close()
+    # SW Control PULSE_ON → VSP_ON
+    pika_write(b'2', b'00', 0.02)
 
 def vsp_off():
-    pika_ser = serial.Serial(PIKA_COM_PORT, 38400 , parity=serial.PARITY_NONE)
-    
-    # SW Control PULSE_OFF
-    pika_ser.write(b'3')
-    pika_ser.read_all()
-    
-    # VSP_OFF
-    time.sleep(0.02)
-    pika_ser.write(b'00')
-    pika_ser.read_all()
-    
-    pika_ser.close()
+    # SW Control PULSE_OFF → VSP_OFF
+    pika_write(b'3', b'00', 0.02)
 
 
+#adbでビルド番号を取得(前回の値があっても試験開始時に1回取得し直す)
 def build_number_extract():
-    global build_number
-    
-    if build_number == '-':
-        #androidにadb接続の前処理を実行
-        senddata1 = 'su'
-        senddata2 = 'setprop vendor.sys.usb.adb.disabled 0'
-        senddata3 = 'echo "peripheral" > /sys/devices/platform/soc/a600000.ssusb/mode'
-        q_android.put((EV_ANDROID_SER_WRITE, senddata1))
-        q_android.put((EV_ANDROID_SER_WRITE, senddata2))
-        q_android.put((EV_ANDROID_SER_WRITE, senddata3))
-        q_android.join()
-        
-        time.sleep(5)
-        
-        #adbでスクリーンショットを取得
-        cmdlist = ['adb', 'shell', 'getprop', 'ro.build.description']
-        result, resmsg = consol_cmd(cmdlist, 5)
-        if result == RESULT_OK:
-            if 'no devices' not in resmsg:
-                build_number = resmsg
-                print(f'Build Number : {build_number}')
-        
-        #androidにadb接続の解除を実行
-        senddata1 = 'su'
-        senddata2 = 'setprop vendor.sys.usb.adb.disabled 1'
-        senddata3 = 'echo "normal" > /sys/devices/platform/soc/a600000.ssusb/mode'
-        q_android.put((EV_ANDROID_SER_WRITE, senddata1))
-        q_android.put((EV_ANDROID_SER_WRITE, senddata2))
-        q_android.put((EV_ANDROID_SER_WRITE, senddata3))
-        q_android.join()
+    
+    #androidにadb接続の前処理を実行
+    senddata1 = 'su'
+    senddata2 = 'setprop vendor.sys.usb.adb.disabled 0'
+    senddata3 = 'echo "peripheral" > /sys/devices/platform/soc/a600000.ssusb/mode'
+    q_android.put((EV_ANDROID_SER_WRITE, senddata1))
+    q_android.put((EV_ANDROID_SER_WRITE, senddata2))
+    q_android.put((EV_ANDROID_SER_WRITE, senddata3))
+    q_android.join()
+    
+    time.sleep(5)
+    
+    #adbでビルド番号を取得
+    cmdlist = ['adb', 'shell', 'getprop', 'ro.build.description']
+    result, resmsg = consol_cmd(cmdlist, 5)
+    if result == RESULT_OK:
+        if 'no devices' not in resmsg:
+            env_info.set({'build_number': resmsg})
+            env_info.save(os.path.join(logfpath, ENV_INFO_FILE))
+            print(f'Build Number : {resmsg}')
+    
+    #androidにadb接続の解除を実行
+    senddata1 = 'su'
+    senddata2 = 'setprop vendor.sys.usb.adb.disabled 1'
+    senddata3 = 'echo "normal" > /sys/devices/platform/soc/a600000.ssusb/mode'
+    q_android.put((EV_ANDROID_SER_WRITE, senddata1))
+    q_android.put((EV_ANDROID_SER_WRITE, senddata2))
+    q_android.put((EV_ANDROID_SER_WRITE, senddata3))
+    q_android.join()
 
 
+#起動ログからの試験環境情報の取得(監視スレッド。対象ログを含む行でのみ呼ばれ、取得できたら以降は呼ばれない)
 def system_ucom_extract(string_data):
-    global system_ucom
     
-    if system_ucom == '-':
-        #etc)I:2:BTM:Sys:**.**.****
-        target = 'I:2:BTM:Sys:'
-        if target in string_data:
-            idx = string_data.find(target)
-            system_ucom = string_data[idx+len(target):]
-            print(f'System uCOM : {system_ucom}')
+    #etc)I:2:BTM:Sys:**.**.****
+    target = 'I:2:BTM:Sys:'
+    idx = string_data.find(target)
+    system_ucom = string_data[idx+len(target):]
+    print(f'System uCOM : {system_ucom}')
+    return {'system_ucom': system_ucom}
 
 def sail_img_id_extract(string_data):
-    global sail_img_id
     
-    if sail_img_id == '-':
-        #etc)SAIL image id: SAIL.SI.1.0.r3-00007-AU.LEMANS-1.100974.2
-        target = 'SAIL image id: '
-        if target in string_data:
-            idx = string_data.find(target)
-            sail_img_id = string_data[idx+len(target):]
-            print(f'SAIL Image ID : {sail_img_id}')
+    #etc)SAIL image id: SAIL.SI.1.0.r3-00007-AU.LEMANS-1.100974.2
+    target = 'SAIL image id: '
+    idx = string_data.find(target)
+    sail_img_id = string_data[idx+len(target):]
+    print(f'SAIL Image ID : {sail_img_id}')
+    return {'sail_img_id': sail_img_id}
 
 def fcp_extract(string_data):
-    global fcp
     
-    if fcp == '-':
-        #etc)I:2:FCP:R:VC=0x334d414130.00
-        target = 'I:2:FCP:R:VC=0x'
-        if target in string_data:
-            idx = string_data.find(target)
-            hex_string = string_data[idx+len(target):-3]
-            fcp = bytes.fromhex(hex_string).decode('ascii')
-            print(f'FCP : {fcp}')
+    #etc)I:2:FCP:R:VC=0x334d414130.00
+    target = 'I:2:FCP:R:VC=0x'
+    idx = string_data.find(target)
+    hex_string = string_data[idx+len(target):-3]
+    fcp = bytes.fromhex(hex_string).decode('ascii')
+    print(f'FCP : {fcp}')
+    return {'fcp': fcp}
 
 def hwvari_extract(string_data):
-    global hw_vari
-    global wk_ev
-    
-    if hw_vari == '-' or wk_ev == '-':
-    
-        wklist_da = [
-            ['0WK','01'],
-            ['1WK','02'],
-            ['2WK','03'],
-            ['3WK','04'],
-            ['4WK','05'],
-            ['5WK','06'],
-            ['PP1','10'],
-            ['PP2','11'],
-            ['PP3','12'],
-            ['PP4','13'],
-            ['PP5','14'],
-            ['AP' ,'20'],
-            ['MP' ,'30']
-        ]
-        
-        #etc)I:2:FCP:R:HV=A8,0x02,0x04
-        target = 'I:2:FCP:R:HV='
-        length = len(target)
-        if target in string_data:
-            idx = string_data.find(target)
-            idx2 = string_data.find(',')
-            idx3 = string_data.rfind(',')
-            hw_vari = string_data[idx+length:idx2]
-            wk_index = string_data[idx3+3:idx3+5]
-            for i in range(len(wklist_da)):
-                if wklist_da[i][1] == wk_index:
-                    wk_ev = wklist_da[i][0]
-            print(f'HWバリ : {hw_vari}')
-            print(f'WK_index : {wk_index}')
-            print(f'WK : {wk_ev}')
-
-def send_message(url, msg):
-    # POSTリクエストを送信
-    response = requests.post(
-        url=url,
-        data=json.dumps(msg),
-        headers={"Content-Type": "application/json"}
+    
+    wklist_da = [
+        ['0WK','01'],
+        ['1WK','02'],
+        ['2WK','03'],
+        ['3WK','04'],
+        ['4WK','05'],
+        ['5WK','06'],
+        ['PP1','10'],
+        ['PP2','11'],
+        ['PP3','12'],
+        ['PP4','13'],
+        ['PP5','14'],
+        ['AP' ,'20'],
+        ['MP' ,'30']
+    ]
+    
+    #etc)I:2:FCP:R:HV=A8,0x02,0x04
+    target = 'I:2:FCP:R:HV='
+    length = len(target)
+    idx = string_data.find(target)
+    idx2 = string_data.find(',')
+    idx3 = string_data.rfind(',')
+    hw_vari = string_data[idx+length:idx2]
+    wk_index = string_data[idx3+3:idx3+5]
+    result = {'hw_vari': hw_vari}
+    for i in range(len(wklist_da)):
+        if wklist_da[i][1] == wk_index:
+            result['wk_ev'] = wklist_da[i][0]
+    print(f'HWバリ : {hw_vari}')
+    print(f'WK_index : {wk_index}')
+    #対応するWKが無い場合は抽出済みの値を残す
+    print(f"WK : {result.get('wk_ev', '-')}")
+    return result
+
+#Teams通知の回数欄(通知した時点の値)
+def teams_counts_text():
+    return (
+            f"* サスペンド回数 : {suspend_count} / レジューム回数 : {resume_count} \n"
+            f"* サスペンドエラー回数 : {supend_error_count} \n"
+            f"* レジュームエラー回数 : {resume_error_count} \n"
+            f"* 連続成功回数 : {consecutive_success_count} \n"
+            f"* 最大連続成功回数 : {consecutive_success_max_count}"
     )
-    return response
 
-def susres_test_info(into_url=None,into_title=None,into_info='-'):
-    
-    if into_url == None:
-        url = TEAMS_URL
+#Teams通知の本文
+#短時間に続いた通知は1件にまとめる(通知種別を列挙し、回数は最新の値)
+def teams_message(events):
+    latest = events[-1]
+    if len(events) == 1:
+        info = latest['info']
+    else:
+        info = ', '.join(f"{event['info']}({event['time']})" for event in events)
+    text = (
+             "試験環境\n"
+            f"* SoC : {env_info.get('build_number')}\n"
+            f"* System_uCom : {env_info.get('system_ucom')}\n"
+            f"* SAIL : {env_info.get('sail_img_id')}\n"
+            f"* FCP : {env_info.get('fcp')}\n"
+            f"* HWバリ : {env_info.get('hw_vari')}\n"
+            f"* WK : {env_info.get('wk_ev')}\n"
+            "\n"
+            "試験状況\n"
+            f"* 通知種別：{info} \n"
+            + latest['counts']
+    )
+    return adaptive_card(latest['title'], text)
+
+def teams_result(status, message):
+    if status == 'sent':
+        print("メッセージを送信しました")
+    elif status == 'spooled':
+        print(f"メッセージを送信できませんでした(接続できた時点で再送します : {TEAMS_SPOOL_FILE})")
+    elif status == 'rejected':
+        print("メッセージの送信が拒否されました")
     else:
-        url = into_url
+        print("再送待ちのメッセージが上限を超えたため、古いものを破棄しました")
+
+#Teams通知の送信開始(送信は専用スレッドで行い、試験シーケンスは待たない)
+def teams_notifier_start():
+    global teams_notifier
+
+    if TEAMS_ENABLE == 1:
+        teams_notifier = TeamsNotifier(TEAMS_URL, teams_message, spool_path=TEAMS_SPOOL_FILE, coalesce=TEAMS_COALESCE_SEC,
+                                       connect_timeout=TEAMS_CONNECT_TIMEOUT, read_timeout=TEAMS_READ_TIMEOUT,
+                                       on_result=teams_result)
+        teams_notifier.start()
+
+#未送信の通知を送信して終了(送信できなかったものはTEAMS_SPOOL_FILEに残し、次回の試験で送信する)
+def teams_notifier_stop():
+    if teams_notifier is not None:
+        teams_notifier.stop(timeout=TEAMS_CONNECT_TIMEOUT + TEAMS_READ_TIMEOUT)
+
+def susres_test_info(into_url=None,into_title=None,into_info='-'):
     
     if into_title == None:
         title = TEAMS_TITLE
@@ -2760,65 +3030,26 @@ def susres_test_info(into_url=None,into_title=None,into_info='-'):
         title = into_title
     
     if TEAMS_ENABLE == 1:
-        text = (
-    #             "試験環境\n"
-    #            f"* SoC : {build_number}\n"
-    #            f"* System_uCom : {system_ucom}\n"
-    #            f"* SAIL : {sail_img_id}\n"
-    #            f"* FCP : {fcp}\n"
-    #            f"* HWバリ : {hw_vari}\n"
-    #            f"* WK : {wk_ev}\n"
-    #            "\n"
-                "試験状況\n"
-                f"* 通知種別：{into_info} \n"
-                f"* サスペンド回数 : {suspend_count} / レジューム回数 : {resume_count} \n"
-                f"* サスペンドエラー回数 : {supend_error_count} \n"
-                f"* レジュームエラー回数 : {resume_error_count} \n"
-                f"* 連続成功回数 : {consecutive_success_count} \n"
-                f"* 最大連続成功回数 : {consecutive_success_max_count}"
-        )
-        #################################
-        
-        message = {
-          "attachments": [
-            {
-              "contentType": "application/vnd.microsoft.card.adaptive",
-              "content": 
-              {
-                "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-                "type": "AdaptiveCard",
-                "version": "1.2",
-                "body": [
-                  {
-                      "type": "TextBlock",
-                      "text": title,
-                      "id": "Title",
-                      "spacing": "Medium",
-                      "horizontalAlignment": "Center",
-                      "size": "ExtraLarge",
-                      "weight": "Bolder",
-                      "color": "Accent"
-                  },
-                  {
-                    "type": "TextBlock",
-                    "text": text,
-                    "wrap": True,
-                    "markdown": True
-                  }
-                ]
-              }
-            }
-          ]
-        }
-        response = send_message(url, message)
-
+        event = {'title': title, 'info': into_info, 'time': datetime.datetime.now().strftime('%H:%M:%S'),
+                 'counts': teams_counts_text()}
+        if into_url == None:
+            if teams_notifier is not None:
+                teams_notifier.notify(event)
+            return
+
+        #設定画面のテスト送信は結果を表示するためその場で送信する
+        try:
+            status = post_json(into_url, teams_message([event]), TEAMS_CONNECT_TIMEOUT, TEAMS_READ_TIMEOUT)
+        except (OSError, http.client.HTTPException) as e:
+            print(f"エラーが発生しました: {e}")
+            return
         # レスポンスを確認
-        if response.status_code == 200:
+        if status == 200:
             print("メッセージを送信しました")
-        elif response.status_code == 202:
+        elif status == 202:
             print("メッセージの送信を受け付けました")
         else:
-            print(f"エラーが発生しました: {response.status_code}, {response.text}")
+            print(f"エラーが発生しました: {status}")
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Per-cycle records of a suspend/resume run.
+
+Every cycle is one JSON object appended to `<logdir>/cycles.jsonl` (the
+journal, append-only, the source of truth) and inserted into
+`<logdir>/cycles.sqlite` (WAL mode) for queries across 10k+ cycles:
+
+    SELECT result, COUNT(*) FROM cycles GROUP BY result;
+    SELECT trigger, AVG(resume_log - acc_on) FROM cycles WHERE result = 'ok' GROUP BY trigger;
+
+Times are wall-clock epoch seconds. The index can be rebuilt from the
+journal at any time:
+
+    python run_records.py LOGDIR --rebuild
+    python run_records.py LOGDIR            (summary per result / trigger)
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from typing import Dict, List, Optional
+
+JOURNAL_NAME = "cycles.jsonl"
+INDEX_NAME = "cycles.sqlite"
+
+# record keys that get their own column; the whole record is also kept as JSON
+COLUMNS = [
+    ("cycle", "INTEGER"),
+    ("test_mode", "INTEGER"),
+    ("trigger", "TEXT"),
+    ("result", "TEXT"),
+    ("log_index", "INTEGER"),
+    ("acc_off", "REAL"),
+    ("suspend_log", "REAL"),
+    ("acc_on", "REAL"),
+    ("resume_log", "REAL"),
+    ("end", "REAL"),
+    ("suspend_ms", "REAL"),
+    ("resume_ms", "REAL"),
+    ("failsafe_count", "INTEGER"),
+]
+
+
+# =============================================================================
+# Journal + index
+# =============================================================================
+class CycleJournal:
+    """
+    Appends cycle records to the JSONL journal and the SQLite index.
+
+    The journal line is written and flushed first; if the index insert
+    fails the record is still safe in the journal, the error is counted in
+    `index_errors` and rebuild_index() can recreate the index later.
+    """
+
+    def __init__(self, directory: str):
+        self.journal_path = os.path.join(directory, JOURNAL_NAME)
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        self.index_errors = 0
+        self._lock = threading.Lock()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._db: Optional[sqlite3.Connection] = None
+        try:
+            self._db = open_index(self.index_path)
+        except sqlite3.Error:
+            self.index_errors += 1
+
+    def append(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False, sort_keys=True)
+        with self._lock:
+            if self._journal.closed:
+                return    # a cycle finished after the run was closed
+            self._journal.write(line + "\n")
+            self._journal.flush()
+            if self._db is None:
+                return
+            try:
+                insert(self._db, record, line)
+                self._db.commit()
+            except sqlite3.Error:
+                self.index_errors += 1
+
+    def close(self):
+        with self._lock:
+            self._journal.close()
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def open_index(path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    columns = ", ".join(f'"{name}" {kind}' for name, kind in COLUMNS)
+    db.execute(f"CREATE TABLE IF NOT EXISTS cycles ({columns}, record TEXT)")
+    db.execute("CREATE INDEX IF NOT EXISTS cycles_result ON cycles(result)")
+    db.execute("CREATE INDEX IF NOT EXISTS cycles_trigger ON cycles(trigger)")
+    db.commit()
+    return db
+
+
+def insert(db: sqlite3.Connection, record: Dict, line: str):
+    names = ", ".join(f'"{name}"' for name, _ in COLUMNS)
+    marks = ", ".join("?" for _ in COLUMNS)
+    db.execute(f"INSERT INTO cycles ({names}, record) VALUES ({marks}, ?)",
+               [record.get(name) for name, _ in COLUMNS] + [line])
+
+
+def rebuild_index(directory: str) -> int:
+    """Recreate cycles.sqlite from cycles.jsonl; returns the number of records (torn lines are skipped)."""
+    index_path = os.path.join(directory, INDEX_NAME)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(index_path + suffix):
+            os.remove(index_path + suffix)
+    db = open_index(index_path)
+    count = 0
+    with open(os.path.join(directory, JOURNAL_NAME), encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            insert(db, record, line.rstrip("\n"))
+            count += 1
+    db.commit()
+    db.close()
+    return count
+
+
+# =============================================================================
+# Cycle under construction
+# =============================================================================
+class CycleRecorder:
+    """
+    Builds the record of the running cycle. The test sequence calls
+    start(), mark() and finish(); add() may be called from the monitor
+    thread (failsafe hits...) and is ignored between cycles.
+    """
+
+    def __init__(self, journal: Optional[CycleJournal]):
+        self.journal = journal
+        self.cycles = 0
+        self._record: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self._record is not None
+
+    def start(self, **fields) -> int:
+        """Begin the next cycle (an unfinished one is written first as 'aborted')."""
+        if self._record is not None:
+            self.finish("aborted")
+        self.cycles += 1
+        with self._lock:
+            self._record = {"cycle": self.cycles, "failsafe": [], **fields}
+        return self.cycles
+
+    def mark(self, name: str, value: object):
+        """Set a field of the running cycle; only the first mark of a name counts."""
+        with self._lock:
+            if self._record is not None:
+                self._record.setdefault(name, value)
+
+    def add(self, key: str, item: object):
+        with self._lock:
+            if self._record is not None:
+                self._record.setdefault(key, []).append(item)
+
+    def finish(self, result: str, when: Optional[float] = None, **fields) -> Optional[Dict]:
+        with self._lock:
+            record, self._record = self._record, None
+        if record is None:
+            return None
+        record.update(fields)
+        record["result"] = result
+        if when is not None:
+            record["end"] = when
+        record["failsafe_count"] = len(record["failsafe"])
+        if self.journal is not None:
+            self.journal.append(record)
+        return record
+
+
+# =============================================================================
+# Latency histogram
+# =============================================================================
+class LatencyHistogram:
+    """
+    HDR-style streaming histogram of latencies in ms.
+
+    Values are kept in log-linear buckets: exact below 2**bits ms, then
+    2**(bits-1) buckets per power of two, so a percentile is within
+    1/2**(bits-1) of the recorded value (< 1 % with the default 8 bits)
+    whatever the number of cycles. Memory grows with the range of values,
+    not with the count. Safe to record from one thread while another reads.
+    """
+
+    def __init__(self, bits: int = 8):
+        self._bits = bits
+        self._half = 1 << (bits - 1)
+        self._counts: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.total = 0.0
+
+    def _index(self, ms: int) -> int:
+        shift = max(ms.bit_length() - self._bits, 0)
+        return shift * self._half + (ms >> shift)
+
+    def _highest(self, index: int) -> int:
+        """Highest value that falls into bucket `index`."""
+        if index < 2 * self._half:
+            return index
+        shift = index // self._half - 1
+        return ((index - shift * self._half + 1) << shift) - 1
+
+    def record(self, ms: float):
+        ms = max(ms, 0.0)
+        index = self._index(int(round(ms)))
+        with self._lock:
+            self._counts[index] = self._counts.get(index, 0) + 1
+            self.count += 1
+            self.total += ms
+            self.min = ms if self.min is None else min(self.min, ms)
+            self.max = ms if self.max is None else max(self.max, ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Smallest bucket value that covers `p` % of the recorded values (capped at max)."""
+        with self._lock:
+            if not self.count:
+                return None
+            target = max(1, -(-self.count * p // 100))
+            seen = 0
+            for index in sorted(self._counts):
+                seen += self._counts[index]
+                if seen >= target:
+                    return min(float(self._highest(index)), self.max)
+            return self.max
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """count, p50, p95, p99 and max."""
+        return {"count": self.count, "p50": self.percentile(50), "p95": self.percentile(95),
+                "p99": self.percentile(99), "max": self.max}
+
+
+# =============================================================================
+# Summary
+# =============================================================================
+def summary(directory: str) -> List[tuple]:
+    """(result, trigger, cycles) from the index."""
+    db = sqlite3.connect(os.path.join(directory, INDEX_NAME))
+    try:
+        return db.execute("SELECT result, trigger, COUNT(*) FROM cycles GROUP BY result, trigger "
+                          "ORDER BY result, trigger").fetchall()
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query or rebuild the per-cycle records of a run")
+    parser.add_argument("logdir")
+    parser.add_argument("--rebuild", action="store_true", help="recreate cycles.sqlite from cycles.jsonl")
+    args = parser.parse_args(argv)
+
+    if args.rebuild:
+        print(f"{rebuild_index(args.logdir)} records indexed")
+    for result, trigger, count in summary(args.logdir):
+        print(f"{result or '-':<24}{trigger or '-':<32}{count:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
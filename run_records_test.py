@@ -0,0 +1,90 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import run_records as mod
+
+
+class TestCycleRecorder(unittest.TestCase):
+
+    def test_records_go_to_journal_and_index(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = mod.CycleJournal(tmp)
+            rec = mod.CycleRecorder(journal)
+            rec.add("failsafe", {"rule": "ignored between cycles"})
+            self.assertEqual(rec.start(test_mode=1, trigger="DSEn", log_index=0, acc_off=100.0), 1)
+            rec.mark("suspend_log", 101.5)
+            rec.mark("suspend_log", 109.0)
+            rec.add("failsafe", {"rule": "failsafe_5"})
+            rec.mark("acc_on", 101.6)
+            rec.finish("ok", 110.0)
+            rec.start(test_mode=1, trigger="SspFin", log_index=0, acc_off=120.0)
+            rec.start(test_mode=1, trigger="DSEn", log_index=1, acc_off=200.0)
+            rec.finish("resume_timeout", 380.0)
+            self.assertIsNone(rec.finish("aborted"))
+            journal.close()
+
+            with open(os.path.join(tmp, mod.JOURNAL_NAME), encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+            self.assertEqual([r["result"] for r in records], ["ok", "aborted", "resume_timeout"])
+            self.assertEqual(records[0]["suspend_log"], 101.5)
+            self.assertEqual(records[0]["failsafe_count"], 1)
+            self.assertEqual(records[2]["cycle"], 3)
+
+            db = sqlite3.connect(os.path.join(tmp, mod.INDEX_NAME))
+            self.assertEqual(db.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            rows = db.execute("SELECT cycle, trigger, result, failsafe_count FROM cycles ORDER BY cycle").fetchall()
+            db.close()
+            self.assertEqual(rows, [(1, "DSEn", "ok", 1), (2, "SspFin", "aborted", 0), (3, "DSEn", "resume_timeout", 0)])
+            self.assertEqual(mod.summary(tmp)[0], ("aborted", "SspFin", 1))
+
+    def test_cycle_finished_after_close_is_not_written(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = mod.CycleJournal(tmp)
+            rec = mod.CycleRecorder(journal)
+            rec.start(test_mode=0)
+            journal.close()
+            self.assertEqual(rec.finish("aborted")["result"], "aborted")
+            with open(os.path.join(tmp, mod.JOURNAL_NAME), encoding="utf-8") as f:
+                self.assertEqual(f.read(), "")
+
+    def test_rebuild_index_skips_torn_line(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = mod.CycleJournal(tmp)
+            journal.append({"cycle": 1, "result": "ok"})
+            journal.append({"cycle": 2, "result": "suspend_timeout"})
+            journal.close()
+            with open(os.path.join(tmp, mod.JOURNAL_NAME), "a", encoding="utf-8") as f:
+                f.write('{"cycle": 3, "res')
+            self.assertEqual(mod.rebuild_index(tmp), 2)
+            self.assertEqual(mod.summary(tmp), [("ok", None, 1), ("suspend_timeout", None, 1)])
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_percentiles_within_bucket_precision(self):
+        h = mod.LatencyHistogram()
+        self.assertIsNone(h.percentile(50))
+        for ms in range(1, 10001):
+            h.record(ms)
+        summary = h.summary()
+        self.assertEqual(summary["count"], 10000)
+        self.assertEqual(summary["max"], 10000)
+        for p in (50, 95, 99):
+            self.assertAlmostEqual(summary[f"p{p}"], p * 100, delta=p * 100 / 128)
+        self.assertEqual(h.percentile(100), 10000)
+
+    def test_small_values_are_exact(self):
+        h = mod.LatencyHistogram()
+        for ms in (3.2, 7, 7, 250):
+            h.record(ms)
+        self.assertEqual(h.percentile(50), 7)
+        self.assertEqual(h.percentile(25), 3)
+        self.assertEqual(h.percentile(99), 250)
+        self.assertEqual(h.min, 3.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+Serial ingest benchmark on pseudo-terminal pairs (POSIX only).
+
+Every simulated console is an os.openpty() pair: a generator thread writes
+numbered, time-stamped lines into the master side at a fixed line rate and
+the reader under test opens the slave side like a COM port. Readers:
+  - reactor : console_reactor.ConsoleReactor, as used by miffy.py
+              (optionally through LogPipeline + ConsoleLogs with --pipeline)
+  - worker  : bluetoothonoff.SerialWorker, one reader thread per console
+
+Per console it reports sustained lines/sec, line latency percentiles
+(generator write -> line handed over by the reader), dropped lines and the
+reader CPU spent per second of run time.
+
+    python serial_bench.py --target reactor --consoles 4 --rate 2000 --lengths 40:3,120:1,400 --duration 10
+
+A line the generator cannot write because the pty buffer is full (the reader
+fell behind) is counted as dropped, like a UART FIFO overrun would be.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tty
+from typing import Dict, List, Optional, Tuple
+
+# =============================================================================
+# Line generation
+# =============================================================================
+def parse_lengths(spec: str) -> List[Tuple[int, int]]:
+    """'80' or '40:3,120:1,400' -> [(length, weight), ...] (weight defaults to 1)."""
+    result = []
+    for part in spec.split(","):
+        length, _, weight = part.strip().partition(":")
+        result.append((int(length), int(weight) if weight else 1))
+    return result
+
+
+class LineSource:
+    """
+    Writes `rate` lines/sec into a pty master, each line
+    "<seq:08d> <perf_counter send time> <padding>\\n" with a length drawn from `lengths`.
+    """
+
+    def __init__(self, master_fd: int, rate: float, lengths: List[Tuple[int, int]], seed: int = 0):
+        self.fd = master_fd
+        self.rate = rate
+        self.sizes = [length for length, _ in lengths]
+        self.weights = [weight for _, weight in lengths]
+        self.random = random.Random(seed)
+        self.sent = 0
+        self.overrun = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        os.set_blocking(self.fd, False)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    def _line(self, seq: int) -> bytes:
+        size = self.random.choices(self.sizes, self.weights)[0]
+        head = f"{seq:08d} {time.perf_counter():17.6f} "
+        return (head + "x" * max(0, size - len(head))).encode("ascii") + b"\n"
+
+    def _run(self):
+        start = time.perf_counter()
+        pending = b""
+        while not self._stop_event.wait(0.001):
+            due = int((time.perf_counter() - start) * self.rate)
+            while self.sent < due:
+                line = self._line(self.sent)
+                self.sent += 1
+                if pending:
+                    self.overrun += 1  # FIFO still full from last time
+                    continue
+                try:
+                    written = os.write(self.fd, line)
+                except BlockingIOError:
+                    self.overrun += 1
+                    continue
+                pending = line[written:]
+            if pending:
+                try:
+                    pending = pending[os.write(self.fd, pending):]
+                except BlockingIOError:
+                    pass
+
+
+# =============================================================================
+# Measurement
+# =============================================================================
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    k = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+class Recorder:
+    """Collects (sequence, latency) for every line a reader delivers."""
+
+    def __init__(self):
+        self.seen = set()
+        self.latencies: List[float] = []
+        self.bad = 0
+        self._lock = threading.Lock()
+
+    def line(self, text: str, arrival: float):
+        try:
+            seq = int(text[:8])
+            sent = float(text[9:26])
+        except ValueError:
+            self.bad += 1
+            return
+        with self._lock:
+            self.seen.add(seq)
+            self.latencies.append(arrival - sent)
+
+    def report(self, source: LineSource, elapsed: float, cpu: Optional[float], cpu_elapsed: float) -> Dict[str, float]:
+        lat = sorted(self.latencies)
+        return {
+            "sent": source.sent,
+            "received": len(self.seen),
+            "dropped": source.sent - len(self.seen),
+            "overrun": source.overrun,
+            "corrupt": self.bad,
+            "lines_per_sec": len(self.seen) / elapsed,
+            "p50_ms": percentile(lat, 50) * 1000,
+            "p90_ms": percentile(lat, 90) * 1000,
+            "p99_ms": percentile(lat, 99) * 1000,
+            "max_ms": (lat[-1] if lat else float("nan")) * 1000,
+            "cpu_ms_per_sec": cpu * 1000 / cpu_elapsed if cpu is not None else float("nan"),
+        }
+
+
+def thread_cpu(native_ids: List[int]) -> Optional[float]:
+    """CPU seconds used so far by the given threads (Linux /proc), None elsewhere."""
+    ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+    total = 0
+    for tid in native_ids:
+        try:
+            with open(f"/proc/self/task/{tid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+        total += int(fields[11]) + int(fields[12])  # utime + stime
+    return total / ticks
+
+
+def new_threads(before: set) -> List[int]:
+    return [t.native_id for t in threading.enumerate() if t.ident not in before and t.native_id]
+
+
+# =============================================================================
+# Readers under test
+# =============================================================================
+def open_ptys(count: int) -> List[Tuple[int, str]]:
+    pairs = []
+    for _ in range(count):
+        master, slave = os.openpty()
+        tty.setraw(master)
+        tty.setraw(slave)
+        pairs.append((master, os.ttyname(slave)))
+    return pairs
+
+
+def bench_reactor(ptys, recorders, workdir: str, pipeline: bool):
+    """Start ConsoleReactor on the ptys; returns (stop function, reader thread native ids)."""
+    from console_reactor import ConsoleReactor
+    from console_io import ConsoleLogs, LogPipeline
+
+    before = {t.ident for t in threading.enumerate()}
+    reactor = ConsoleReactor()
+    names = [f"con{i}" for i in range(len(ptys))]
+    logs = pipe = None
+    if pipeline:
+        logs = ConsoleLogs(workdir, names)
+        pipe = LogPipeline()
+        pipe.add_stage("persist", lambda item: logs.write(item[0], 0, item[2] + "\n"))
+        pipe.add_stage("monitor", lambda item: recorders[item[0]].line(item[2], time.perf_counter()))
+        logs.start()
+        pipe.start()
+
+    for name, (_, path) in zip(names, ptys):
+        if pipe is not None:
+            on_line = lambda n, line, mono: pipe.put((n, mono, line))
+        else:
+            on_line = lambda n, line, mono: recorders[n].line(line, mono)
+        reactor.add_console(name, path, 115200, on_line=on_line)
+    reactor.start()
+    tids = new_threads(before)
+
+    def stop():
+        reactor.stop()
+        if pipe is not None:
+            pipe.stop()
+            logs.close()
+
+    return stop, tids
+
+
+class _StampedBuffer(list):
+    """Stands in for SerialWorker._buffer so every delivered line gets its arrival time."""
+
+    def __init__(self, recorder: Recorder):
+        super().__init__()
+        self.recorder = recorder
+
+    def extend(self, lines):
+        now = time.perf_counter()
+        for line in lines:
+            self.recorder.line(line, now)
+
+
+def bench_worker(ptys, recorders, workdir: str, pipeline: bool):
+    """Start one bluetoothonoff.SerialWorker per pty."""
+    cwd = os.getcwd()
+    os.chdir(workdir)  # bluetoothonoff creates its log folder relative to the cwd on import
+    try:
+        import bluetoothonoff
+    finally:
+        os.chdir(cwd)
+
+    before = {t.ident for t in threading.enumerate()}
+    workers = []
+    for i, (_, path) in enumerate(ptys):
+        worker = bluetoothonoff.SerialWorker(f"con{i}", path)
+        worker.log_filename = os.path.join(workdir, f"con{i}.txt")
+        worker._buffer = _StampedBuffer(recorders[f"con{i}"])
+        worker.start()
+        workers.append(worker)
+    tids = new_threads(before)
+
+    def stop():
+        for worker in workers:
+            worker.stop()
+
+    return stop, tids
+
+
+TARGETS = {"reactor": bench_reactor, "worker": bench_worker}
+
+
+# =============================================================================
+# Runner
+# =============================================================================
+def run(target: str, consoles: int, rate: float, lengths: str, duration: float, pipeline: bool = False, seed: int = 0):
+    ptys = open_ptys(consoles)
+    recorders = {f"con{i}": Recorder() for i in range(consoles)}
+    with tempfile.TemporaryDirectory() as workdir:
+        stop, tids = TARGETS[target](ptys, recorders, workdir, pipeline)
+        cpu0 = thread_cpu(tids)
+        sources = [LineSource(master, rate, parse_lengths(lengths), seed + i) for i, (master, _) in enumerate(ptys)]
+        t0 = time.perf_counter()
+        for source in sources:
+            source.start()
+        time.sleep(duration)
+        for source in sources:
+            source.stop()
+        elapsed = time.perf_counter() - t0
+        time.sleep(0.5)  # let the readers drain what is already in the ptys
+        cpu_elapsed = time.perf_counter() - t0
+        cpu1 = thread_cpu(tids)
+        stop()
+    for master, _ in ptys:
+        os.close(master)
+
+    cpu = None if cpu0 is None or cpu1 is None else (cpu1 - cpu0) / consoles
+    return {name: rec.report(src, elapsed, cpu, cpu_elapsed) for (name, rec), src in zip(recorders.items(), sources)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serial ingest benchmark on pty pairs")
+    parser.add_argument("--target", choices=sorted(TARGETS), default="reactor")
+    parser.add_argument("--consoles", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=1000, help="lines/sec per console")
+    parser.add_argument("--lengths", default="80", help="line lengths with optional weights, e.g. 40:3,120:1,400")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--pipeline", action="store_true", help="reactor: go through LogPipeline + ConsoleLogs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    if os.name != "posix":
+        print("serial_bench needs os.openpty() (POSIX)")
+        return 2
+
+    results = run(args.target, args.consoles, args.rate, args.lengths, args.duration, args.pipeline, args.seed)
+    print(f"{'console':<8}{'sent':>9}{'recv':>9}{'drop':>7}{'lines/s':>10}"
+          f"{'p50ms':>8}{'p90ms':>8}{'p99ms':>8}{'maxms':>8}{'cpu ms/s':>10}")
+    for name, r in results.items():
+        print(f"{name:<8}{r['sent']:>9}{r['received']:>9}{r['dropped']:>7}{r['lines_per_sec']:>10.0f}"
+              f"{r['p50_ms']:>8.2f}{r['p90_ms']:>8.2f}{r['p99_ms']:>8.2f}{r['max_ms']:>8.2f}{r['cpu_ms_per_sec']:>10.1f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
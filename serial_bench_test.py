@@ -0,0 +1,34 @@
+import unittest
+
+import serial_bench as mod
+
+
+class TestSerialBench(unittest.TestCase):
+
+    def test_parse_lengths(self):
+        self.assertEqual(mod.parse_lengths("80"), [(80, 1)])
+        self.assertEqual(mod.parse_lengths("40:3, 120:1,400"), [(40, 3), (120, 1), (400, 1)])
+
+    def test_percentile(self):
+        values = [i / 100 for i in range(101)]
+        self.assertEqual(mod.percentile(values, 50), 0.5)
+        self.assertEqual(mod.percentile(values, 99), 0.99)
+        self.assertEqual(mod.percentile([0.1], 90), 0.1)
+
+    def test_recorder_counts_missing_and_corrupt_lines(self):
+        rec = mod.Recorder()
+        rec.line("00000000        10.000000 xxxx", 10.002)
+        rec.line("00000002        10.001000 xxxx", 10.004)
+        rec.line("garbage", 10.005)
+
+        class Source:
+            sent = 3
+            overrun = 1
+
+        report = rec.report(Source, elapsed=1.0, cpu=None, cpu_elapsed=1.0)
+        self.assertEqual((report["received"], report["dropped"], report["corrupt"]), (2, 1, 1))
+        self.assertAlmostEqual(report["max_ms"], 3.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
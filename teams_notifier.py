@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Teams webhook notifications sent from a background thread.
+
+notify() only queues the event, so the test sequence never waits on the
+network. The sender thread
+
+  * coalesces events that arrive within `coalesce` seconds of the first
+    into one message (build_message() gets the whole burst),
+  * posts with separate connect / read timeouts,
+  * retries connection errors, timeouts, 429 and 5xx with Backoff,
+  * spools messages it could not deliver to a JSONL file and sends them,
+    oldest first, once the webhook answers again (also after a restart).
+
+Delivery is at-least-once: a post whose response timed out may have
+reached the channel and is sent again.
+
+    notifier = TeamsNotifier(url, build_message, spool_path='teams_spool.jsonl')
+    notifier.start()
+    notifier.notify(event)
+    notifier.stop(timeout=10)
+"""
+from __future__ import annotations
+
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+import urllib.parse
+import urllib.request
+from typing import Any, Callable, Dict, List, Optional
+
+from console_io import Backoff
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+_WAKE = object()
+
+
+def adaptive_card(title: str, text: str) -> Dict:
+    """Webhook body with one Adaptive Card (title + markdown text)."""
+    return {
+        "attachments": [
+            {
+                "contentType": "application/vnd.microsoft.card.adaptive",
+                "content": {
+                    "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+                    "type": "AdaptiveCard",
+                    "version": "1.2",
+                    "body": [
+                        {"type": "TextBlock", "text": title, "id": "Title", "spacing": "Medium",
+                         "horizontalAlignment": "Center", "size": "ExtraLarge", "weight": "Bolder", "color": "Accent"},
+                        {"type": "TextBlock", "text": text, "wrap": True, "markdown": True},
+                    ],
+                },
+            }
+        ]
+    }
+
+
+def post_json(url: str, message: Dict, connect_timeout: float, read_timeout: float) -> int:
+    """
+    POST `message` as JSON and return the HTTP status. Honours the
+    https_proxy / http_proxy / no_proxy environment like urllib does.
+    Raises OSError / http.client.HTTPException on network errors.
+    """
+    parts = urllib.parse.urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    proxy = urllib.request.getproxies().get(parts.scheme)
+    if proxy and not urllib.request.proxy_bypass(parts.hostname or ""):
+        proxy_parts = urllib.parse.urlsplit(proxy)
+        connection = connection_class(proxy_parts.hostname, proxy_parts.port, timeout=connect_timeout)
+        connection.set_tunnel(parts.hostname, parts.port)
+    else:
+        connection = connection_class(parts.hostname, parts.port, timeout=connect_timeout)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    try:
+        connection.connect()
+        connection.sock.settimeout(read_timeout)
+        connection.request("POST", path, json.dumps(message).encode("utf-8"),
+                           {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+class TeamsNotifier:
+    """
+    Background sender for webhook messages. See the module docstring.
+
+    build_message(events) turns a burst of events (in notify() order) into
+    the webhook body. `on_result(status, message)` is called from the
+    sender thread after each attempt sequence: 'sent', 'spooled',
+    'rejected' (4xx other than 429, not retried) or 'dropped' (spool full).
+    """
+
+    def __init__(self, url: str, build_message: Callable[[List[Any]], Dict],
+                 spool_path: Optional[str] = None, coalesce: float = 5.0,
+                 connect_timeout: float = 5.0, read_timeout: float = 10.0,
+                 retries: int = 3, backoff: Optional[Backoff] = None,
+                 spool_retry: float = 60.0, spool_max: int = 500, queue_max: int = 1000,
+                 on_result: Optional[Callable[[str, Dict], None]] = None):
+        self.url = url
+        self.build_message = build_message
+        self.spool_path = spool_path
+        self.coalesce = coalesce
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff or Backoff(first=1.0, maximum=30.0)
+        self.spool_retry = spool_retry
+        self.spool_max = spool_max
+        self.on_result = on_result
+        self.sent = 0
+        self.spooled = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(queue_max)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._next_spool_retry = 0.0
+
+    # -- caller side -------------------------------------------------------------
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="teams-notifier", daemon=True)
+        self._thread.start()
+
+    def notify(self, event: Any) -> bool:
+        """Queue `event`; never blocks. False if the queue is full (event dropped)."""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def stop(self, timeout: Optional[float] = None):
+        """Send what is queued (no coalescing wait), spool what cannot be sent, and end the thread."""
+        self._stop.set()
+        try:
+            self._queue.put_nowait(_WAKE)
+        except queue.Full:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # -- sender thread -------------------------------------------------------------
+    def _run(self):
+        self._send_spool()
+        while True:
+            batch = self._collect()
+            if batch:
+                message = self.build_message(batch)
+                if self._spool_pending():
+                    # older messages go first
+                    self._spool_append(message)
+                    if self._stop.is_set() or time.monotonic() >= self._next_spool_retry:
+                        self._send_spool()
+                else:
+                    self._send(message)
+            elif self._stop.is_set():
+                break
+            elif time.monotonic() >= self._next_spool_retry:
+                self._send_spool()
+
+    def _collect(self) -> List[Any]:
+        """First queued event (waiting up to 1 s), plus everything that arrives within `coalesce`."""
+        try:
+            event = self._queue.get(timeout=0 if self._stop.is_set() else 1.0)
+        except queue.Empty:
+            return []
+        if event is _WAKE:
+            return []
+        batch = [event]
+        deadline = time.monotonic() + self.coalesce
+        while True:
+            remaining = 0 if self._stop.is_set() else deadline - time.monotonic()
+            try:
+                event = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return batch
+            if event is not _WAKE:
+                batch.append(event)
+
+    def _deliver(self, message: Dict) -> Optional[bool]:
+        """True: sent, False: retry later, None: rejected by the webhook."""
+        self.backoff.reset()
+        attempts = 1 if self._stop.is_set() else self.retries
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(self.backoff.next())
+            try:
+                status = post_json(self.url, message, self.connect_timeout, self.read_timeout)
+            except (OSError, http.client.HTTPException):
+                continue
+            if 200 <= status < 300:
+                return True
+            if status not in RETRY_STATUS:
+                return None
+        return False
+
+    def _send(self, message: Dict):
+        result = self._deliver(message)
+        if result:
+            self.sent += 1
+            self._report("sent", message)
+        elif result is None:
+            self._report("rejected", message)
+        else:
+            self._next_spool_retry = time.monotonic() + self.spool_retry
+            self._spool_append(message)
+
+    def _send_spool(self):
+        """Deliver spooled messages oldest first; stop at the first one that still fails."""
+        spooled = self._spool_read()
+        if not spooled:
+            return
+        for i, message in enumerate(spooled):
+            result = self._deliver(message)
+            if result is False:
+                self._next_spool_retry = time.monotonic() + self.spool_retry
+                self._spool_write(spooled[i:])
+                return
+            self.sent += bool(result)
+            self._report("sent" if result else "rejected", message)
+        self._spool_write([])
+
+    def _report(self, status: str, message: Dict):
+        if self.on_result is not None:
+            self.on_result(status, message)
+
+    # -- spool ---------------------------------------------------------------------
+    def _spool_pending(self) -> bool:
+        return self.spool_path is not None and os.path.exists(self.spool_path)
+
+    def _spool_read(self) -> List[Dict]:
+        if self.spool_path is None or not os.path.exists(self.spool_path):
+            return []
+        messages = []
+        with open(self.spool_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    messages.append(json.loads(line))
+                except ValueError:
+                    continue
+        return messages
+
+    def _spool_write(self, messages: List[Dict]):
+        if self.spool_path is None:
+            return
+        if not messages:
+            if os.path.exists(self.spool_path):
+                os.remove(self.spool_path)
+            return
+        tmp = self.spool_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for message in messages:
+                f.write(json.dumps(message, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.spool_path)
+
+    def _spool_append(self, message: Dict):
+        if self.spool_path is None:
+            self.dropped += 1
+            self._report("dropped", message)
+            return
+        messages = self._spool_read() + [message]
+        for old in messages[:-self.spool_max]:
+            self.dropped += 1
+            self._report("dropped", old)
+        self._spool_write(messages[-self.spool_max:])
+        self.spooled += 1
+        self._report("spooled", message)
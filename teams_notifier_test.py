@@ -0,0 +1,130 @@
+import http.server
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import teams_notifier as mod
+from console_io import Backoff
+
+
+class Webhook:
+    """Local stand-in for the Teams webhook: answers with `statuses` in turn (then 200), after `delay` seconds."""
+
+    def __init__(self, statuses=(), delay=0.0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.bodies = []
+        webhook = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                time.sleep(webhook.delay)
+                status = webhook.statuses.pop(0) if webhook.statuses else 200
+                if status == 200:
+                    webhook.bodies.append(json.loads(body))
+                try:
+                    self.send_response(status)
+                    self.end_headers()
+                except OSError:
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/webhook"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def build(events):
+    return {"events": events}
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class TestTeamsNotifier(unittest.TestCase):
+
+    def notifier(self, url, **kw):
+        kw.setdefault("coalesce", 0.05)
+        kw.setdefault("backoff", Backoff(first=0.01, maximum=0.02))
+        n = mod.TeamsNotifier(url, build, connect_timeout=1.0, read_timeout=kw.pop("read_timeout", 1.0), **kw)
+        n.start()
+        self.addCleanup(n.stop, 2.0)
+        return n
+
+    def test_notify_does_not_wait_for_slow_webhook_and_coalesces(self):
+        webhook = Webhook(delay=0.3)
+        self.addCleanup(webhook.close)
+        n = self.notifier(webhook.url)
+        started = time.monotonic()
+        for i in range(3):
+            self.assertTrue(n.notify(i))
+        self.assertLess(time.monotonic() - started, 0.05)
+        self.assertTrue(wait_for(lambda: n.sent == 1))
+        self.assertEqual(webhook.bodies, [{"events": [0, 1, 2]}])
+
+    def test_retries_server_errors(self):
+        webhook = Webhook(statuses=[500, 503])
+        self.addCleanup(webhook.close)
+        n = self.notifier(webhook.url)
+        n.notify("error")
+        self.assertTrue(wait_for(lambda: n.sent == 1))
+        self.assertEqual(webhook.bodies, [{"events": ["error"]}])
+
+    def test_rejected_message_is_not_retried(self):
+        webhook = Webhook(statuses=[400])
+        self.addCleanup(webhook.close)
+        results = []
+        n = self.notifier(webhook.url, on_result=lambda status, message: results.append(status))
+        n.notify("bad")
+        self.assertTrue(wait_for(lambda: results == ["rejected"]))
+        self.assertEqual(webhook.bodies, [])
+
+    def test_read_timeout_spools_and_sends_when_back(self):
+        webhook = Webhook(delay=0.5)
+        self.addCleanup(webhook.close)
+        with tempfile.TemporaryDirectory() as tmp:
+            spool = os.path.join(tmp, "spool.jsonl")
+            n = self.notifier(webhook.url, spool_path=spool, retries=1, read_timeout=0.1, spool_retry=0.2)
+            n.notify("first")
+            self.assertTrue(wait_for(lambda: n.spooled == 1))
+            webhook.delay = 0.0
+            n.notify("second")
+            self.assertTrue(wait_for(lambda: n.sent == 2))
+            self.assertFalse(os.path.exists(spool))
+        # the timed-out post may still have reached the webhook: delivery is at-least-once
+        self.assertEqual(webhook.bodies[-2:], [{"events": ["first"]}, {"events": ["second"]}])
+
+    def test_spool_survives_restart(self):
+        webhook = Webhook()
+        webhook.close()
+        with tempfile.TemporaryDirectory() as tmp:
+            spool = os.path.join(tmp, "spool.jsonl")
+            offline = self.notifier(webhook.url, spool_path=spool, retries=2)
+            offline.notify("offline")
+            offline.stop(2.0)
+            self.assertEqual(offline.spooled, 1)
+
+            webhook = Webhook()
+            self.addCleanup(webhook.close)
+            online = self.notifier(webhook.url, spool_path=spool)
+            self.assertTrue(wait_for(lambda: online.sent == 1))
+            self.assertEqual(webhook.bodies, [{"events": ["offline"]}])
+
+
+if __name__ == "__main__":
+    unittest.main()